@@ -1,16 +1,18 @@
-import json
 from flask import Flask
 
+from . import serialization
+
 def create_app():
     app = Flask(__name__)
+    serialization.init_app(app)
 
     # Load faqs.json into memory at startup
-    with open('faqs.json', 'r', encoding='utf-8') as f:
-        app.config['FAQS_DATA'] = json.load(f)
+    app.config['FAQS_DATA'] = serialization.load_file('faqs.json')
+
+    from . import assets
+    assets.init_app(app)
 
     from .routes import bp as routes_bp
     app.register_blueprint(routes_bp)
 
     return app
-
-from app import routes, models
\ No newline at end of file
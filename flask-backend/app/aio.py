@@ -0,0 +1,148 @@
+import asyncio
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError as e:
+    raise ImportError('the ASGI front end needs asgiref and uvicorn: pip install -r requirements-asgi.txt') from e
+
+from . import ratelimit, routes, serialization
+
+MAX_BODY = 1024 * 1024
+INVALID_JSON = {'status': 'error', 'message': 'Invalid JSON'}
+TOO_LARGE = {'status': 'error', 'message': 'Request body too large'}
+
+
+# The request body is over MAX_BODY bytes
+class BodyTooLarge(Exception):
+    pass
+
+
+# ASGI front end for the Flask app. /ask, /feedback and /scrape/status are
+# served natively on the event loop, with encoding pushed to a bounded
+# thread pool and slow I/O (log writes, FAQ reloads) to a separate one, so a
+# single process can hold many slow clients. Every other path is passed
+# through to the regular Flask views.
+class AsyncApp:
+    def __init__(self, flask_app, encode_workers=None, io_workers=None, max_pending=None):
+        encode_workers = encode_workers or int(os.environ.get('ENCODE_WORKERS', min(4, os.cpu_count() or 1)))
+        io_workers = io_workers or int(os.environ.get('IO_WORKERS', '8'))
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.encode_pool = ThreadPoolExecutor(encode_workers, thread_name_prefix='encode')
+        self.io_pool = ThreadPoolExecutor(io_workers, thread_name_prefix='io')
+        # Requests waiting for an encode slot beyond this apply backpressure
+        self.max_pending = max_pending or encode_workers * 4
+        self._encode_slots = None
+        self.routes = {
+            ('POST', '/ask'): self.ask,
+            ('POST', '/feedback'): self.feedback,
+            ('GET', '/scrape/status'): self.scrape_status,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http':
+            handler = self.routes.get((scope['method'], scope['path']))
+            if handler is not None:
+                return await handler(scope, receive, send)
+        return await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.encode_pool.shutdown(wait=False)
+                self.io_pool.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def run_encode(self, fn, *args):
+        if self._encode_slots is None:
+            self._encode_slots = asyncio.Semaphore(self.max_pending)
+        async with self._encode_slots:
+            return await asyncio.get_running_loop().run_in_executor(self.encode_pool, fn, *args)
+
+    async def run_io(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.io_pool, fn, *args)
+
+    async def ask(self, scope, receive, send):
+        if routes.rate_limiter:
+            allowed, retry_after = routes.rate_limiter.allow(client_key(scope))
+            if not allowed:
+                return await send_json(send, routes.RATE_LIMITED, 429, retry_after=math.ceil(retry_after))
+        try:
+            data = await read_json(receive)
+        except BodyTooLarge:
+            return await send_json(send, TOO_LARGE, 413)
+        if data is None:
+            return await send_json(send, INVALID_JSON, 400)
+        if routes.kb_check_due():
+            # Picks up FAQs other workers wrote (the Flask views do it before every request)
+            await self.run_io(routes.reload_if_changed)
+        question = data.get('question', '')
+        category = data.get('category') or None
+        if category and not routes.dense_index.has_category(category):
+            return await send_json(send, {'status': 'error', 'message': 'Unknown category'}, 400)
+        # Every encode slot is queued up: answer lexically rather than wait
+        degrade = self._encode_slots is not None and self._encode_slots.locked()
+        # Logging doesn't hold up the response
+        defer = self.io_pool.submit
+        if degrade or routes.fast_answer(question, category):
+            # Confident lexical matches are cheap enough to answer on the loop
+            body, status = routes.answer_question(question, category, degrade, defer)
+        else:
+            body, status = await self.run_encode(routes.answer_question, question, category, False, defer)
+        await send_json(send, body, status, retry_after=1 if status == 503 else None)
+
+    async def feedback(self, scope, receive, send):
+        try:
+            data = await read_json(receive)
+        except BodyTooLarge:
+            return await send_json(send, TOO_LARGE, 413)
+        if data is None:
+            return await send_json(send, INVALID_JSON, 400)
+        body, status, retry_after = await self.run_io(routes.record_feedback, data, client_key(scope))
+        await send_json(send, body, status, retry_after=retry_after)
+
+    async def scrape_status(self, scope, receive, send):
+        await send_json(send, routes.scrape_status(), 200)
+
+
+def client_key(scope):
+    headers = dict(scope.get('headers', []))
+    forwarded = headers.get(b'x-forwarded-for', b'').decode('latin-1') or None
+    return ratelimit.client_key((scope.get('client') or ('',))[0], forwarded)
+
+
+# The request body as a dict, or None if it isn't a JSON object
+async def read_json(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if len(body) > MAX_BODY:
+            raise BodyTooLarge()
+        if not message.get('more_body'):
+            break
+    try:
+        data = serialization.loads(bytes(body))
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+# `payload` is a dict, or JSON already rendered as bytes
+async def send_json(send, payload, status, retry_after=None):
+    body = (payload if isinstance(payload, bytes) else serialization.dumps(payload)) + b'\n'
+    headers = [(b'content-type', b'application/json'),
+               (b'content-length', str(len(body)).encode('ascii'))]
+    if retry_after is not None:
+        headers.append((b'retry-after', str(retry_after).encode('ascii')))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
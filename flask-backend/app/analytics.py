@@ -0,0 +1,351 @@
+import argparse
+import collections
+import datetime
+import fcntl
+import logging
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from . import serialization
+from .feedback import FEEDBACK_PATH
+from .query_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# Values of the "feedback" field that count as a thumbs-down
+NEGATIVE_FEEDBACK = {'down', 'thumbs_down', 'thumbsdown', 'bad', 'no', 'unhelpful', 'negative', '-1', '0', 'false', '👎'}
+# "2025-06-26T10:58:11.459615 - [source] question"; older lines have no [source]
+_QUESTION_LINE = re.compile(r'^(\S+) - (?:\[([\w-]+)\] )?(.*)$')
+_MAX_KEYS = 20000
+
+
+# Reads the lines appended to a log since the last call. Only complete lines
+# are consumed; a log that shrank (rotated or truncated) is read from the start.
+class LogTail:
+    def __init__(self, path, offset=0):
+        self.path = path
+        self.offset = offset
+
+    def read_lines(self, max_bytes=16 * 1024 * 1024):
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return []
+        if size < self.offset:
+            self.offset = 0
+        if size == self.offset:
+            return []
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(max_bytes)
+        end = data.rfind(b'\n') + 1
+        self.offset += end
+        return data[:end].decode('utf-8', errors='replace').splitlines()
+
+
+# Incremental leader clustering over unit vectors. A vector joins the nearest
+# cluster when the cosine similarity reaches `threshold`, otherwise it starts
+# a new one; at `max_clusters` it joins the nearest regardless. Each batch is
+# scored against all centroids in one matrix product.
+class OnlineClusterer:
+    def __init__(self, threshold=0.75, max_clusters=500, max_examples=10):
+        self.threshold = threshold
+        self.max_clusters = max_clusters
+        self.max_examples = max_examples
+        self.sums = None
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.examples = []
+
+    def __len__(self):
+        return len(self.counts)
+
+    def centroids(self):
+        if self.sums is None:
+            return None
+        return self.sums / np.maximum(np.linalg.norm(self.sums, axis=1, keepdims=True), 1e-12)
+
+    def _new_cluster(self, vector):
+        self.sums = vector[None, :].copy() if self.sums is None else np.vstack([self.sums, vector])
+        self.counts = np.append(self.counts, 0)
+        self.examples.append({})
+        return len(self.counts) - 1
+
+    def _note(self, cluster, text):
+        examples = self.examples[cluster]
+        examples[text] = examples.get(text, 0) + 1
+        if len(examples) > self.max_examples * 2:
+            kept = sorted(examples.items(), key=lambda item: -item[1])[:self.max_examples]
+            self.examples[cluster] = dict(kept)
+
+    # Returns the cluster id of each vector
+    def add(self, vectors, texts):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        if self.sums is not None and self.sums.shape[1] != vectors.shape[1]:
+            # The encoder changed; clusters from the old model can't be compared
+            self.__init__(self.threshold, self.max_clusters, self.max_examples)
+        labels = np.full(len(texts), -1, dtype=np.int64)
+        if self.sums is not None:
+            similarities = vectors @ self.centroids().T
+            best = similarities.argmax(axis=1)
+            joined = similarities[np.arange(len(texts)), best] >= self.threshold
+            labels[joined] = best[joined]
+            np.add.at(self.sums, labels[joined], vectors[joined])
+            np.add.at(self.counts, labels[joined], 1)
+        # Vectors that matched no existing cluster are clustered one by one
+        for i in np.flatnonzero(labels < 0):
+            if self.sums is not None:
+                similarities = self.centroids() @ vectors[i]
+                nearest = int(similarities.argmax())
+                if similarities[nearest] >= self.threshold or len(self) >= self.max_clusters:
+                    labels[i] = nearest
+                    self.sums[nearest] += vectors[i]
+                    self.counts[nearest] += 1
+                    continue
+            labels[i] = self._new_cluster(vectors[i])
+            self.counts[labels[i]] += 1
+        for i, label in enumerate(labels):
+            self._note(int(label), texts[i])
+        return labels
+
+    def top(self, n=20):
+        order = np.argsort(-self.counts, kind='stable')[:n]
+        return [{'cluster': int(c), 'count': int(self.counts[c]),
+                 'label': max(self.examples[c].items(), key=lambda item: item[1])[0],
+                 'examples': [text for text, _ in sorted(self.examples[c].items(), key=lambda item: -item[1])[:5]]}
+                for c in order]
+
+    def state(self):
+        return {'threshold': self.threshold, 'max_clusters': self.max_clusters,
+                'counts': self.counts.tolist(), 'examples': self.examples}
+
+    def save(self, path):
+        np.save(path, self.sums if self.sums is not None else np.zeros((0, 0), dtype=np.float32))
+
+    @classmethod
+    def restore(cls, state, path):
+        clusterer = cls(state['threshold'], state['max_clusters'])
+        clusterer.counts = np.array(state['counts'], dtype=np.int64)
+        clusterer.examples = state['examples']
+        if len(clusterer.counts):
+            clusterer.sums = np.load(path).astype(np.float32)
+        return clusterer
+
+
+def _prune(counter):
+    if len(counter) > _MAX_KEYS:
+        for key, _ in counter.most_common()[_MAX_KEYS // 2:]:
+            del counter[key]
+
+
+# Rolling aggregates over question_log.txt and feedback_log.txt. refresh()
+# consumes only what was appended since the last run, updates the
+# aggregates, and writes the dashboard tables to one small JSON file; the
+# admin page just reads that file, so it costs the same however long the
+# logs get. State lives in `directory` and survives restarts.
+class Analytics:
+    def __init__(self, directory, question_log, feedback_log, encode=None, faqs=None, top_n=20):
+        self.directory = directory
+        self.encode = encode
+        self.faqs = faqs or (lambda: [])
+        self.top_n = top_n
+        os.makedirs(directory, exist_ok=True)
+        self.state_path = os.path.join(directory, 'state.json')
+        self.centroids_path = os.path.join(directory, 'clusters.npy')
+        self.dashboard_path = os.path.join(directory, 'dashboard.json')
+        self._dashboard = (None, None)
+        self.questions = LogTail(question_log)
+        self.feedback = LogTail(feedback_log)
+        self._load_state()
+
+    def _load_state(self):
+        try:
+            state = serialization.load_file(self.state_path)
+        except (OSError, ValueError):
+            state = {}
+        self.questions.offset = state.get('question_offset', 0)
+        self.feedback.offset = state.get('feedback_offset', 0)
+        self.totals = collections.Counter(state.get('totals', {}))
+        self.sources = collections.Counter(state.get('sources', {}))
+        self.unanswered = collections.Counter(state.get('unanswered', {}))
+        self.examples = state.get('examples', {})
+        self.by_hour = state.get('by_hour', [0] * 24)
+        self.by_day = collections.Counter(state.get('by_day', {}))
+        self.votes = {key: collections.Counter(value) for key, value in state.get('votes', {}).items()}
+        if state.get('clusters'):
+            self.clusters = OnlineClusterer.restore(state['clusters'], self.centroids_path)
+        else:
+            self.clusters = OnlineClusterer()
+
+    def _write(self, path, obj):
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(serialization.dumps(obj))
+        os.replace(tmp, path)
+
+    def _save_state(self):
+        if self.encode is not None and len(self.clusters):
+            self.clusters.save(self.centroids_path)
+        self._write(self.state_path, {
+            'question_offset': self.questions.offset,
+            'feedback_offset': self.feedback.offset,
+            'totals': self.totals, 'sources': self.sources,
+            'unanswered': self.unanswered, 'examples': self.examples,
+            'by_hour': self.by_hour, 'by_day': self.by_day,
+            'votes': self.votes,
+            'clusters': self.clusters.state() if len(self.clusters) else None,
+        })
+
+    def _ingest_questions(self, lines):
+        texts = []
+        for line in lines:
+            match = _QUESTION_LINE.match(line)
+            if not match:
+                continue
+            stamp, source, question = match.groups()
+            question = question.strip()
+            self.totals['questions'] += 1
+            self.sources[source or 'unknown'] += 1
+            try:
+                when = datetime.datetime.fromisoformat(stamp)
+                self.by_hour[when.hour] += 1
+                self.by_day[when.date().isoformat()] += 1
+            except ValueError:
+                pass
+            key = normalize_query(question)
+            if source == 'none' and key:
+                self.unanswered[key] += 1
+                self.examples.setdefault(key, question)
+            if key:
+                texts.append(key)
+        _prune(self.unanswered)
+        self.examples = {key: self.examples[key] for key in self.unanswered}
+        if self.encode is not None and texts:
+            for start in range(0, len(texts), 256):
+                batch = texts[start:start + 256]
+                self.clusters.add(self.encode(batch), batch)
+
+    def _ingest_feedback(self, lines):
+        answers = {faq.get('answer'): faq.get('question') for faq in self.faqs()}
+        for line in lines:
+            try:
+                record = serialization.loads(line)
+            except ValueError:
+                continue
+            self.totals['feedback'] += 1
+            question = answers.get(record.get('answer')) or record.get('question') or ''
+            vote = 'down' if str(record.get('feedback', '')).strip().lower() in NEGATIVE_FEEDBACK else 'up'
+            self.votes.setdefault(question, collections.Counter())[vote] += 1
+
+    def tables(self):
+        rated = [(question, votes['down'], votes['up'] + votes['down']) for question, votes in self.votes.items()]
+        rated.sort(key=lambda item: (-item[1] / item[2], -item[2]))
+        days = sorted(self.by_day)[-14:]
+        return {
+            'generated': datetime.datetime.now().isoformat(timespec='seconds'),
+            'totals': dict(self.totals),
+            'sources': dict(self.sources.most_common()),
+            'unanswered': [{'question': self.examples.get(key, key), 'count': count}
+                           for key, count in self.unanswered.most_common(self.top_n)],
+            'clusters': self.clusters.top(self.top_n),
+            'thumbs_down': [{'question': question, 'down': down, 'total': total, 'rate': round(down / total, 3)}
+                            for question, down, total in rated[:self.top_n] if down],
+            'by_hour': list(self.by_hour),
+            'by_day': [{'day': day, 'count': self.by_day[day]} for day in days],
+        }
+
+    # Consume new log lines and rewrite the dashboard. Runs under an
+    # exclusive file lock so only one worker does the work at a time.
+    def refresh(self):
+        with open(os.path.join(self.directory, 'refresh.lock'), 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return False
+            # Another worker may have moved the offsets since we loaded them
+            self._load_state()
+            question_lines = self.questions.read_lines()
+            feedback_lines = self.feedback.read_lines()
+            if not question_lines and not feedback_lines and os.path.exists(self.dashboard_path):
+                return True
+            self._ingest_questions(question_lines)
+            self._ingest_feedback(feedback_lines)
+            self._save_state()
+            self._write(self.dashboard_path, self.tables())
+            return True
+
+    # The precomputed tables, re-read only when the file changes
+    def dashboard(self):
+        try:
+            mtime = os.stat(self.dashboard_path).st_mtime_ns
+        except OSError:
+            return None
+        if self._dashboard[0] != mtime:
+            self._dashboard = (mtime, serialization.load_file(self.dashboard_path))
+        return self._dashboard[1]
+
+# Runs each job every `interval` seconds on a daemon thread. A job that
+# raises is logged and doesn't stop the others; status(name) has its run and
+# failure counts and last error, for the admin endpoints.
+class Refresher:
+    def __init__(self, interval, jobs):
+        self.interval = interval
+        self.jobs = jobs
+        self._status = {name: {'runs': 0, 'failures': 0, 'last_error': None, 'last_error_at': None}
+                        for name in jobs}
+        self.thread = threading.Thread(target=self._loop, name='analytics', daemon=True)
+
+    def run_once(self):
+        for name, job in self.jobs.items():
+            status = self._status[name]
+            status['runs'] += 1
+            try:
+                job()
+            except Exception as e:
+                status['failures'] += 1
+                status['last_error'] = f'{type(e).__name__}: {e}'
+                status['last_error_at'] = datetime.datetime.now().isoformat(timespec='seconds')
+                logger.exception('refresh job %r failed', name)
+
+    def _loop(self):
+        while True:
+            self.run_once()
+            time.sleep(self.interval)
+
+    def status(self, name):
+        return dict(self._status[name])
+
+
+# Start a Refresher over the keyword `jobs` ({name: callable})
+def start_refresher(interval, **jobs):
+    refresher = Refresher(interval, jobs)
+    refresher.thread.start()
+    return refresher
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Update the admin analytics tables from the logs')
+    parser.add_argument('--dir', default=os.environ.get('ANALYTICS_DIR', 'analytics'))
+    parser.add_argument('--questions', default='question_log.txt')
+    parser.add_argument('--feedback', default=FEEDBACK_PATH)
+    parser.add_argument('--no-clusters', action='store_true', help='skip embedding the questions')
+    args = parser.parse_args()
+    encode = None
+    if not args.no_clusters:
+        from .encoders import load_encoder
+        encode = load_encoder(os.environ.get('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')).encode
+    faqs_path = os.path.join(os.path.dirname(__file__), '..', 'faqs.json')
+    analytics = Analytics(args.dir, args.questions, args.feedback, encode, lambda: serialization.load_file(faqs_path))
+    start = time.perf_counter()
+    if not analytics.refresh():
+        raise SystemExit('another process is refreshing the analytics')
+    tables = analytics.dashboard()
+    print(f'{tables["totals"]} in {time.perf_counter() - start:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
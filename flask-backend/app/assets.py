@@ -0,0 +1,130 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from flask import current_app, request, render_template, url_for
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Static files that get a content hash in their URL and precompressed variants
+HASHED_EXTENSIONS = ('.css', '.js')
+HASHED_NAME = re.compile(r'^(?P<stem>.+)\.(?P<digest>[0-9a-f]{12})(?P<ext>\.[A-Za-z0-9]+)$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+class Asset:
+    def __init__(self, body, mimetype, mtime=None):
+        self.mimetype = mimetype
+        self.mtime = mtime
+        self.digest = hashlib.sha256(body).hexdigest()[:12]
+        self.variants = precompress(body)
+
+
+# Helper: gzip (and brotli, when installed) encodings of a response body
+def precompress(body):
+    variants = {'identity': body}
+    variants['gzip'] = gzip.compress(body, compresslevel=9, mtime=0)
+    if brotli is not None:
+        variants['br'] = brotli.compress(body, quality=11)
+    return variants
+
+
+def pick_encoding(variants):
+    accepted = request.accept_encodings
+    for encoding in ('br', 'gzip'):
+        if encoding in variants and accepted[encoding]:
+            return encoding
+    return 'identity'
+
+
+# Build a conditional, precompressed response from precompress() output
+def precompressed_response(variants, digest, mimetype, cache_control):
+    encoding = pick_encoding(variants)
+    response = current_app.response_class(variants[encoding], mimetype=mimetype)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = cache_control
+    response.set_etag(f'{digest}-{encoding}')
+    return response.make_conditional(request)
+
+
+def hashed_filename(filename, digest):
+    stem, ext = os.path.splitext(filename)
+    return f'{stem}.{digest}{ext}'
+
+
+def load_asset(path):
+    with open(path, 'rb') as f:
+        body = f.read()
+    mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    return Asset(body, mimetype, os.path.getmtime(path))
+
+
+def build_manifest(static_folder):
+    manifest = {}
+    for root, _, files in os.walk(static_folder):
+        for name in files:
+            if not name.endswith(HASHED_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            filename = os.path.relpath(path, static_folder).replace(os.sep, '/')
+            manifest[filename] = load_asset(path)
+    return manifest
+
+
+def get_asset(filename):
+    manifest = current_app.extensions['assets']
+    asset = manifest.get(filename)
+    # In debug mode pick up edits without a restart
+    if asset is not None and current_app.debug:
+        path = os.path.join(current_app.static_folder, filename)
+        if os.path.getmtime(path) != asset.mtime:
+            asset = manifest[filename] = load_asset(path)
+    return asset
+
+
+# Jinja helper: URL of the content-hashed copy of a static file
+def asset_url(filename):
+    asset = get_asset(filename)
+    if asset is None:
+        return url_for('static', filename=filename)
+    return url_for('static', filename=hashed_filename(filename, asset.digest))
+
+
+# Replacement for Flask's static view: serves hashed, precompressed assets
+def serve_static(filename):
+    match = HASHED_NAME.match(filename)
+    if match:
+        original = match.group('stem') + match.group('ext')
+        asset = get_asset(original)
+        if asset is not None and asset.digest == match.group('digest'):
+            return precompressed_response(asset.variants, asset.digest, asset.mimetype, IMMUTABLE)
+    asset = get_asset(filename)
+    if asset is not None:
+        return precompressed_response(asset.variants, asset.digest, asset.mimetype, 'no-cache')
+    return current_app.send_static_file(filename)
+
+
+# The public chat page does not depend on the request, so render it once
+_page_cache = {}
+
+def cached_page(template_name, max_age=300):
+    entry = _page_cache.get(template_name)
+    if entry is None or current_app.debug:
+        body = render_template(template_name).encode('utf-8')
+        entry = (precompress(body), hashlib.sha256(body).hexdigest()[:12])
+        _page_cache[template_name] = entry
+    variants, digest = entry
+    return precompressed_response(variants, digest, 'text/html', f'public, max-age={max_age}')
+
+
+def init_app(app):
+    app.extensions['assets'] = build_manifest(app.static_folder)
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.view_functions['static'] = serve_static
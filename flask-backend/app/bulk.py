@@ -0,0 +1,120 @@
+import csv
+import io
+
+import numpy as np
+
+from . import serialization, snapshot
+
+FIELDS = ('question', 'answer', 'category')
+FORMATS = ('csv', 'jsonl', 'json')
+MAX_ERRORS = 100
+
+
+class BadImport(ValueError):
+    pass
+
+
+def detect_format(filename=None, requested=None):
+    fmt = (requested or '').lower() or (filename or '').rsplit('.', 1)[-1].lower()
+    if fmt == 'ndjson':
+        fmt = 'jsonl'
+    if fmt not in FORMATS:
+        raise BadImport(f'Unknown format {fmt!r}; use one of {", ".join(FORMATS)}')
+    return fmt
+
+
+# (line number, row dict or None if unparseable) for each row of a binary
+# stream, read incrementally. JSON arrays are the one format parsed whole.
+def iter_rows(stream, fmt):
+    if fmt == 'json':
+        records = serialization.loads(stream.read())
+        if not isinstance(records, list):
+            raise BadImport('Expected a JSON array of FAQs')
+        yield from enumerate(records, 1)
+        return
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        if not reader.fieldnames or not {'question', 'answer'} <= {f.strip().lower() for f in reader.fieldnames}:
+            raise BadImport('CSV needs a header row with question and answer columns')
+        for row in reader:
+            yield reader.line_num, {(k or '').strip().lower(): v for k, v in row.items()}
+        return
+    for number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, serialization.loads(line)
+        except ValueError:
+            yield number, None
+
+
+# One pass over the rows: clean them, drop invalid ones and any question
+# already in `existing` (lower-cased) or seen earlier in the file. Returns
+# (records, report); report lists at most MAX_ERRORS problems.
+def validate(rows, existing, max_rows, max_length=5000):
+    seen = set(existing)
+    records = []
+    report = {'rows': 0, 'invalid': 0, 'duplicates': 0, 'errors': []}
+
+    def reject(number, message, key='invalid'):
+        report[key] += 1
+        if len(report['errors']) < MAX_ERRORS:
+            report['errors'].append({'line': number, 'message': message})
+
+    for number, row in rows:
+        report['rows'] += 1
+        if report['rows'] > max_rows:
+            raise BadImport(f'Too many rows; the limit is {max_rows}')
+        if not isinstance(row, dict):
+            reject(number, 'Not a valid row')
+            continue
+        record = {field: str(row.get(field) or '').strip() for field in FIELDS}
+        if not record['question'] or not record['answer']:
+            reject(number, 'Question and answer required')
+            continue
+        if len(record['question']) > max_length or len(record['answer']) > max_length:
+            reject(number, f'Longer than {max_length} characters')
+            continue
+        key = record['question'].lower()
+        if key in seen:
+            reject(number, 'Duplicate question', 'duplicates')
+            continue
+        seen.add(key)
+        records.append(record)
+    report['accepted'] = len(records)
+    return records, report
+
+
+# Normalized embeddings for `texts`, encoded `batch_size` at a time
+def encode_batches(encode, texts, batch_size=512):
+    batches = [np.asarray(encode(texts[i:i + batch_size]), dtype=np.float32)
+               for i in range(0, len(texts), batch_size)]
+    return snapshot.normalize_rows(np.vstack(batches) if batches else np.zeros((0, 0), np.float32))
+
+
+def iter_jsonl(records, chunk_size=64 * 1024):
+    buffer = []
+    size = 0
+    for record in records:
+        data = serialization.dumps(record) + b'\n'
+        buffer.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    yield b''.join(buffer)
+
+
+def iter_csv(records, chunk_size=64 * 1024):
+    text = io.StringIO()
+    writer = csv.DictWriter(text, FIELDS, extrasaction='ignore', lineterminator='\n')
+    writer.writeheader()
+    for record in records:
+        writer.writerow({field: record.get(field, '') for field in FIELDS})
+        if text.tell() >= chunk_size:
+            yield text.getvalue().encode('utf-8')
+            text.seek(0)
+            text.truncate()
+    yield text.getvalue().encode('utf-8')
@@ -0,0 +1,285 @@
+import argparse
+import collections
+import io
+import os
+import time
+
+import numpy as np
+
+from . import bulk, reembed, serialization, snapshot, storage
+from .analytics import NEGATIVE_FEEDBACK, OnlineClusterer
+from .feedback import FEEDBACK_PATH
+from .retrieval import DenseIndex
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+PATH = os.environ.get('CALIBRATION_PATH') or os.path.join(ROOT, 'calibration.npz')
+# Embeddings of the feedback questions, so a refit only encodes new votes
+VECTORS_PATH = os.path.splitext(PATH)[0] + '.vectors.npz'
+
+# Feedback calibration. A job turns the thumbs up/down in feedback_log.txt
+# into score offsets, stored as arrays in calibration.npz:
+#   prior     one offset per answer: PRIOR_STRENGTH * (up - down) / (votes + SMOOTHING)
+#   clusters  feedback questions clustered by embedding; where a cluster has
+#             at least MIN_VOTES on an answer, an offset of CLUSTER_STRENGTH
+#             scaled the same way applies to queries near that cluster only
+# Offsets are keyed by answer text, so FAQ edits and paraphrased rows keep
+# them; compile() turns them into per-row arrays for an index, where the
+# prior is one vector add on the scores (see DenseIndex.calibrate).
+PRIOR_STRENGTH = 0.05
+CLUSTER_STRENGTH = 0.15
+SMOOTHING = 3.0
+MIN_VOTES = 2
+CLUSTER_THRESHOLD = 0.8
+
+
+# [(question, answer, +1 or -1)] in file order, skipping unsigned votes
+def read_feedback(path=FEEDBACK_PATH):
+    votes = []
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    item = serialization.loads(line)
+                except ValueError:
+                    continue
+                answer = item.get('answer')
+                feedback = str(item.get('feedback') or '').strip().lower()
+                # Unsigned votes (FEEDBACK_ALLOW_UNSIGNED) don't steer the ranking
+                if not answer or not feedback or item.get('signed') is False:
+                    continue
+                votes.append((str(item.get('question') or ''), answer, -1 if feedback in NEGATIVE_FEEDBACK else 1))
+    except FileNotFoundError:
+        pass
+    return votes
+
+
+class Calibration:
+    def __init__(self, answers, prior, centroids, indptr, answer_ids, offsets, threshold=CLUSTER_THRESHOLD,
+                 model_id=None, feedback_stamp=None, votes=0):
+        self.answers = list(answers)
+        self.prior = np.asarray(prior, dtype=np.float32)
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.answer_ids = np.asarray(answer_ids, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.float32)
+        self.threshold = threshold
+        self.model_id = model_id
+        self.feedback_stamp = feedback_stamp
+        self.votes = votes
+
+    # Per-row arrays for `faqs`: the prior offset of each row, and the
+    # cluster overrides as DenseIndex.calibrate() takes them (None when the
+    # clusters were built with another model)
+    def compile(self, faqs, model_id=None):
+        rows_by_answer = collections.defaultdict(list)
+        for row, faq in enumerate(faqs):
+            rows_by_answer[faq.get('answer')].append(row)
+        prior = np.zeros(len(faqs), dtype=np.float32)
+        for answer, offset in zip(self.answers, self.prior):
+            prior[rows_by_answer.get(answer, [])] = offset
+        if not len(self.centroids) or (model_id and self.model_id != model_id):
+            return prior, None
+        indptr, rows, offsets = [0], [], []
+        for cluster in range(len(self.centroids)):
+            for i in range(self.indptr[cluster], self.indptr[cluster + 1]):
+                matched = rows_by_answer.get(self.answers[self.answer_ids[i]], [])
+                rows.extend(matched)
+                offsets.extend([self.offsets[i]] * len(matched))
+            indptr.append(len(rows))
+        return prior, (self.centroids, self.threshold, np.array(indptr, dtype=np.int64),
+                       np.array(rows, dtype=np.int64), np.array(offsets, dtype=np.float32))
+
+    def summary(self):
+        return {'model': self.model_id, 'votes': self.votes, 'answers': len(self.answers),
+                'boosted': int((self.prior > 0).sum()), 'penalized': int((self.prior < 0).sum()),
+                'clusters': len(self.centroids), 'overrides': len(self.offsets)}
+
+    def save(self, path=PATH):
+        meta = {'threshold': self.threshold, 'model': self.model_id, 'feedback_stamp': self.feedback_stamp,
+                'votes': self.votes, 'answers': self.answers}
+        buffer = io.BytesIO()
+        np.savez(buffer, meta=np.frombuffer(serialization.dumps(meta), dtype=np.uint8), prior=self.prior,
+                 centroids=self.centroids, indptr=self.indptr, answer_ids=self.answer_ids, offsets=self.offsets)
+        storage.atomic_write(path, buffer.getvalue())
+
+    @classmethod
+    def load(cls, path=PATH):
+        with np.load(path) as data:
+            meta = serialization.loads(data['meta'].tobytes())
+            return cls(meta['answers'], data['prior'], data['centroids'], data['indptr'], data['answer_ids'],
+                       data['offsets'], meta['threshold'], meta['model'], meta['feedback_stamp'], meta['votes'])
+
+
+def _scaled(net, votes, strength):
+    return strength * net / (votes + SMOOTHING)
+
+
+# {question: vector} cached for `model_id`, or {} when the file is missing
+# or was built with another model
+def load_vectors(model_id, path=VECTORS_PATH):
+    try:
+        with np.load(path) as data:
+            meta = serialization.loads(data['meta'].tobytes())
+            if meta['model'] != model_id:
+                return {}
+            return dict(zip(meta['questions'], data['vectors']))
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def save_vectors(vectors, model_id, path=VECTORS_PATH):
+    questions = list(vectors)
+    matrix = np.array([vectors[question] for question in questions], dtype=np.float32)
+    buffer = io.BytesIO()
+    np.savez(buffer, meta=np.frombuffer(serialization.dumps({'model': model_id, 'questions': questions}),
+                                        dtype=np.uint8), vectors=matrix)
+    storage.atomic_write(path, buffer.getvalue())
+
+
+# Fit offsets to `votes` from read_feedback(); `encode` embeds the questions
+# not already in `vectors` ({question: vector}, filled in as they're encoded)
+def fit(votes, encode, model_id=None, feedback_stamp=None, vectors=None):
+    answers = sorted({answer for _, answer, _ in votes})
+    ids = {answer: i for i, answer in enumerate(answers)}
+    answer_ids = np.array([ids[answer] for _, answer, _ in votes], dtype=np.int64)
+    signs = np.array([sign for _, _, sign in votes], dtype=np.float32)
+    net = np.bincount(answer_ids, weights=signs, minlength=len(answers))
+    total = np.bincount(answer_ids, minlength=len(answers))
+    prior = _scaled(net, total, PRIOR_STRENGTH).astype(np.float32)
+
+    centroids = np.zeros((0, 0), dtype=np.float32)
+    indptr, override_ids, offsets = [0], [], []
+    questions = [question for question, _, _ in votes]
+    if votes and encode is not None:
+        vectors = {} if vectors is None else vectors
+        new = [question for question in dict.fromkeys(questions) if question not in vectors]
+        if new:
+            vectors.update(zip(new, bulk.encode_batches(encode, new)))
+        clusterer = OnlineClusterer(CLUSTER_THRESHOLD, max_clusters=2000)
+        labels = clusterer.add(np.array([vectors[question] for question in questions], dtype=np.float32),
+                               questions)
+        tally = collections.defaultdict(lambda: [0.0, 0])
+        for label, answer_id, sign in zip(labels, answer_ids, signs):
+            entry = tally[int(label), int(answer_id)]
+            entry[0] += sign
+            entry[1] += 1
+        by_cluster = collections.defaultdict(list)
+        for (cluster, answer_id), (cluster_net, count) in sorted(tally.items()):
+            if count >= MIN_VOTES and cluster_net:
+                by_cluster[cluster].append((answer_id, _scaled(cluster_net, count, CLUSTER_STRENGTH)))
+        centroids = clusterer.centroids().astype(np.float32)
+        for cluster in range(len(centroids)):
+            for answer_id, offset in by_cluster[cluster]:
+                override_ids.append(answer_id)
+                offsets.append(offset)
+            indptr.append(len(override_ids))
+    return Calibration(answers, prior, centroids, indptr, override_ids, offsets, CLUSTER_THRESHOLD,
+                       model_id, feedback_stamp, len(votes))
+
+
+def feedback_stamp(path=FEEDBACK_PATH):
+    return snapshot.file_stamp(path) if os.path.exists(path) else None
+
+
+# The periodic job: refit when feedback_log.txt or the model changed since
+# the stored calibration. Question vectors are kept in `vectors_path`, so
+# only questions from new votes are encoded. Returns True when it wrote a
+# new file.
+def refresh(encode, model_id, path=PATH, feedback_path=FEEDBACK_PATH, vectors_path=VECTORS_PATH):
+    stamp = feedback_stamp(feedback_path)
+    if stamp is None:
+        return False
+    with storage.locked(path):
+        try:
+            current = Calibration.load(path)
+            if current.feedback_stamp == stamp and current.model_id == model_id:
+                return False
+        except (OSError, ValueError, KeyError):
+            pass
+        votes = read_feedback(feedback_path)
+        vectors = load_vectors(model_id, vectors_path) if encode is not None else {}
+        cached = set(vectors)
+        fit(votes, encode, model_id, stamp, vectors).save(path)
+        # Questions no longer in the log are dropped from the cache
+        kept = {question: vectors[question] for question, _, _ in votes if question in vectors}
+        if encode is not None and set(kept) != cached:
+            save_vectors(kept, model_id, vectors_path)
+    return True
+
+
+# Top-1 answer accuracy and MRR of `index` on [(question vector, answer)],
+# plus how often a down-voted answer was still given first
+def score(index, faqs, expected, unwanted=()):
+    ranks = []
+    for vector, answer in expected:
+        answers = [faqs[idx]['answer'] for idx, _ in index.search(vector, 10)]
+        ranks.append(answers.index(answer) + 1 if answer in answers else None)
+    first = [index.search(vector, 1) for vector, _ in unwanted]
+    return {'queries': len(expected),
+            'top1': round(sum(rank == 1 for rank in ranks) / len(ranks), 4) if ranks else None,
+            'mrr': round(sum(1 / rank for rank in ranks if rank) / len(ranks), 4) if ranks else None,
+            'downvoted': len(unwanted),
+            'downvoted_still_first': round(sum(bool(results) and faqs[results[0][0]]['answer'] == answer
+                                              for results, (_, answer) in zip(first, unwanted)) / len(unwanted), 4)
+            if unwanted else None}
+
+
+# Fit on the oldest (1 - holdout) of the feedback and compare the index with
+# and without calibration on the rest (helpful and unhelpful answers) and
+# on a noisy paraphrase of every FAQ, which should not get worse
+def evaluate(entry, holdout=0.2, feedback_path=FEEDBACK_PATH):
+    from .encoders import load_encoder
+    snap = snapshot.Snapshot(reembed.snapshot_path(entry))
+    faqs, matrix = snap.records(), snap.vectors()
+    encoder = load_encoder(entry['model'], entry['backend'])
+    votes = read_feedback(feedback_path)
+    split = int(len(votes) * (1 - holdout))
+    calibration = fit(votes[:split], encoder.encode, reembed.model_id(entry))
+    test = votes[split:]
+    helpful = [(question, answer) for question, answer, sign in test if sign > 0]
+    unhelpful = [(question, answer) for question, answer, sign in test if sign < 0]
+    paraphrases = [(question, faqs[i]['answer']) for question, i in reembed.eval_set(faqs, os.devnull)]
+
+    def encoded(pairs):
+        vectors = bulk.encode_batches(encoder.encode, [question for question, _ in pairs])
+        return list(zip(vectors, [answer for _, answer in pairs]))
+
+    helpful, unhelpful, paraphrases = encoded(helpful), encoded(unhelpful), encoded(paraphrases)
+    plain = DenseIndex(faqs, matrix)
+    calibrated = DenseIndex(faqs, matrix)
+    calibrated.calibrate(*calibration.compile(faqs))
+    report = {'fit': calibration.summary(), 'held_out_votes': len(test)}
+    for name, index in (('plain', plain), ('calibrated', calibrated)):
+        vectors = [vector for vector, _ in paraphrases[:200]]
+        start = time.perf_counter()
+        for vector in vectors:
+            index.search(vector, 5)
+        report[name] = {'feedback': score(index, faqs, helpful, unhelpful),
+                        'paraphrases': score(index, faqs, paraphrases),
+                        'search_us': round((time.perf_counter() - start) * 1e6 / max(len(vectors), 1), 1)}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fit score calibration from feedback_log.txt')
+    parser.add_argument('command', choices=['build', 'evaluate', 'status'])
+    parser.add_argument('--holdout', type=float, default=0.2, help='share of the newest feedback held out (evaluate)')
+    args = parser.parse_args()
+    entry = reembed.active_entry()
+
+    def show(obj):
+        print(serialization.dumps(obj, pretty=True).decode())
+
+    if args.command == 'status':
+        return show(Calibration.load().summary())
+    if args.command == 'evaluate':
+        return show(evaluate(entry, args.holdout))
+    from .encoders import load_encoder
+    encoder = load_encoder(entry['model'], entry['backend'])
+    calibration = fit(read_feedback(), encoder.encode, reembed.model_id(entry), feedback_stamp())
+    calibration.save()
+    show(calibration.summary())
+
+
+if __name__ == '__main__':
+    main()
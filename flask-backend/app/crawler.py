@@ -0,0 +1,249 @@
+import argparse
+import collections
+import hashlib
+import os
+import sys
+import threading
+import time
+import urllib.robotparser
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urldefrag, urljoin, urlsplit, urlunsplit
+
+from . import serialization, storage
+
+USER_AGENT = 'CUTFAQBot/1.0 (+https://cut.ac.zw/)'
+SKIP_EXTENSIONS = ('.pdf', '.jpg', '.jpeg', '.png', '.gif', '.svg', '.zip', '.doc', '.docx',
+                   '.xls', '.xlsx', '.ppt', '.pptx', '.mp4', '.mp3', '.css', '.js', '.ico')
+
+
+def normalize_url(url):
+    url, _ = urldefrag(url)
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    if parts.port and (parts.scheme, parts.port) not in (('http', 80), ('https', 443)):
+        host = f'{host}:{parts.port}'
+    return urlunsplit((parts.scheme.lower(), host, parts.path or '/', parts.query, ''))
+
+
+# Passages from one HTML page: every paragraph or list item long enough to
+# be an answer, with the nearest heading above it as the question (or the
+# start of the text, as the original scraper did)
+def extract(html, base_url):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    links = [urljoin(base_url, a['href']) for a in soup.find_all('a', href=True)]
+    for tag in soup(['script', 'style', 'noscript', 'nav', 'header', 'footer', 'form']):
+        tag.decompose()
+    passages = []
+    heading = None
+    for tag in soup.find_all(['h1', 'h2', 'h3', 'h4', 'p', 'li']):
+        text = ' '.join(tag.get_text(' ', strip=True).split())
+        if tag.name.startswith('h'):
+            heading = text or heading
+        elif len(text) > 30:
+            question = heading if heading and len(heading) > 3 else text[:50] + '...'
+            passages.append({'question': question, 'answer': text})
+    return passages, links
+
+
+# Spaces out requests to the same host by at least `delay` seconds
+class HostThrottle:
+    def __init__(self, delay):
+        self.delay = delay
+        self._next = collections.defaultdict(float)
+        self._lock = threading.Lock()
+
+    def wait(self, host):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next[host])
+            self._next[host] = slot + self.delay
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# Breadth-first crawler over a pooled requests.Session. Only http(s) URLs on
+# `allowed_domains` under one of `path_prefixes` enter the frontier, at most
+# `concurrency` fetches run at once, each host is throttled, and robots.txt
+# is honoured. Pages are fetched conditionally (ETag / Last-Modified) and a
+# page whose extracted text hashes the same as last time yields nothing.
+# `state` maps URL -> {'hash', 'etag', 'modified'} and is updated in place.
+class Crawler:
+    def __init__(self, start_urls, allowed_domains=None, path_prefixes=('/',), max_pages=50, max_depth=3,
+                 concurrency=4, host_delay=0.5, timeout=10.0, state=None, respect_robots=True):
+        self.start_urls = [normalize_url(url) for url in start_urls]
+        self.allowed_domains = {d.lower() for d in (allowed_domains or [urlsplit(u).netloc for u in self.start_urls])}
+        self.path_prefixes = tuple(path_prefixes)
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.state = state if state is not None else {}
+        self.respect_robots = respect_robots
+        self.throttle = HostThrottle(host_delay)
+        self._robots = {}
+        self._robots_lock = threading.Lock()
+        self._session = None
+        self.stats = collections.Counter()
+
+    def session(self):
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=len(self.allowed_domains) or 1,
+                                  pool_maxsize=self.concurrency, max_retries=1)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['User-Agent'] = USER_AGENT
+            self._session = session
+        return self._session
+
+    def allowed(self, url):
+        parts = urlsplit(url)
+        return (parts.scheme in ('http', 'https') and parts.netloc in self.allowed_domains
+                and parts.path.startswith(self.path_prefixes)
+                and not parts.path.lower().endswith(SKIP_EXTENSIONS))
+
+    def robots_allows(self, url):
+        if not self.respect_robots:
+            return True
+        parts = urlsplit(url)
+        origin = f'{parts.scheme}://{parts.netloc}'
+        with self._robots_lock:
+            parser = self._robots.get(origin)
+            if parser is None:
+                parser = urllib.robotparser.RobotFileParser()
+                try:
+                    self.throttle.wait(parts.netloc)
+                    response = self.session().get(origin + '/robots.txt', timeout=self.timeout)
+                    parser.parse(response.text.splitlines() if response.status_code == 200 else [])
+                except Exception:
+                    parser.parse([])
+                self._robots[origin] = parser
+        return parser.can_fetch(USER_AGENT, url)
+
+    # Returns (passages or None if unchanged, outgoing links)
+    def fetch(self, url):
+        previous = self.state.get(url, {})
+        headers = {}
+        if previous.get('etag'):
+            headers['If-None-Match'] = previous['etag']
+        if previous.get('modified'):
+            headers['If-Modified-Since'] = previous['modified']
+        self.throttle.wait(urlsplit(url).netloc)
+        response = self.session().get(url, headers=headers, timeout=self.timeout)
+        self.stats['fetched'] += 1
+        if response.status_code == 304:
+            self.stats['not_modified'] += 1
+            return None, previous.get('links', [])
+        response.raise_for_status()
+        if 'html' not in response.headers.get('Content-Type', 'text/html'):
+            return None, []
+        passages, links = extract(response.text, response.url)
+        digest = hashlib.sha256(serialization.dumps(passages)).hexdigest()
+        links = [normalize_url(link) for link in links]
+        self.state[url] = {'hash': digest, 'etag': response.headers.get('ETag'),
+                           'modified': response.headers.get('Last-Modified'), 'links': links,
+                           'crawled': time.time()}
+        if previous.get('hash') == digest:
+            self.stats['unchanged'] += 1
+            return None, links
+        self.stats['changed'] += 1
+        for passage in passages:
+            passage['url'] = url
+        return passages, links
+
+    # Returns the passages from new or changed pages
+    def crawl(self):
+        frontier = collections.deque((url, 0) for url in self.start_urls)
+        seen = set(self.start_urls)
+        passages = []
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix='crawl') as pool:
+            running = {}
+            while frontier or running:
+                while frontier and len(running) < self.concurrency and self.stats['queued'] < self.max_pages:
+                    url, depth = frontier.popleft()
+                    if not self.allowed(url) or not self.robots_allows(url):
+                        self.stats['skipped'] += 1
+                        continue
+                    self.stats['queued'] += 1
+                    running[pool.submit(self.fetch, url)] = (url, depth)
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url, depth = running.pop(future)
+                    try:
+                        page_passages, links = future.result()
+                    except Exception:
+                        self.stats['errors'] += 1
+                        continue
+                    passages.extend(page_passages or [])
+                    if depth < self.max_depth:
+                        for link in links:
+                            if link not in seen and self.allowed(link):
+                                seen.add(link)
+                                frontier.append((link, depth + 1))
+        return passages
+
+
+def load_state(path):
+    try:
+        return serialization.load_file(path)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(path, state):
+    storage.atomic_write(path, serialization.dumps(state))
+
+
+def _split(value):
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+
+# Crawler configured from CRAWL_* environment variables
+def from_env(state):
+    return Crawler(
+        _split(os.environ.get('CRAWL_START_URLS', 'https://cut.ac.zw/')),
+        allowed_domains=_split(os.environ.get('CRAWL_ALLOWED_DOMAINS')) or None,
+        path_prefixes=_split(os.environ.get('CRAWL_PATH_PREFIXES', '/')),
+        max_pages=int(os.environ.get('CRAWL_MAX_PAGES', '50')),
+        max_depth=int(os.environ.get('CRAWL_MAX_DEPTH', '3')),
+        concurrency=int(os.environ.get('CRAWL_CONCURRENCY', '4')),
+        host_delay=float(os.environ.get('CRAWL_HOST_DELAY', '0.5')),
+        timeout=float(os.environ.get('CRAWL_TIMEOUT', '10')),
+        state=state,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Crawl a site and print the extracted passages as JSON lines')
+    parser.add_argument('start_urls', nargs='+')
+    parser.add_argument('--allow-domain', action='append')
+    parser.add_argument('--prefix', action='append', default=None)
+    parser.add_argument('--max-pages', type=int, default=50)
+    parser.add_argument('--max-depth', type=int, default=3)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--host-delay', type=float, default=0.5)
+    parser.add_argument('--state', help='crawl state file; unchanged pages are skipped on the next run')
+    args = parser.parse_args()
+
+    state = load_state(args.state) if args.state else {}
+    crawler = Crawler(args.start_urls, args.allow_domain, args.prefix or ('/',), args.max_pages, args.max_depth,
+                      args.concurrency, args.host_delay, state=state)
+    start = time.perf_counter()
+    passages = crawler.crawl()
+    for passage in passages:
+        print(serialization.dumps(passage).decode())
+    if args.state:
+        save_state(args.state, state)
+    print(f'{len(passages)} passages, {dict(crawler.stats)} in {time.perf_counter() - start:.1f}s',
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+import argparse
+import collections
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import numpy as np
+
+from . import serialization
+from .encoders import BACKENDS, load_encoder
+
+# Wire format, both directions: 8-byte header (JSON length, payload length),
+# a JSON object, then an optional raw payload (float32 row-major vectors).
+HEADER = struct.Struct('>II')
+
+
+def send_message(sock, header, payload=b''):
+    data = serialization.dumps(header)
+    sock.sendall(HEADER.pack(len(data), len(payload)) + data)
+    if payload:
+        sock.sendall(payload)
+
+
+def _recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
+            raise ConnectionError('connection closed')
+        received += n
+    return buffer
+
+
+def recv_message(sock):
+    header_size, payload_size = HEADER.unpack(_recv_exact(sock, HEADER.size))
+    header = serialization.loads(bytes(_recv_exact(sock, header_size)))
+    payload = _recv_exact(sock, payload_size) if payload_size else bytearray()
+    return header, payload
+
+
+def _percentiles(values):
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None}
+    p50, p95, p99 = np.percentile(np.fromiter(values, dtype=np.float64), [50, 95, 99])
+    return {'p50': round(p50, 2), 'p95': round(p95, 2), 'p99': round(p99, 2)}
+
+
+class _Job:
+    __slots__ = ('texts', 'done', 'result', 'error', 'enqueued')
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.enqueued = time.perf_counter()
+
+
+# Owns the model. Connections enqueue jobs; one batching thread merges jobs
+# that arrive within max_wait_ms (up to max_batch texts) into a single
+# forward pass, so concurrent web workers share batches instead of
+# competing for cores.
+class EmbeddingServer:
+    def __init__(self, encoder, model_name, max_batch=64, max_wait_ms=5, threads=None):
+        self.encoder = encoder
+        self.model_name = model_name
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.threads = threads
+        self.jobs = queue.Queue()
+        self.started = time.time()
+        self.counts = collections.Counter()
+        self.latencies = collections.deque(maxlen=2000)
+        self.encode_times = collections.deque(maxlen=2000)
+        self.dimension = int(encoder.encode(['warmup']).shape[1])
+        self._batcher = threading.Thread(target=self._batch_loop, name='embed-batcher', daemon=True)
+        self._batcher.start()
+
+    def encode(self, texts):
+        job = _Job(texts)
+        self.jobs.put(job)
+        job.done.wait()
+        if job.error is not None:
+            raise RuntimeError(job.error)
+        return job.result
+
+    def _next_batch(self):
+        jobs = [self.jobs.get()]
+        size = len(jobs[0].texts)
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                job = self.jobs.get(timeout=timeout)
+            except queue.Empty:
+                break
+            jobs.append(job)
+            size += len(job.texts)
+        return jobs
+
+    def _batch_loop(self):
+        while True:
+            jobs = self._next_batch()
+            texts = [text for job in jobs for text in job.texts]
+            start = time.perf_counter()
+            try:
+                vectors = np.asarray(self.encoder.encode(texts, batch_size=self.max_batch), dtype=np.float32)
+            except Exception as e:
+                vectors = None
+                for job in jobs:
+                    job.error = str(e)
+            finished = time.perf_counter()
+            self.encode_times.append((finished - start) * 1000)
+            self.counts['batches'] += 1
+            self.counts['texts'] += len(texts)
+            offset = 0
+            for job in jobs:
+                if vectors is not None:
+                    job.result = vectors[offset:offset + len(job.texts)]
+                    offset += len(job.texts)
+                self.counts['requests'] += 1
+                self.latencies.append((finished - job.enqueued) * 1000)
+                job.done.set()
+
+    def stats(self):
+        batches = self.counts['batches']
+        return {
+            'model': self.model_name,
+            'dim': self.dimension,
+            'threads': self.threads,
+            'queue_depth': self.jobs.qsize(),
+            'requests': self.counts['requests'],
+            'batches': batches,
+            'texts': self.counts['texts'],
+            'avg_batch': round(self.counts['texts'] / batches, 2) if batches else 0,
+            'latency_ms': _percentiles(list(self.latencies)),
+            'encode_ms': _percentiles(list(self.encode_times)),
+            'uptime_s': round(time.time() - self.started, 1),
+        }
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server.embedding_server
+        while True:
+            try:
+                request, _ = recv_message(self.request)
+            except (ConnectionError, OSError):
+                return
+            op = request.get('op')
+            try:
+                if op == 'encode':
+                    vectors = server.encode(request.get('texts') or [])
+                    send_message(self.request, {'ok': True, 'shape': list(vectors.shape)}, vectors.tobytes())
+                elif op == 'stats':
+                    send_message(self.request, {'ok': True, 'stats': server.stats()})
+                else:
+                    send_message(self.request, {'ok': False, 'error': f'unknown op {op!r}'})
+            except (ConnectionError, OSError):
+                return
+            except Exception as e:
+                send_message(self.request, {'ok': False, 'error': str(e)})
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def serve(socket_path, model_name, max_batch=64, max_wait_ms=5, threads=None, backend=None):
+    # Pin the math libraries before torch is imported
+    if threads:
+        for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS'):
+            os.environ[var] = str(threads)
+    backend = backend or os.environ.get('ENCODER_BACKEND', 'torch')
+    if threads and backend == 'torch':
+        import torch
+        torch.set_num_threads(threads)
+    encoder = load_encoder(model_name, backend, threads)
+    embedding_server = EmbeddingServer(encoder, model_name, max_batch, max_wait_ms, threads)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    with _UnixServer(socket_path, _Handler) as server:
+        os.chmod(socket_path, 0o660)
+        server.embedding_server = embedding_server
+        print(f'Embedding server for {model_name} listening on {socket_path}', flush=True)
+        server.serve_forever()
+
+
+# Drop-in replacement for SentenceTransformer.encode() in the web workers.
+# Each thread keeps its own connection to the server.
+class RemoteEncoder:
+    def __init__(self, socket_path, timeout=30.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._dimension = None
+
+    def _connection(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            # The server may still be loading the model when workers boot
+            deadline = time.monotonic() + self.timeout
+            while True:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(self.timeout)
+                try:
+                    sock.connect(self.socket_path)
+                    break
+                except (FileNotFoundError, ConnectionRefusedError):
+                    sock.close()
+                    if time.monotonic() >= deadline:
+                        raise
+                    time.sleep(0.2)
+            self._local.sock = sock
+        return sock
+
+    def _call(self, request):
+        # One retry on a fresh connection covers server restarts
+        for attempt in (0, 1):
+            sock = self._connection()
+            try:
+                send_message(sock, request)
+                header, payload = recv_message(sock)
+                break
+            except (ConnectionError, OSError):
+                sock.close()
+                self._local.sock = None
+                if attempt:
+                    raise
+        if not header.get('ok'):
+            raise RuntimeError(header.get('error', 'embedding server error'))
+        return header, payload
+
+    def get_sentence_embedding_dimension(self):
+        if self._dimension is None:
+            self._dimension = self.stats()['dim']
+        return self._dimension
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=None, convert_to_numpy=True,
+               normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.empty((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+        header, payload = self._call({'op': 'encode', 'texts': texts})
+        vectors = np.frombuffer(payload, dtype=np.float32).reshape(header['shape'])
+        if normalize_embeddings:
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors[0] if single else vectors
+
+    def stats(self):
+        header, _ = self._call({'op': 'stats'})
+        return header['stats']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Shared sentence-embedding server for the web workers')
+    parser.add_argument('--socket', default=os.environ.get('EMBEDDING_SOCKET', '/tmp/cut-embeddings.sock'))
+    parser.add_argument('--model', default=os.environ.get('EMBEDDING_MODEL', 'all-MiniLM-L6-v2'))
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    parser.add_argument('--threads', type=int, default=os.cpu_count())
+    parser.add_argument('--backend', choices=BACKENDS, default=os.environ.get('ENCODER_BACKEND', 'torch'))
+    parser.add_argument('--stats', action='store_true', help='print stats of a running server and exit')
+    args = parser.parse_args()
+    if args.stats:
+        print(serialization.dumps(RemoteEncoder(args.socket).stats(), pretty=True).decode())
+        return
+    serve(args.socket, args.model, args.max_batch, args.max_wait_ms, args.threads, args.backend)
+
+
+if __name__ == '__main__':
+    main()
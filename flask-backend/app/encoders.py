@@ -0,0 +1,199 @@
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+
+from . import serialization
+
+# Encoder backends behind model.encode():
+#   torch      SentenceTransformer (default)
+#   onnx       exported ONNX graph run by onnxruntime, no torch import
+#   onnx-int8  the same graph with dynamically quantized int8 weights
+BACKENDS = ('torch', 'onnx', 'onnx-int8')
+ONNX_FILES = {'onnx': 'model.onnx', 'onnx-int8': 'model.int8.onnx'}
+CONFIG_FILE = 'encoder_config.json'
+
+
+def default_onnx_dir(model_name):
+    root = os.path.join(os.path.dirname(__file__), '..', 'models')
+    return os.environ.get('ONNX_MODEL_DIR') or os.path.join(root, model_name.replace('/', '_') + '-onnx')
+
+
+def load_encoder(model_name, backend=None, threads=None):
+    backend = backend or os.environ.get('ENCODER_BACKEND', 'torch')
+    if backend == 'torch':
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    if backend in ONNX_FILES:
+        return OnnxEncoder(default_onnx_dir(model_name), ONNX_FILES[backend], threads)
+    raise ValueError(f'Unknown encoder backend {backend!r}, expected one of {BACKENDS}')
+
+
+# Defers loading the encoder until it is first used (or load() is called,
+# e.g. from a warm-up thread), so a worker starting from an index snapshot
+# can serve lexical answers before the model is in memory.
+class LazyEncoder:
+    def __init__(self, factory):
+        self._factory = factory
+        self._encoder = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._encoder is not None
+
+    def load(self):
+        if self._encoder is None:
+            with self._lock:
+                if self._encoder is None:
+                    self._encoder = self._factory()
+        return self._encoder
+
+    def encode(self, *args, **kwargs):
+        return self.load().encode(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+
+# Sentence encoder on onnxruntime + tokenizers. Reproduces the
+# SentenceTransformer pipeline (transformer -> pooling -> normalize) using
+# the settings recorded by export_onnx().
+class OnnxEncoder:
+    def __init__(self, model_dir, filename='model.onnx', threads=None):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        self.config = serialization.load_file(os.path.join(model_dir, CONFIG_FILE))
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = threads or int(os.environ.get('ONNX_THREADS', '0'))
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, filename), options, providers=['CPUExecutionProvider'])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, 'tokenizer.json'))
+        self.tokenizer.enable_truncation(self.config['max_seq_length'])
+        self.tokenizer.enable_padding(pad_id=self.config.get('pad_id', 0))
+
+    def get_sentence_embedding_dimension(self):
+        return self.config['dim']
+
+    def _forward(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {'input_ids': ids, 'attention_mask': mask, 'token_type_ids': np.zeros_like(ids)}
+        hidden = self.session.run(None, {name: feeds[name] for name in self.input_names})[0]
+        if self.config['pooling'] == 'cls':
+            return hidden[:, 0]
+        weights = mask[:, :, None].astype(np.float32)
+        return (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=None, convert_to_numpy=True,
+               normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        vectors = np.empty((len(texts), self.config['dim']), dtype=np.float32)
+        # Batch similar lengths together to keep padding small
+        order = np.argsort([-len(t) for t in texts], kind='stable')
+        for start in range(0, len(texts), batch_size):
+            batch = order[start:start + batch_size]
+            vectors[batch] = self._forward([texts[i] for i in batch])
+        if self.config['normalize'] or normalize_embeddings:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors[0] if single else vectors
+
+
+# Export a SentenceTransformer to ONNX (+ int8 quantized copy). Needs torch,
+# sentence-transformers and onnxruntime; serving afterwards needs only
+# onnxruntime and tokenizers.
+def export_onnx(model_name, out_dir, quantize=True, opset=14):
+    import torch
+    from sentence_transformers import SentenceTransformer, models
+
+    st = SentenceTransformer(model_name, device='cpu')
+    transformer = st[0]
+    pooling = next((m for m in st if isinstance(m, models.Pooling)), None)
+    os.makedirs(out_dir, exist_ok=True)
+
+    class _Wrapper(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask,
+                              token_type_ids=token_type_ids, return_dict=False)[0]
+
+    sample = transformer.tokenizer(['export sample'], return_tensors='pt')
+    inputs = (sample['input_ids'], sample['attention_mask'],
+              sample.get('token_type_ids', torch.zeros_like(sample['input_ids'])))
+    axes = {0: 'batch', 1: 'sequence'}
+    torch.onnx.export(
+        _Wrapper(transformer.auto_model).eval(), inputs, os.path.join(out_dir, 'model.onnx'),
+        input_names=['input_ids', 'attention_mask', 'token_type_ids'], output_names=['last_hidden_state'],
+        dynamic_axes={'input_ids': axes, 'attention_mask': axes, 'token_type_ids': axes,
+                      'last_hidden_state': axes},
+        opset_version=opset, do_constant_folding=True)
+    transformer.tokenizer.backend_tokenizer.save(os.path.join(out_dir, 'tokenizer.json'))
+    config = {
+        'model_name': model_name,
+        'dim': st.get_sentence_embedding_dimension(),
+        'max_seq_length': st.max_seq_length,
+        'pooling': 'cls' if pooling is not None and pooling.pooling_mode_cls_token else 'mean',
+        'normalize': any(isinstance(m, models.Normalize) for m in st),
+        'pad_id': transformer.tokenizer.pad_token_id or 0,
+    }
+    with open(os.path.join(out_dir, CONFIG_FILE), 'wb') as f:
+        f.write(serialization.dumps(config, pretty=True))
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(os.path.join(out_dir, 'model.onnx'), os.path.join(out_dir, 'model.int8.onnx'),
+                         weight_type=QuantType.QInt8)
+    return config
+
+
+# Cosine agreement between the torch encoder and an ONNX backend
+def parity(model_name, texts, backend='onnx-int8'):
+    reference = load_encoder(model_name, 'torch').encode(texts, normalize_embeddings=True)
+    candidate = load_encoder(model_name, backend).encode(texts, normalize_embeddings=True)
+    cosines = (reference * candidate).sum(axis=1)
+    # Does the candidate pick the same nearest neighbour for each text?
+    top1 = np.mean(np.argmax(reference @ reference.T - 2 * np.eye(len(texts)), axis=1)
+                   == np.argmax(candidate @ reference.T - 2 * np.eye(len(texts)), axis=1))
+    return {'backend': backend, 'texts': len(texts), 'min_cosine': float(cosines.min()),
+            'mean_cosine': float(cosines.mean()), 'neighbour_agreement': float(top1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export and check ONNX encoder backends')
+    sub = parser.add_subparsers(dest='command', required=True)
+    export = sub.add_parser('export', help='export the model to ONNX and quantize it')
+    export.add_argument('--model', default=os.environ.get('EMBEDDING_MODEL', 'all-MiniLM-L6-v2'))
+    export.add_argument('--out')
+    export.add_argument('--no-quantize', action='store_true')
+    check = sub.add_parser('parity', help='compare an ONNX backend with torch on the FAQ questions')
+    check.add_argument('--model', default=os.environ.get('EMBEDDING_MODEL', 'all-MiniLM-L6-v2'))
+    check.add_argument('--backend', default='onnx-int8', choices=ONNX_FILES)
+    check.add_argument('--faqs', default=os.path.join(os.path.dirname(__file__), '..', 'faqs.json'))
+    check.add_argument('--min-cosine', type=float, default=0.98)
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        start = time.perf_counter()
+        config = export_onnx(args.model, args.out or default_onnx_dir(args.model), not args.no_quantize)
+        print(f'Exported {config["model_name"]} in {time.perf_counter() - start:.1f}s')
+    else:
+        texts = [faq['question'] for faq in serialization.load_file(args.faqs)]
+        report = parity(args.model, texts, args.backend)
+        print(serialization.dumps(report, pretty=True).decode())
+        if report['min_cosine'] < args.min_cosine:
+            raise SystemExit(f'min cosine {report["min_cosine"]:.4f} below {args.min_cosine}')
+
+
+if __name__ == '__main__':
+    main()
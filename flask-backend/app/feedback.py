@@ -0,0 +1,142 @@
+import base64
+import collections
+import contextlib
+import hashlib
+import hmac
+import os
+import secrets
+import tempfile
+import threading
+import time
+
+from . import ratelimit, serialization
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+# The one feedback log: /feedback appends to it, and the analytics,
+# calibration and re-embedding jobs read it
+FEEDBACK_PATH = os.environ.get('FEEDBACK_PATH') or os.path.join(ROOT, 'feedback_log.txt')
+KEY_PATH = os.path.join(ROOT, 'feedback.key')
+
+
+# Votes steer the score calibration, so /feedback only accepts votes on
+# answers this app actually gave. Every answer /ask returns carries a token:
+# the time it was issued, a random nonce (so each answer served can be
+# voted on once, see VoteGuard) and an HMAC of those with the question and
+# the answer. A vote is recorded only if its token matches its question
+# and answer and is at most `max_age` seconds old.
+class AnswerSigner:
+    def __init__(self, key, max_age=86400):
+        self.key = key
+        self.max_age = max_age
+
+    def _digest(self, question, answer, issued, nonce):
+        message = serialization.dumps([question or '', answer or '', issued, nonce])
+        return base64.urlsafe_b64encode(hmac.new(self.key, message, hashlib.sha256).digest()[:18]).decode()
+
+    def sign(self, question, answer, now=None):
+        issued = f'{int(time.time() if now is None else now):x}'
+        nonce = secrets.token_urlsafe(6)
+        return f'{issued}.{nonce}.{self._digest(question, answer, issued, nonce)}'
+
+    def verify(self, token, question, answer, now=None):
+        try:
+            issued, nonce, digest = str(token).split('.')
+            age = (time.time() if now is None else now) - int(issued, 16)
+        except ValueError:
+            return False
+        # A minute of clock skew between workers is tolerated
+        if not -60 <= age <= self.max_age:
+            return False
+        return hmac.compare_digest(digest, self._digest(question, answer, issued, nonce))
+
+
+# The signing key shared by every worker: FEEDBACK_SECRET, or a random key
+# created once in `path` (linked into place, so racing workers agree on one)
+def load_key(path=KEY_PATH):
+    secret = os.environ.get('FEEDBACK_SECRET')
+    if secret:
+        return secret.encode()
+    if not os.path.exists(path):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.feedback.key.')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(secrets.token_bytes(32))
+            with contextlib.suppress(FileExistsError):
+                os.link(tmp, path)
+        finally:
+            os.unlink(tmp)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+# Per-client limits on /feedback: a token bucket on requests, each answer
+# token counts once, and at most `max_votes` votes per client per `window`
+# seconds. A used token is remembered for `token_ttl` seconds, as long as
+# it could still verify, so it can't be replayed once the window is over.
+# check() returns None for a vote to record, else (reason, seconds to
+# wait); `token` is None for an unsigned vote. Like the /ask rate limiter,
+# the counts are per process.
+class VoteGuard:
+    def __init__(self, limiter, max_votes=100, window=86400, max_clients=50000, token_ttl=86400 + 60):
+        self.limiter = limiter
+        self.max_votes = max_votes
+        self.window = window
+        self.max_clients = max_clients
+        self.token_ttl = token_ttl
+        self._votes = collections.OrderedDict()
+        self._seen = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = collections.Counter()
+
+    def check(self, client, token):
+        if self.limiter:
+            allowed, retry_after = self.limiter.allow(client)
+            if not allowed:
+                return self._reject('rate', retry_after)
+        now = time.monotonic()
+        with self._lock:
+            while self._seen and next(iter(self._seen.values())) <= now:
+                self._seen.popitem(last=False)
+            if token is not None and token in self._seen:
+                return self._reject('duplicate', 0.0)
+            start, count = self._votes.pop(client, (now, 0))
+            if now - start >= self.window:
+                start, count = now, 0
+            if self.max_votes and count >= self.max_votes:
+                self._votes[client] = (start, count)
+                return self._reject('cap', start + self.window - now)
+            self._votes[client] = (start, count + 1)
+            while len(self._votes) > self.max_clients:
+                self._votes.popitem(last=False)
+            if token is not None:
+                self._seen[token] = now + self.token_ttl
+            while len(self._seen) > self.max_clients * 10:
+                self._seen.popitem(last=False)
+            self._stats['accepted'] += 1
+        return None
+
+    def _reject(self, reason, retry_after):
+        self._stats[reason] += 1
+        return reason, retry_after
+
+    def stats(self):
+        return {'accepted': self._stats['accepted'], 'rate_limited': self._stats['rate'],
+                'duplicates': self._stats['duplicate'], 'over_cap': self._stats['cap'],
+                'max_votes': self.max_votes, 'window_s': self.window, 'clients': len(self._votes)}
+
+
+def token_ttl():
+    return float(os.environ.get('FEEDBACK_TOKEN_TTL', '86400'))
+
+
+def signer_from_env():
+    return AnswerSigner(load_key(), token_ttl())
+
+
+def guard_from_env():
+    per_minute = float(os.environ.get('FEEDBACK_RATE_PER_MIN', '10'))
+    limiter = None
+    if per_minute > 0:
+        limiter = ratelimit.RateLimiter(per_minute / 60, float(os.environ.get('FEEDBACK_BURST', '5')))
+    # Plus the minute of clock skew AnswerSigner.verify allows
+    return VoteGuard(limiter, int(os.environ.get('FEEDBACK_MAX_VOTES', '100')), token_ttl=token_ttl() + 60)
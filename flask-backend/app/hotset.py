@@ -0,0 +1,172 @@
+import collections
+import os
+import threading
+import time
+
+import numpy as np
+
+from . import serialization
+from .retrieval import category_key
+
+
+# Exponentially decayed hit counts: a hit now weighs twice as much as one
+# `half_life` seconds ago. Instead of decaying every count on every hit,
+# each hit is added with weight 2^(t / half_life) and counts are divided by
+# the current weight when read; everything is rescaled before the weights
+# get large.
+class Popularity:
+    RESCALE_AT = 2.0 ** 64
+    MIN_COUNT = 0.01
+
+    def __init__(self, half_life):
+        self.half_life = half_life
+        self.start = time.monotonic()
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def _weight(self, now):
+        return 2.0 ** ((now - self.start) / self.half_life)
+
+    def hit(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            weight = self._weight(now)
+            if weight > self.RESCALE_AT:
+                self.counts = {k: v / weight for k, v in self.counts.items() if v / weight >= self.MIN_COUNT}
+                self.start, weight = now, 1.0
+            self.counts[key] = self.counts.get(key, 0.0) + weight
+
+    # [(key, decayed count)] for the n most popular keys
+    def top(self, n, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            weight = self._weight(now)
+            items = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:n]
+        return [(key, value / weight) for key, value in items if value / weight >= self.MIN_COUNT]
+
+    def __len__(self):
+        return len(self.counts)
+
+
+# Embeddings of the most popular FAQs in one small contiguous matrix, with
+# each one's /ask response already rendered as JSON. Only the score is
+# filled in per query. `prior` is the index's per-FAQ score offset, if any.
+class HotTier:
+    def __init__(self, faqs, vectors, rows, prior=None):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.rows = np.array(rows, dtype=np.int64)
+        dim = vectors.shape[1] if vectors.ndim == 2 else 0
+        self.matrix = np.ascontiguousarray(vectors[self.rows]) if len(rows) else np.zeros((0, dim), np.float32)
+        self.prior = np.asarray(prior, dtype=np.float32)[self.rows] if prior is not None else None
+        self.categories = [category_key(faqs[row].get('category')) for row in rows]
+        self.answers = [faqs[row]['answer'] for row in rows]
+        # Rendered without the closing brace, which follows the score
+        self.bodies = [serialization.dumps({'answer': faqs[row]['answer'], 'source': 'semantic', 'tier': 'hot'})[:-1]
+                       + b',"score":' for row in rows]
+
+    def __len__(self):
+        return len(self.rows)
+
+    # (answer, score, JSON body) when a hot FAQ scores at least `threshold`
+    def match(self, vector, threshold, category=None):
+        if not len(self.rows) or len(vector) != self.matrix.shape[1]:
+            return None
+        scores = self.matrix @ vector
+        if self.prior is not None:
+            scores += self.prior
+        if category:
+            key = category_key(category)
+            scores = np.where([c == key for c in self.categories], scores, -np.inf)
+        best = int(np.argmax(scores))
+        score = float(scores[best])
+        if score < threshold:
+            return None
+        return self.answers[best], score, self.bodies[best] + repr(round(score, 6)).encode() + b'}'
+
+
+# Popularity-aware front tier for /ask. Answers are counted (by answer text,
+# so paraphrased FAQ rows share a count) with exponential decay, and every
+# `interval` seconds the FAQs behind the top answers, up to `size` rows, are
+# gathered into a HotTier. A query matching one of them at `threshold` or
+# better is answered from it without searching the full index.
+class HotSet:
+    def __init__(self, size=128, threshold=0.85, half_life=6 * 3600, interval=30.0):
+        self.size = size
+        self.threshold = threshold
+        self.interval = interval
+        self.popularity = Popularity(half_life)
+        self.tier = HotTier([], np.zeros((0, 0), np.float32), [])
+        self.built = 0.0
+        self._source = None
+        self._rows_by_answer = {}
+        self._lock = threading.Lock()
+        self._stats = collections.Counter()
+
+    # Point the tier at a new knowledge base (FAQ records, their normalized
+    # embeddings and optional score offsets, row for row) and rebuild it
+    def load(self, faqs, vectors, prior=None):
+        rows_by_answer = collections.defaultdict(list)
+        for row, faq in enumerate(faqs):
+            rows_by_answer[faq.get('answer')].append(row)
+        with self._lock:
+            self._source = (faqs, vectors, prior)
+            self._rows_by_answer = rows_by_answer
+        self.rebuild()
+
+    def rebuild(self):
+        with self._lock:
+            self._build()
+
+    def _build(self):
+        if self._source is None:
+            return
+        faqs, vectors, prior = self._source
+        rows = []
+        for answer, _ in self.popularity.top(self.size):
+            rows.extend(self._rows_by_answer.get(answer, ()))
+            if len(rows) >= self.size:
+                break
+        self.tier = HotTier(faqs, vectors, rows[:self.size], prior)
+        self.built = time.monotonic()
+        self._stats['rebuilds'] += 1
+
+    def hit(self, answer):
+        self.popularity.hit(answer)
+
+    # Rebuild the tier if it is older than `interval`. One caller does it;
+    # the others keep using the current tier meanwhile.
+    def refresh(self):
+        if time.monotonic() - self.built > self.interval and self._lock.acquire(blocking=False):
+            try:
+                if time.monotonic() - self.built > self.interval:
+                    self._build()
+            finally:
+                self._lock.release()
+        return self.tier
+
+    # (answer, score, JSON body) from the hot tier, or None
+    def lookup(self, vector, category=None):
+        result = self.tier.match(vector, self.threshold, category)
+        self._stats['hits' if result else 'misses'] += 1
+        return result
+
+    def stats(self):
+        tier = self.tier
+        hits, misses = self._stats['hits'], self._stats['misses']
+        return {'size': self.size, 'rows': len(tier), 'bytes': tier.matrix.nbytes, 'threshold': self.threshold,
+                'hits': hits, 'misses': misses,
+                'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+                'rebuilds': self._stats['rebuilds'], 'tracked_answers': len(self.popularity),
+                'top': [{'answer': answer[:80], 'count': round(count, 2)}
+                        for answer, count in self.popularity.top(10)]}
+
+
+# HOT_SIZE rows (0 disables the tier), HOT_THRESHOLD, HOT_HALF_LIFE_HOURS
+# and HOT_REBUILD_SECONDS
+def from_env():
+    size = int(os.environ.get('HOT_SIZE', '128'))
+    if size <= 0:
+        return None
+    return HotSet(size, float(os.environ.get('HOT_THRESHOLD', '0.85')),
+                  float(os.environ.get('HOT_HALF_LIFE_HOURS', '6')) * 3600,
+                  float(os.environ.get('HOT_REBUILD_SECONDS', '30')))
@@ -0,0 +1,182 @@
+import collections
+
+import numpy as np
+
+from .query_cache import normalize_query
+
+PREFIX_LENGTH = 7
+
+
+def trigrams(text):
+    padded = f' {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _deletes(word, distance):
+    results = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w)) if len(w) > 1}
+        results |= frontier
+    return results
+
+
+def edit_distance(a, b, limit):
+    # Optimal string alignment distance, giving up once it exceeds `limit`
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+# SymSpell-style corrector: every vocabulary word is indexed under its
+# deletes (on a fixed-length prefix), so a lookup only generates deletes of
+# the query token instead of scanning the vocabulary.
+class SpellingCorrector:
+    def __init__(self, texts, max_distance=2):
+        self.max_distance = max_distance
+        self.frequency = collections.Counter(
+            token for text in texts for token in normalize_query(text).split() if token.isalpha())
+        self.deletes = collections.defaultdict(list)
+        for word in self.frequency:
+            for variant in _deletes(word[:PREFIX_LENGTH], max_distance):
+                self.deletes[variant].append(word)
+
+    def state(self):
+        return {'max_distance': self.max_distance, 'frequency': self.frequency, 'deletes': self.deletes}
+
+    @classmethod
+    def from_state(cls, state):
+        speller = cls.__new__(cls)
+        speller.max_distance = state['max_distance']
+        speller.frequency = collections.Counter(state['frequency'])
+        speller.deletes = state['deletes']
+        return speller
+
+    def correct_token(self, token):
+        if token in self.frequency or not token.isalpha() or len(token) < 4:
+            return token
+        limit = 1 if len(token) <= 5 else self.max_distance
+        best, best_key = token, None
+        seen = set()
+        for variant in _deletes(token[:PREFIX_LENGTH], limit):
+            for word in self.deletes.get(variant, ()):
+                if word in seen:
+                    continue
+                seen.add(word)
+                distance = edit_distance(token, word, limit)
+                if distance <= limit:
+                    key = (distance, -self.frequency[word])
+                    if best_key is None or key < best_key:
+                        best, best_key = word, key
+        return best
+
+    def correct(self, text):
+        return ' '.join(self.correct_token(token) for token in text.split())
+
+
+# First-stage matcher over the FAQ questions: exact match on the normalized
+# (and spell-corrected) text, then character-trigram Dice similarity from an
+# inverted index. Only confident matches are returned; everything else goes
+# on to the neural encoder.
+class LexicalIndex:
+    def __init__(self, faqs, threshold=0.85, margin=0.05):
+        self.threshold = threshold
+        self.margin = margin
+        # Duplicate questions share one entry so they don't tie with themselves
+        self.exact = {}
+        for idx, faq in enumerate(faqs):
+            self.exact.setdefault(normalize_query(faq.get('question', '')), idx)
+        self.keys = list(self.exact)
+        self.faq_ids = np.array([self.exact[key] for key in self.keys], dtype=np.int64)
+        postings = collections.defaultdict(list)
+        sizes = []
+        for row, key in enumerate(self.keys):
+            grams = trigrams(key)
+            sizes.append(len(grams))
+            for gram in grams:
+                postings[gram].append(row)
+        self.postings = {gram: np.array(rows, dtype=np.int32) for gram, rows in postings.items()}
+        self.sizes = np.array(sizes, dtype=np.float32)
+        self.speller = SpellingCorrector(
+            [faq.get('question', '') for faq in faqs] + [faq.get('answer', '') for faq in faqs])
+
+    # JSON-able metadata plus flat arrays (postings in CSR form), for snapshots
+    def state(self):
+        grams = list(self.postings)
+        lengths = [len(self.postings[g]) for g in grams]
+        offsets = np.zeros(len(grams) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        rows = np.concatenate([self.postings[g] for g in grams]) if grams else np.zeros(0)
+        meta = {'threshold': self.threshold, 'margin': self.margin, 'keys': self.keys, 'grams': grams,
+                'speller': self.speller.state()}
+        arrays = {'faq_ids': self.faq_ids, 'sizes': self.sizes,
+                  'posting_offsets': offsets, 'posting_rows': rows.astype(np.int32)}
+        return meta, arrays
+
+    @classmethod
+    def from_state(cls, meta, arrays):
+        index = cls.__new__(cls)
+        index.threshold = meta['threshold']
+        index.margin = meta['margin']
+        index.keys = meta['keys']
+        index.faq_ids = arrays['faq_ids']
+        index.exact = {key: int(idx) for key, idx in zip(index.keys, index.faq_ids)}
+        offsets, rows = arrays['posting_offsets'], arrays['posting_rows']
+        index.postings = {gram: rows[offsets[i]:offsets[i + 1]] for i, gram in enumerate(meta['grams'])}
+        index.sizes = arrays['sizes']
+        index.speller = SpellingCorrector.from_state(meta['speller'])
+        return index
+
+    def scores(self, text):
+        grams = trigrams(text)
+        hits = [self.postings[g] for g in grams if g in self.postings]
+        if not hits:
+            return np.zeros(len(self.sizes), dtype=np.float32)
+        overlap = np.bincount(np.concatenate(hits), minlength=len(self.sizes))
+        return 2.0 * overlap / (self.sizes + len(grams))
+
+    # Returns [(faq index, score)] for the best trigram matches
+    def search(self, question, top_k=5):
+        scores = self.scores(self.speller.correct(normalize_query(question)))
+        return [(int(self.faq_ids[row]), float(scores[row])) for row in top_rows(scores, top_k) if scores[row] > 0]
+
+    # Returns (faq index, score, corrected text) for a confident match, else None
+    def match(self, question):
+        key = normalize_query(question)
+        if not key:
+            return None
+        if key in self.exact:
+            return self.exact[key], 1.0, key
+        corrected = self.speller.correct(key)
+        if corrected in self.exact:
+            return self.exact[corrected], 1.0, corrected
+        scores = self.scores(corrected)
+        rows = top_rows(scores, 2)
+        if not len(rows):
+            return None
+        best = scores[rows[0]]
+        runner_up = scores[rows[1]] if len(rows) > 1 else 0.0
+        if best >= self.threshold and best - runner_up >= self.margin:
+            return int(self.faq_ids[rows[0]]), float(best), corrected
+        return None
+
+
+# Helper: indices of the k largest scores, best first, without a full sort
+def top_rows(scores, k):
+    if len(scores) > k:
+        rows = np.argpartition(scores, -k)[-k:]
+    else:
+        rows = np.arange(len(scores))
+    return rows[np.argsort(scores[rows])[::-1]]
@@ -0,0 +1,203 @@
+import argparse
+import collections
+import datetime
+import fcntl
+import os
+import time
+
+import numpy as np
+
+from . import serialization
+from .analytics import LogTail, OnlineClusterer
+
+
+# Unanswered questions, one JSON line each in misses.jsonl, with the query
+# embedding appended to misses.f32. Each record stores the byte offset and
+# dimension of its vector, so the miner can read vectors straight out of
+# the file without re-encoding anything.
+class MissLog:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.records_path = os.path.join(directory, 'misses.jsonl')
+        self.vectors_path = os.path.join(directory, 'misses.f32')
+
+    def record(self, question, vector, best_score=None, best_question=None):
+        vector = np.ascontiguousarray(vector, dtype=np.float32).ravel()
+        with open(self.vectors_path, 'ab') as vectors, open(self.records_path, 'ab') as records:
+            # Workers share the files; keep each vector and its record together
+            fcntl.flock(records, fcntl.LOCK_EX)
+            try:
+                offset = vectors.seek(0, os.SEEK_END)
+                vectors.write(vector.tobytes())
+                vectors.flush()
+                records.write(serialization.dumps({
+                    'timestamp': datetime.datetime.now().isoformat(),
+                    'question': question,
+                    'best_score': None if best_score is None else round(float(best_score), 4),
+                    'best_question': best_question,
+                    'offset': offset,
+                    'dim': len(vector),
+                }) + b'\n')
+            finally:
+                fcntl.flock(records, fcntl.LOCK_UN)
+
+
+# Turns the miss log into suggested FAQs. Each refresh() clusters only the
+# misses recorded since the last run into the existing clusters, then
+# rewrites suggestions.json. Clusters whose centroid is now close to an
+# existing FAQ (someone added it) are dropped from the suggestions.
+class MissMiner:
+    def __init__(self, directory, faq_matrix=None, threshold=0.7, covered_threshold=0.6, top_n=30):
+        self.log = MissLog(directory)
+        self.faq_matrix = faq_matrix or (lambda: None)
+        self.threshold = threshold
+        self.covered_threshold = covered_threshold
+        self.top_n = top_n
+        self.state_path = os.path.join(directory, 'miner_state.json')
+        self.centroids_path = os.path.join(directory, 'miner_clusters.npy')
+        self.suggestions_path = os.path.join(directory, 'suggestions.json')
+        self._suggestions = (None, None)
+
+    def _load_state(self):
+        try:
+            state = serialization.load_file(self.state_path)
+        except (OSError, ValueError):
+            state = {}
+        self.tail = LogTail(self.log.records_path, state.get('offset', 0))
+        self._reset(state.get('dim'))
+        if state.get('clusters'):
+            self.scores = state.get('scores', {})
+            self.nearest = {key: collections.Counter(value) for key, value in state.get('nearest', {}).items()}
+            self.last_seen = state.get('last_seen', {})
+            self.clusters = OnlineClusterer.restore(state['clusters'], self.centroids_path)
+
+    def _reset(self, dim):
+        self.dim = dim
+        self.scores = {}
+        self.nearest = {}
+        self.last_seen = {}
+        self.clusters = OnlineClusterer(self.threshold, max_clusters=2000)
+
+    def _save_state(self):
+        if len(self.clusters):
+            self.clusters.save(self.centroids_path)
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(serialization.dumps({
+                'offset': self.tail.offset, 'dim': self.dim,
+                'scores': self.scores, 'nearest': self.nearest, 'last_seen': self.last_seen,
+                'clusters': self.clusters.state() if len(self.clusters) else None,
+            }))
+        os.replace(tmp, self.state_path)
+
+    def _ingest(self, lines):
+        records = []
+        for line in lines:
+            try:
+                record = serialization.loads(line)
+            except ValueError:
+                continue
+            records.append(record)
+        if not records:
+            return 0
+        # Vectors from a different model can't share clusters. The newest
+        # miss tells which model is serving: after a switch (re-embedding
+        # into a new model) the old clusters are dropped, like OnlineClusterer
+        # does, and misses still logged by the old model are skipped.
+        if records[-1]['dim'] != self.dim:
+            self._reset(records[-1]['dim'])
+        records = [record for record in records if record['dim'] == self.dim]
+        vectors = np.memmap(self.log.vectors_path, dtype=np.float32, mode='r')
+        rows = np.stack([vectors[r['offset'] // 4:r['offset'] // 4 + r['dim']] for r in records])
+        labels = self.clusters.add(rows, [' '.join(r['question'].split()) for r in records])
+        for record, label in zip(records, labels):
+            key = str(label)
+            # Keep a running [sum, count] of best-match scores per cluster
+            if record.get('best_score') is not None:
+                total = self.scores.setdefault(key, [0.0, 0])
+                total[0] += record['best_score']
+                total[1] += 1
+            if record.get('best_question'):
+                self.nearest.setdefault(key, collections.Counter())[record['best_question']] += 1
+            self.last_seen[key] = max(self.last_seen.get(key, ''), record['timestamp'])
+        return len(records)
+
+    def suggestions(self):
+        centroids = self.clusters.centroids()
+        covered = np.zeros(len(self.clusters), dtype=bool)
+        faq_matrix = self.faq_matrix()
+        if centroids is not None and faq_matrix is not None and len(faq_matrix):
+            faq_matrix = np.asarray(faq_matrix, dtype=np.float32)
+            faq_matrix = faq_matrix / np.maximum(np.linalg.norm(faq_matrix, axis=1, keepdims=True), 1e-12)
+            if faq_matrix.shape[1] == centroids.shape[1]:
+                covered = (centroids @ faq_matrix.T).max(axis=1) >= self.covered_threshold
+        rows = []
+        for cluster in self.clusters.top(len(self.clusters)):
+            key = str(cluster['cluster'])
+            if covered[cluster['cluster']]:
+                continue
+            total = self.scores.get(key)
+            nearest = self.nearest.get(key)
+            rows.append(dict(
+                cluster,
+                avg_best_score=round(total[0] / total[1], 4) if total and total[1] else None,
+                nearest_faq=nearest.most_common(1)[0][0] if nearest else None,
+                last_seen=self.last_seen.get(key),
+            ))
+            if len(rows) >= self.top_n:
+                break
+        return rows
+
+    # Cluster the new misses and rewrite suggestions.json. Returns the number
+    # of new misses, or None when another worker holds the lock.
+    def refresh(self):
+        with open(os.path.join(self.log.directory, 'miner.lock'), 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return None
+            self._load_state()
+            added = self._ingest(self.tail.read_lines())
+            if added:
+                self._save_state()
+            tmp = self.suggestions_path + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(serialization.dumps({
+                    'generated': datetime.datetime.now().isoformat(timespec='seconds'),
+                    'misses': int(self.clusters.counts.sum()),
+                    'suggestions': self.suggestions(),
+                }))
+            os.replace(tmp, self.suggestions_path)
+            return added
+
+    # The latest suggestions, re-read only when the file changes
+    def latest(self):
+        try:
+            mtime = os.stat(self.suggestions_path).st_mtime_ns
+        except OSError:
+            return None
+        if self._suggestions[0] != mtime:
+            self._suggestions = (mtime, serialization.load_file(self.suggestions_path))
+        return self._suggestions[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cluster unanswered questions into suggested FAQs')
+    parser.add_argument('--dir', default=os.environ.get('MISSES_DIR', 'misses'))
+    parser.add_argument('--faqs', default=os.path.join(os.path.dirname(__file__), '..', 'faqs.json'))
+    args = parser.parse_args()
+    from .encoders import load_encoder
+    encoder = load_encoder(os.environ.get('EMBEDDING_MODEL', 'all-MiniLM-L6-v2'))
+    questions = [faq['question'] for faq in serialization.load_file(args.faqs)]
+    miner = MissMiner(args.dir, lambda: encoder.encode(questions, normalize_embeddings=True))
+    start = time.perf_counter()
+    added = miner.refresh()
+    if added is None:
+        raise SystemExit('another process is mining the miss log')
+    latest = miner.latest()
+    print(f'{added} new misses, {len(latest["suggestions"])} suggestions in {time.perf_counter() - start:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
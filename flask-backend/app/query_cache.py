@@ -0,0 +1,188 @@
+import collections
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+_PUNCTUATION = re.compile(r'[^\w\s]+')
+_SPACES = re.compile(r'\s+')
+
+
+def _singular(token):
+    if len(token) > 4 and token.endswith('s') and not token.endswith(('ss', 'us', 'is', 'ys')):
+        return token[:-1]
+    return token
+
+
+# Canonical form of a query: case, punctuation, spacing and simple plurals
+# don't change the cache key ("Entry types?" == "entry type").
+def normalize_query(text):
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    text = _SPACES.sub(' ', _PUNCTUATION.sub(' ', text)).strip()
+    return ' '.join(_singular(token) for token in text.split(' ')) if text else ''
+
+
+# Bounded LRU cache of query embeddings, limited by entry count and bytes.
+# With a store path it writes through to a SQLite file, which survives
+# restarts and is shared by every worker on the host. The store is pruned to
+# its most recently used entries; hits update their time of use in batches
+# of TOUCH_BATCH, so a hit doesn't cost a write.
+class QueryEmbeddingCache:
+    ENTRY_OVERHEAD = 120  # rough per-entry cost of the key and bookkeeping
+    TOUCH_BATCH = 100
+
+    def __init__(self, namespace, max_entries=10000, max_bytes=64 * 1024 * 1024,
+                 store_path=None, max_store_entries=200000):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.store_path = store_path
+        self.max_store_entries = max_store_entries
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = collections.Counter()
+        self._touched = {}
+        if store_path:
+            self._store().execute(
+                'CREATE TABLE IF NOT EXISTS query_embeddings (namespace TEXT, key TEXT, '
+                'dim INTEGER, vector BLOB, used REAL, PRIMARY KEY (namespace, key))')
+
+    def _store(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.store_path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _size(self, key, vector):
+        return vector.nbytes + len(key) + self.ENTRY_OVERHEAD
+
+    def _insert(self, key, vector):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= self._size(key, old)
+            self._entries[key] = vector
+            self._bytes += self._size(key, vector)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                old_key, old_vector = self._entries.popitem(last=False)
+                self._bytes -= self._size(old_key, old_vector)
+                self._stats['evictions'] += 1
+
+    def get(self, key):
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+        if vector is not None:
+            if self.store_path:
+                self._touch(key)
+            return vector
+        if self.store_path:
+            try:
+                row = self._store().execute(
+                    'SELECT dim, vector FROM query_embeddings WHERE namespace = ? AND key = ?',
+                    (self.namespace, key)).fetchone()
+            except sqlite3.Error:
+                row = None
+            if row is not None:
+                vector = np.frombuffer(row[1], dtype=np.float32).reshape(row[0])
+                self._insert(key, vector)
+                self._stats['store_hits'] += 1
+                self._touch(key)
+                return vector
+        self._stats['misses'] += 1
+        return None
+
+    def put(self, key, vector):
+        vector = np.ascontiguousarray(vector, dtype=np.float32)
+        vector.setflags(write=False)
+        self._insert(key, vector)
+        if self.store_path:
+            try:
+                store = self._store()
+                store.execute('INSERT OR REPLACE INTO query_embeddings VALUES (?, ?, ?, ?, ?)',
+                              (self.namespace, key, vector.shape[0], vector.tobytes(), time.time()))
+                self._stats['store_writes'] += 1
+                if self._stats['store_writes'] % 1000 == 0:
+                    self._prune_store(store)
+            except sqlite3.Error:
+                self._stats['store_errors'] += 1
+
+    def _touch(self, key):
+        with self._lock:
+            self._touched[key] = time.time()
+            if len(self._touched) < self.TOUCH_BATCH:
+                return
+        self._flush_touched()
+
+    # Write the pending times of use to the store
+    def _flush_touched(self, store=None):
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        if not touched:
+            return
+        try:
+            store = store or self._store()
+            store.execute('BEGIN')
+            try:
+                store.executemany('UPDATE query_embeddings SET used = MAX(used, ?) WHERE namespace = ? AND key = ?',
+                                  [(used, self.namespace, key) for key, used in touched.items()])
+                store.execute('COMMIT')
+            finally:
+                if store.in_transaction:
+                    store.execute('ROLLBACK')
+        except sqlite3.Error:
+            self._stats['store_errors'] += 1
+
+    def _prune_store(self, store):
+        self._flush_touched(store)
+        store.execute(
+            'DELETE FROM query_embeddings WHERE rowid IN (SELECT rowid FROM query_embeddings '
+            'ORDER BY used DESC LIMIT -1 OFFSET ?)', (self.max_store_entries,))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        lookups = self._stats['hits'] + self._stats['store_hits'] + self._stats['misses']
+        stats = {
+            'namespace': self.namespace,
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'hits': self._stats['hits'],
+            'store_hits': self._stats['store_hits'],
+            'misses': self._stats['misses'],
+            'evictions': self._stats['evictions'],
+            'hit_rate': round((lookups - self._stats['misses']) / lookups, 4) if lookups else 0.0,
+            'store': self.store_path,
+        }
+        if self.store_path:
+            try:
+                stats['store_entries'] = self._store().execute(
+                    'SELECT COUNT(*) FROM query_embeddings WHERE namespace = ?', (self.namespace,)).fetchone()[0]
+            except sqlite3.Error:
+                stats['store_entries'] = None
+        return stats
+
+
+def from_env(namespace):
+    return QueryEmbeddingCache(
+        namespace,
+        max_entries=int(os.environ.get('QUERY_CACHE_SIZE', '10000')),
+        max_bytes=int(float(os.environ.get('QUERY_CACHE_MB', '64')) * 1024 * 1024),
+        store_path=os.environ.get('QUERY_CACHE_DB') or None,
+    )
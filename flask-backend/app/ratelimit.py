@@ -0,0 +1,126 @@
+import collections
+import os
+import threading
+import time
+
+
+class Overloaded(Exception):
+    pass
+
+
+# Token bucket per client: `rate` requests per second on average, with
+# bursts of up to `burst`. A request can cost several tokens (a batch of
+# questions); one costing more than `burst` is let through on a full bucket
+# and leaves it in debt. Idle clients are dropped oldest-first once more
+# than `max_clients` are tracked. Buckets are per process.
+class RateLimiter:
+    def __init__(self, rate, burst, max_clients=50000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    # Returns (allowed, seconds until the next token)
+    def allow(self, key, cost=1):
+        now = time.monotonic()
+        need = min(cost, self.burst)
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            allowed = tokens >= need
+            if allowed:
+                tokens -= cost
+            else:
+                self.rejected += 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (need - tokens) / self.rate
+
+    def stats(self):
+        return {'rate_per_min': self.rate * 60, 'burst': self.burst,
+                'clients': len(self._buckets), 'rejected': self.rejected}
+
+
+# Adaptive cap on concurrent model inference. The cap grows by one per
+# `limit` fast calls and shrinks by 10% whenever a call takes longer than
+# `target_ms` (AIMD), so it settles near what the CPU can actually serve.
+# Callers that can't get a slot are told to degrade instead of queueing.
+class LoadShedder:
+    def __init__(self, max_inflight, target_ms=500.0, min_inflight=1):
+        self.max_inflight = max_inflight
+        self.min_inflight = min_inflight
+        self.target_ms = target_ms
+        self.limit = float(max_inflight)
+        self.inflight = 0
+        self._lock = threading.Lock()
+        self._stats = collections.Counter()
+
+    def acquire(self):
+        with self._lock:
+            if self.inflight >= int(self.limit):
+                self._stats['shed'] += 1
+                return False
+            self.inflight += 1
+            return True
+
+    def release(self, elapsed_ms):
+        with self._lock:
+            self.inflight -= 1
+            self._stats['completed'] += 1
+            if elapsed_ms > self.target_ms:
+                self._stats['slow'] += 1
+                self.limit = max(self.min_inflight, self.limit * 0.9)
+            else:
+                self.limit = min(self.max_inflight, self.limit + 1 / self.limit)
+
+    # True while every slot is taken; used to skip optional slow work
+    def saturated(self):
+        return self.inflight >= int(self.limit)
+
+    # Run fn() in an inference slot, or raise Overloaded if none is free
+    def run(self, fn, *args):
+        if not self.acquire():
+            raise Overloaded()
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.release((time.perf_counter() - start) * 1000)
+
+    def stats(self):
+        return {'inflight': self.inflight, 'limit': round(self.limit, 2), 'max_inflight': self.max_inflight,
+                'target_ms': self.target_ms, 'completed': self._stats['completed'],
+                'slow': self._stats['slow'], 'shed': self._stats['shed']}
+
+
+# Off unless RATE_LIMIT_PER_MIN is set: many students can share one address
+# behind a campus NAT or a proxy
+def limiter_from_env():
+    per_minute = float(os.environ.get('RATE_LIMIT_PER_MIN', '0'))
+    if per_minute <= 0:
+        return None
+    return RateLimiter(per_minute / 60, float(os.environ.get('RATE_LIMIT_BURST', '10')))
+
+
+def shedder_from_env():
+    return LoadShedder(int(os.environ.get('SHED_MAX_INFLIGHT', 2 * (os.cpu_count() or 1))),
+                       float(os.environ.get('SHED_TARGET_MS', '500')))
+
+
+# Client address for rate limiting. Behind TRUSTED_PROXIES reverse proxies
+# that each append the address they were connected from to X-Forwarded-For,
+# the client is the entry that many places from the right; anything further
+# left was sent by the client and can't be trusted.
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', '0'))
+
+
+def client_key(remote_addr, forwarded_for=None, trusted_proxies=None):
+    hops = TRUSTED_PROXIES if trusted_proxies is None else trusted_proxies
+    if hops > 0 and forwarded_for:
+        addresses = [a.strip() for a in forwarded_for.split(',') if a.strip()]
+        if len(addresses) >= hops:
+            return addresses[-hops]
+    return remote_addr or 'unknown'
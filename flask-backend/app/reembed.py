@@ -0,0 +1,273 @@
+import argparse
+import datetime
+import multiprocessing
+import os
+import random
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from . import serialization, snapshot, storage
+from .analytics import NEGATIVE_FEEDBACK
+from .encoders import load_encoder
+from .feedback import FEEDBACK_PATH
+from .lexical import LexicalIndex
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+FAQS_PATH = os.path.join(ROOT, 'faqs.json')
+STATE_PATH = os.environ.get('INDEX_STATE_PATH') or os.path.join(ROOT, 'index_state.json')
+
+# Blue/green model upgrades. index_state.json names the active index (an
+# encoder plus the snapshot built with it) and the previous one:
+#   build    encode faqs.json with a new model in a process pool, into its
+#            own snapshot, while the current index keeps serving
+#   compare  evaluate the active and the new index on the same questions
+#            (accuracy and single-query latency)
+#   promote  make the new index active; workers pick it up without a restart
+#   rollback switch back to the previous index
+# `upgrade` runs build, compare and promote, promoting only when the new
+# model is at least as accurate and not much slower.
+
+
+def default_entry():
+    model = os.environ.get('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+    backend = os.environ.get('ENCODER_BACKEND', 'torch')
+    return {'model': model, 'backend': backend, 'snapshot': os.environ.get('SNAPSHOT_PATH') or 'faqs.snapshot'}
+
+
+def model_id(entry):
+    return f"{entry['model']}:{entry['backend']}"
+
+
+def entry_for(model, backend):
+    slug = re.sub(r'[^A-Za-z0-9._-]+', '_', f'{model}-{backend}')
+    return {'model': model, 'backend': backend, 'snapshot': f'faqs.{slug}.snapshot'}
+
+
+# Snapshot paths in the state file are relative to flask-backend/
+def snapshot_path(entry):
+    return os.path.join(ROOT, entry['snapshot'])
+
+
+def load_state(path=STATE_PATH):
+    try:
+        state = serialization.load_file(path)
+    except (OSError, ValueError):
+        state = {}
+    state.setdefault('active', None)
+    state.setdefault('previous', None)
+    state.setdefault('reports', {})
+    state.setdefault('history', [])
+    return state
+
+
+def save_state(state, path=STATE_PATH):
+    storage.atomic_write(path, serialization.dumps(state, pretty=True))
+
+
+# The index workers should serve: the promoted one, or the env settings
+def active_entry(path=STATE_PATH):
+    return load_state(path)['active'] or default_entry()
+
+
+# Each pool process loads the encoder once and then encodes chunks
+_encoder = None
+
+
+def _init_worker(model, backend, threads):
+    global _encoder
+    if threads:
+        os.environ['OMP_NUM_THREADS'] = str(threads)
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+    _encoder = load_encoder(model, backend, threads)
+
+
+def _encode_chunk(texts):
+    return np.asarray(_encoder.encode(texts), dtype=np.float32)
+
+
+def encode_parallel(entry, texts, workers, chunk_size=256):
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    if workers <= 1:
+        _init_worker(entry['model'], entry['backend'], None)
+        parts = [_encode_chunk(chunk) for chunk in chunks]
+    else:
+        # Split the cores between workers so they don't oversubscribe the CPU
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker,
+                                 initargs=(entry['model'], entry['backend'], threads)) as pool:
+            parts = list(pool.map(_encode_chunk, chunks))
+    return snapshot.normalize_rows(np.vstack(parts) if parts else [])
+
+
+def build(entry, workers, faqs_path=FAQS_PATH):
+    start = time.perf_counter()
+    stamp = snapshot.file_stamp(faqs_path)
+    records = storage.load_records(faqs_path)
+    vectors = encode_parallel(entry, [faq['question'] for faq in records], workers)
+    snapshot.write(snapshot_path(entry), records, vectors, LexicalIndex(records), model_id(entry), stamp)
+    return {'faqs': len(records), 'dim': int(vectors.shape[1]) if len(vectors) else 0,
+            'seconds': round(time.perf_counter() - start, 2)}
+
+
+def perturb(text, rng):
+    words = text.split()
+    if len(words) > 3:
+        words.pop(rng.randrange(len(words)))
+    if len(words) > 2:
+        i = rng.randrange(len(words) - 1)
+        words[i], words[i + 1] = words[i + 1], words[i]
+    return ' '.join(words)
+
+
+# (question, index of the FAQ that answers it): questions users rated
+# helpful in feedback_log.txt, plus a noisy paraphrase of every FAQ
+def eval_set(records, feedback_path=FEEDBACK_PATH, seed=13):
+    by_answer = {faq['answer']: i for i, faq in enumerate(records)}
+    pairs = {}
+    try:
+        with open(feedback_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    item = serialization.loads(line)
+                except ValueError:
+                    continue
+                feedback = str(item.get('feedback') or '').strip().lower()
+                if feedback and feedback not in NEGATIVE_FEEDBACK and item.get('answer') in by_answer:
+                    pairs[item.get('question') or ''] = by_answer[item['answer']]
+    except FileNotFoundError:
+        pass
+    rng = random.Random(seed)
+    for i, faq in enumerate(records):
+        pairs.setdefault(perturb(faq['question'], rng), i)
+    pairs.pop('', None)
+    return list(pairs.items())
+
+
+# Top-1 accuracy and MRR of `entry` on the eval set, and the latency of
+# encoding one query at a time
+def evaluate(entry, queries, latency_queries=200):
+    snap = snapshot.Snapshot(snapshot_path(entry))
+    if snap.header['model'] != model_id(entry):
+        raise SystemExit(f"{entry['snapshot']} was built with {snap.header['model']}, not {model_id(entry)}")
+    records, matrix = snap.records(), snap.vectors()
+    encoder = load_encoder(entry['model'], entry['backend'])
+    texts = [q for q, _ in queries]
+    start = time.perf_counter()
+    vectors = snapshot.normalize_rows(encoder.encode(texts))
+    batch_s = time.perf_counter() - start
+    scores = vectors @ matrix.T
+    expected = np.array([i for _, i in queries])
+    ranks = (scores > scores[np.arange(len(queries)), expected][:, None]).sum(axis=1) + 1
+    encoder.encode(texts[:4])
+    latencies = []
+    for text in texts[:latency_queries]:
+        t = time.perf_counter()
+        encoder.encode([text])
+        latencies.append((time.perf_counter() - t) * 1000)
+    p50, p95 = np.percentile(latencies, [50, 95])
+    return {'model': model_id(entry), 'faqs': len(records), 'queries': len(queries),
+            'top1': round(float((ranks == 1).mean()), 4), 'mrr': round(float((1 / ranks).mean()), 4),
+            'p50_ms': round(float(p50), 2), 'p95_ms': round(float(p95), 2),
+            'batch_qps': round(len(texts) / batch_s, 1)}
+
+
+def compare(blue, green):
+    # Both indexes must have been built from the same FAQs for the numbers to compare
+    green_snapshot = snapshot.Snapshot(snapshot_path(green))
+    if snapshot.Snapshot(snapshot_path(blue)).header['faqs_digest'] != green_snapshot.header['faqs_digest']:
+        raise SystemExit('The two snapshots were built from different FAQs; rebuild the new one first')
+    queries = eval_set(green_snapshot.records())
+    return {'blue': evaluate(blue, queries), 'green': evaluate(green, queries),
+            'compared': datetime.datetime.now().isoformat(timespec='seconds')}
+
+
+def verdict(report, max_accuracy_drop=0.0, max_slowdown=1.5):
+    blue, green = report['blue'], report['green']
+    if green['top1'] < blue['top1'] - max_accuracy_drop:
+        return f"top-1 accuracy {green['top1']} is below {blue['top1']}"
+    if green['p95_ms'] > blue['p95_ms'] * max_slowdown:
+        return f"p95 latency {green['p95_ms']} ms is over {max_slowdown}x {blue['p95_ms']} ms"
+    return None
+
+
+def promote(entry, force=False, faqs_path=FAQS_PATH, path=STATE_PATH):
+    with storage.locked(path):
+        state = load_state(path)
+        header = snapshot.Snapshot(snapshot_path(entry)).header
+        if header['model'] != model_id(entry):
+            raise SystemExit(f"{entry['snapshot']} was built with {header['model']}")
+        # FAQs edited since the build would be re-encoded by every worker at swap time
+        if not force and header['faqs_digest'] != snapshot.records_digest(storage.load_records(faqs_path)):
+            raise SystemExit('faqs.json changed since the new index was built; run build again (or --force)')
+        current = state['active'] or default_entry()
+        state['previous'], state['active'] = current, entry
+        state['history'].append({'promoted': model_id(entry), 'from': model_id(current),
+                                 'at': datetime.datetime.now().isoformat(timespec='seconds')})
+        save_state(state, path)
+    return state
+
+
+def rollback(path=STATE_PATH):
+    with storage.locked(path):
+        state = load_state(path)
+        if not state['previous']:
+            raise SystemExit('Nothing to roll back to')
+        state['active'], state['previous'] = state['previous'], state['active']
+        state['history'].append({'rolled_back_to': model_id(state['active']),
+                                 'at': datetime.datetime.now().isoformat(timespec='seconds')})
+        save_state(state, path)
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Blue/green re-embedding of the FAQ index')
+    parser.add_argument('command', choices=['status', 'build', 'compare', 'promote', 'upgrade', 'rollback'])
+    parser.add_argument('--model', help='new embedding model (build, compare, promote, upgrade)')
+    parser.add_argument('--backend', default=os.environ.get('ENCODER_BACKEND', 'torch'))
+    parser.add_argument('--workers', type=int, default=max(1, min(4, (os.cpu_count() or 1) // 2)))
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.0)
+    parser.add_argument('--max-slowdown', type=float, default=1.5)
+    parser.add_argument('--force', action='store_true', help='promote even if the checks fail')
+    args = parser.parse_args()
+
+    def show(obj):
+        print(serialization.dumps(obj, pretty=True).decode())
+
+    if args.command == 'status':
+        return show(load_state())
+    if args.command == 'rollback':
+        return show(rollback()['active'])
+    if not args.model:
+        parser.error(f'{args.command} needs --model')
+    green = entry_for(args.model, args.backend)
+    blue = active_entry()
+    if args.command in ('build', 'upgrade'):
+        print(f"building {model_id(green)} with {args.workers} workers ...")
+        show(build(green, args.workers))
+    if args.command in ('compare', 'upgrade'):
+        report = compare(blue, green)
+        show(report)
+        with storage.locked(STATE_PATH):
+            state = load_state()
+            state['reports'][model_id(green)] = report
+            save_state(state)
+        problem = verdict(report, args.max_accuracy_drop, args.max_slowdown)
+        if args.command == 'upgrade':
+            if problem and not args.force:
+                raise SystemExit(f'not promoting: {problem}')
+            show(promote(green, args.force)['active'])
+        elif problem:
+            print(f'warning: {problem}')
+    if args.command == 'promote':
+        show(promote(green, args.force)['active'])
+
+
+if __name__ == '__main__':
+    main()
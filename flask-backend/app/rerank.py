@@ -0,0 +1,113 @@
+import collections
+import os
+import threading
+import time
+
+import numpy as np
+
+
+# Optional second pass over the top bi-encoder candidates with a
+# cross-encoder. The model loads in the background on first use, and each
+# call is held to a latency budget: the per-pair cost is tracked as an
+# EWMA, the candidate list is cut to what fits in the budget, and if not
+# even two candidates fit the bi-encoder order is returned unchanged.
+class Reranker:
+    PROBE_EVERY = 100
+
+    def __init__(self, model_name, top_n=5, budget_ms=150.0, max_length=256):
+        self.model_name = model_name
+        self.top_n = top_n
+        self.budget_ms = budget_ms
+        self.max_length = max_length
+        self.pair_ms = None
+        self._model = None
+        self._loading = False
+        self._error = None
+        self._lock = threading.Lock()
+        self._stats = collections.Counter()
+        self._timings = collections.deque(maxlen=1000)
+
+    def _load(self):
+        try:
+            from sentence_transformers import CrossEncoder
+            model = CrossEncoder(self.model_name, max_length=self.max_length, device='cpu')
+            # The first predict() is much slower than the rest; keep it out of the EWMA
+            start = time.perf_counter()
+            model.predict([('warm up', 'warm up')] * 2)
+            self.pair_ms = (time.perf_counter() - start) * 1000 / 2
+            self._model = model
+        except Exception as e:
+            self._error = str(e)
+        finally:
+            self._loading = False
+
+    def model(self):
+        if self._model is None and not self._loading and self._error is None:
+            with self._lock:
+                if self._model is None and not self._loading:
+                    self._loading = True
+                    threading.Thread(target=self._load, daemon=True).start()
+        return self._model
+
+    def _affordable(self):
+        if self.pair_ms is None:
+            return self.top_n
+        return min(self.top_n, int(self.budget_ms // max(self.pair_ms, 1e-3)))
+
+    # candidates: [(faq, bi-encoder score)] best first. Returns the candidates
+    # in their new order, the cross-encoder scores (None when skipped) and the
+    # reason re-ranking was skipped, if it was.
+    def rerank(self, question, candidates):
+        model = self.model()
+        if model is None:
+            self._stats['skipped_loading'] += 1
+            return candidates, None, 'loading' if self._error is None else 'unavailable'
+        n = min(len(candidates), self._affordable())
+        if n < 2:
+            self._stats['skipped_budget'] += 1
+            # Re-measure now and then so one slow call doesn't disable re-ranking for good
+            if self._stats['skipped_budget'] % self.PROBE_EVERY:
+                return candidates, None, 'budget'
+            n = 2
+        start = time.perf_counter()
+        scores = np.asarray(model.predict([(question, faq['question']) for faq, _ in candidates[:n]]),
+                            dtype=np.float32)
+        elapsed = (time.perf_counter() - start) * 1000
+        self.pair_ms = elapsed / n if self.pair_ms is None else 0.8 * self.pair_ms + 0.2 * elapsed / n
+        self._timings.append(elapsed)
+        self._stats['reranked'] += 1
+        if elapsed > self.budget_ms:
+            self._stats['over_budget'] += 1
+        order = np.argsort(-scores, kind='stable')
+        if order[0] != 0:
+            self._stats['changed_top'] += 1
+        return [candidates[i] for i in order] + candidates[n:], [float(scores[i]) for i in order], None
+
+    def stats(self):
+        timings = np.array(self._timings or [0.0])
+        return {
+            'model': self.model_name,
+            'loaded': self._model is not None,
+            'error': self._error,
+            'top_n': self.top_n,
+            'budget_ms': self.budget_ms,
+            'pair_ms': round(self.pair_ms, 3) if self.pair_ms is not None else None,
+            'affordable_pairs': self._affordable(),
+            'reranked': self._stats['reranked'],
+            'changed_top': self._stats['changed_top'],
+            'over_budget': self._stats['over_budget'],
+            'skipped_budget': self._stats['skipped_budget'],
+            'skipped_loading': self._stats['skipped_loading'],
+            'rerank_ms_p50': round(float(np.percentile(timings, 50)), 2),
+            'rerank_ms_p95': round(float(np.percentile(timings, 95)), 2),
+        }
+
+
+def from_env():
+    if os.environ.get('RERANK_ENABLED', '0') != '1':
+        return None
+    return Reranker(
+        os.environ.get('RERANK_MODEL', 'cross-encoder/ms-marco-MiniLM-L-6-v2'),
+        top_n=int(os.environ.get('RERANK_TOP_N', '5')),
+        budget_ms=float(os.environ.get('RERANK_BUDGET_MS', '150')),
+    )
@@ -0,0 +1,146 @@
+import collections
+
+import numpy as np
+
+from .lexical import top_rows
+from .shards import ShardFailure, StaleSegment
+
+UNCATEGORIZED = ''
+
+
+def category_key(category):
+    return (category or '').strip().casefold()
+
+
+# Dense index over the FAQ question embeddings, partitioned by category.
+# Rows are stored grouped by category, so every partition is a contiguous
+# slice of one matrix: searching a category touches only its own rows and
+# searching everything is still a single matrix-vector product.
+class DenseIndex:
+    def __init__(self, faqs, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        embeddings = embeddings.reshape(len(faqs), -1) if len(faqs) else np.zeros((0, 0), dtype=np.float32)
+        keys = [category_key(faq.get('category')) for faq in faqs]
+        self.names = {}
+        for faq, key in zip(faqs, keys):
+            self.names.setdefault(key, (faq.get('category') or '').strip())
+        order = sorted(range(len(faqs)), key=lambda i: keys[i])
+        self.order = np.array(order, dtype=np.int64)
+        self.matrix = np.ascontiguousarray(embeddings[self.order])
+        counts = collections.Counter(keys)
+        self.slices = {}
+        start = 0
+        for key in sorted(counts):
+            self.slices[key] = slice(start, start + counts[key])
+            start += counts[key]
+        # Category centroids for routing; the uncategorized bucket never routes
+        self.routable = [key for key in sorted(self.slices) if key != UNCATEGORIZED]
+        centroids = [self.matrix[self.slices[key]].mean(axis=0) for key in self.routable]
+        self.centroids = np.array(centroids, dtype=np.float32).reshape(len(centroids), self.matrix.shape[1])
+        if len(self.centroids):
+            self.centroids /= np.maximum(np.linalg.norm(self.centroids, axis=1, keepdims=True), 1e-12)
+
+        self.prior = None
+        self.clusters = None
+        self.searcher = None
+
+    # Feedback calibration (see calibration.py), set before attach().
+    # `prior` is a score offset per FAQ; `clusters` is (centroids, threshold,
+    # indptr, faq indexes, offsets): queries whose nearest centroid is within
+    # threshold also get that cluster's offsets. FAQ indexes are in record order.
+    def calibrate(self, prior, clusters=None):
+        self.prior = np.ascontiguousarray(np.asarray(prior, dtype=np.float32)[self.order])
+        if clusters is not None:
+            centroids, threshold, indptr, rows, offsets = clusters
+            position = np.empty(len(self.order), dtype=np.int64)
+            position[self.order] = np.arange(len(self.order))
+            clusters = (centroids, threshold, indptr, position[rows], offsets)
+        self.clusters = clusters
+
+    # The prior in record order (None when not calibrated)
+    def record_prior(self):
+        if self.prior is None:
+            return None
+        prior = np.empty(len(self.order), dtype=np.float32)
+        prior[self.order] = self.prior
+        return prior
+
+    # (rows, offsets) of the query's cluster override, or None
+    def adjustment(self, query_vector):
+        if self.clusters is None or not len(self.clusters[0]) or len(query_vector) != self.clusters[0].shape[1]:
+            return None
+        centroids, threshold, indptr, rows, offsets = self.clusters
+        similarities = centroids @ query_vector
+        nearest = int(similarities.argmax())
+        if similarities[nearest] < threshold:
+            return None
+        return rows[indptr[nearest]:indptr[nearest + 1]], offsets[indptr[nearest]:indptr[nearest + 1]]
+
+    # Serve full and per-category searches from a shards.ShardedSearch; the
+    # matrix (and prior) move into its shared-memory segment
+    def attach(self, searcher):
+        self.segment = searcher.load(self.matrix, self.prior)
+        self.matrix = self.segment.array
+        if self.prior is not None:
+            self.prior = self.segment.prior
+        self.searcher = searcher
+
+    # Calibrated scores of rows [start, stop)
+    def _scores(self, start, stop, query_vector, adjust):
+        scores = self.matrix[start:stop] @ query_vector
+        if self.prior is not None:
+            scores += self.prior[start:stop]
+        if adjust is not None:
+            rows, offsets = adjust
+            inside = (rows >= start) & (rows < stop)
+            scores[rows[inside] - start] += offsets[inside]
+        return scores
+
+    def __len__(self):
+        return len(self.order)
+
+    def has_category(self, category):
+        return category_key(category) in self.slices
+
+    def categories(self):
+        return [{'category': self.names[key], 'count': self.slices[key].stop - self.slices[key].start}
+                for key in sorted(self.slices) if key != UNCATEGORIZED]
+
+    # Likely categories for a query: centroids within `margin` of the best one
+    def route(self, query_vector, max_categories=2, margin=0.05):
+        if not len(self.centroids):
+            return []
+        scores = self.centroids @ query_vector
+        rows = top_rows(scores, max_categories)
+        return [self.routable[row] for row in rows if scores[row] >= scores[rows[0]] - margin]
+
+    # Returns [(faq index, score)] best first. `categories` limits the search
+    # to those partitions; None searches everything.
+    def search(self, query_vector, top_k=1, categories=None):
+        adjust = self.adjustment(query_vector)
+        if self.searcher is not None:
+            ranges = None
+            if categories is not None:
+                parts = [self.slices.get(category_key(c)) for c in set(categories)]
+                ranges = [(part.start, part.stop) for part in parts if part is not None]
+            try:
+                rows, scores = self.searcher.search(query_vector, top_k, ranges, self.segment.name, adjust)
+                return [(int(self.order[row]), float(score)) for row, score in zip(rows, scores)]
+            except StaleSegment:
+                pass  # a rebuilt index replaced this one mid-query; search our own copy
+            except (ShardFailure, EOFError, OSError):
+                pass  # the shards are down and restarting; search our own copy
+        if categories is None:
+            scores = self._scores(0, len(self.order), query_vector, adjust)
+            rows = top_rows(scores, top_k)
+            return [(int(self.order[row]), float(scores[row])) for row in rows]
+        results = []
+        for key in {category_key(c) for c in categories}:
+            part = self.slices.get(key)
+            if part is None or part.start == part.stop:
+                continue
+            scores = self._scores(part.start, part.stop, query_vector, adjust)
+            for row in top_rows(scores, top_k):
+                results.append((int(self.order[part.start + row]), float(scores[row])))
+        results.sort(key=lambda item: item[1], reverse=True)
+        return results[:top_k]
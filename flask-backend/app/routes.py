@@ -1,603 +1,848 @@
-from flask import Blueprint, request, jsonify, current_app, render_template_string
+from flask import Blueprint, request, jsonify, current_app, render_template, make_response
 import numpy as np
-import json
-from sentence_transformers import SentenceTransformer
 import datetime
-import pdfplumber
 from werkzeug.utils import secure_filename
+import math
 import re
 import os
-import shutil
-import requests as py_requests
-from bs4 import BeautifulSoup
+import threading
+import time
+
+from . import serialization
+from .assets import cached_page
+from .encoders import LazyEncoder, load_encoder
+from . import analytics, bulk, calibration, crawler, feedback, hotset, misses, query_cache, ratelimit, reembed, rerank, shards, snapshot, storage, tenants
+from .lexical import LexicalIndex
+from .retrieval import UNCATEGORIZED, DenseIndex, category_key
+from .streaming import event_stream_response, streamed_json_response, streamed_response
 
 # Create a Blueprint for the app
 main = Blueprint('main', __name__)
 bp = Blueprint('routes', __name__)
 
-# Load the model once at startup
-model = SentenceTransformer('all-MiniLM-L6-v2')
-model_ready = [True]
+# Set EMBEDDING_SOCKET to share one out-of-process model between all workers
+# (python -m app.embedding_service); otherwise each worker loads its own.
+EMBEDDING_SOCKET = os.environ.get('EMBEDDING_SOCKET')
+
+# The encoder (EMBEDDING_MODEL with ENCODER_BACKEND: torch, onnx or
+# onnx-int8) and its index snapshot. After a blue/green upgrade
+# (python -m app.reembed) they come from index_state.json instead, and
+# running workers switch over without a restart.
+active_index = reembed.default_entry() if EMBEDDING_SOCKET else reembed.active_entry()
+MODEL_NAME = active_index['model']
 
-# Load the FAQ data from faqs.json
-with open('faqs.json', encoding='utf-8') as f:
-    FAQS_DATA = json.load(f)
+# The model is loaded on first use (or by the warm-up thread below)
+if EMBEDDING_SOCKET:
+    from .embedding_service import RemoteEncoder
+    model = RemoteEncoder(EMBEDDING_SOCKET)
+else:
+    model = LazyEncoder(lambda: load_encoder(active_index['model'], active_index['backend']))
+model_ready = [True]
+MODEL_ID = reembed.model_id(active_index)
 
-# Precompute embeddings
-question_embeddings_cache = model.encode([item["question"] for item in FAQS_DATA])
+# Query embeddings keyed on normalized text (QUERY_CACHE_* settings)
+query_embedding_cache = query_cache.from_env(MODEL_ID)
+# The encoder and its cache as one value, so a query that overlaps an index
+# switch reads a matching pair (see encode_query)
+query_encoder = (model, query_embedding_cache)
 
 FAQS_PATH = os.path.join(os.path.dirname(__file__), '..', 'faqs.json')
+SNAPSHOT_PATH = reembed.snapshot_path(active_index)
+
+# FAQ records, normalized question embeddings and the trigram + spelling
+# index come from the index snapshot, which is rebuilt (re-encoding the
+# corpus) only when faqs.json or the model changed
+FAQS_DATA, question_embeddings_cache, lexical_index, _ = snapshot.load_or_build(
+    SNAPSHOT_PATH, FAQS_PATH, MODEL_ID, model.encode, storage.load_records)
+
+# With SEARCH_SHARDS > 1, indexes of SHARD_MIN_ENTRIES or more FAQs are
+# searched by that many processes sharing the matrix (see shards.py).
+# Started before the warm-up thread since the shard processes are forked.
+shard_searcher = shards.from_env()
+
+# Load the encoder in the background so the first semantic query doesn't wait
+if os.environ.get('MODEL_WARMUP', '1') == '1' and isinstance(model, LazyEncoder):
+    threading.Thread(target=model.load, name='model-warmup', daemon=True).start()
+
+# Optional cross-encoder second pass (RERANK_* settings), None when disabled
+reranker = rerank.from_env()
+
+# Score offsets learned from feedback (see calibration.py), refitted by the
+# refresher; CALIBRATION_ENABLED=0 ignores them
+CALIBRATION_ENABLED = os.environ.get('CALIBRATION_ENABLED', '1') == '1'
+score_calibration = [None]
+CALIBRATION_STAMP = [None]
+
+def load_calibration():
+    if not CALIBRATION_ENABLED or not os.path.exists(calibration.PATH):
+        return False
+    stamp = snapshot.file_stamp(calibration.PATH)
+    if stamp == CALIBRATION_STAMP[0]:
+        return False
+    try:
+        score_calibration[0] = calibration.Calibration.load(calibration.PATH)
+    except (OSError, ValueError, KeyError):
+        return False
+    CALIBRATION_STAMP[0] = stamp
+    return True
+
+load_calibration()
+
+def build_dense_index(faqs, vectors):
+    index = DenseIndex(faqs, vectors)
+    if score_calibration[0] is not None:
+        index.calibrate(*score_calibration[0].compile(faqs, MODEL_ID))
+    if shard_searcher is not None and len(index) >= shards.SHARD_MIN_ENTRIES:
+        index.attach(shard_searcher)
+    return index
+
+# Category-partitioned copy of the embeddings used for search
+dense_index = build_dense_index(FAQS_DATA, question_embeddings_cache)
+# The records and the indexes built from them as one value, replaced whole
+# after every rebuild. A request reads it once, so the row numbers a search
+# returns always point into the records that search was built from, even
+# while FAQS_DATA is being replaced (see search_answer).
+kb_view = (tuple(FAQS_DATA), dense_index, lexical_index)
+
+# The most asked FAQs, checked before the full index (HOT_* settings);
+# None when HOT_SIZE=0
+hot_set = hotset.from_env()
+if hot_set:
+    hot_set.load(list(FAQS_DATA), question_embeddings_cache, dense_index.record_prior())
+
+# With ROUTE_CATEGORIES=1, large corpora only search the categories whose
+# centroid is closest to the query, plus the uncategorized FAQs
+ROUTE_CATEGORIES = os.environ.get('ROUTE_CATEGORIES', '0') == '1'
+ROUTING_MIN_ENTRIES = int(os.environ.get('ROUTING_MIN_ENTRIES', '5000'))
+
+# Digest of FAQS_DATA, recomputed whenever it changes; used for ETags.
+# Derived from the content, so every worker serving the same records gives
+# the same ETag and different records never share one.
+KB_STAMP = snapshot.file_stamp(FAQS_PATH) if os.path.exists(FAQS_PATH) else 'new'
+kb_digest = [snapshot.records_digest(FAQS_DATA)]
+# Held while FAQS_DATA and the indexes built from it are changed or copied
+kb_lock = threading.RLock()
+
+def update_kb_digest():
+    kb_digest[0] = snapshot.records_digest(FAQS_DATA)
+
+def kb_etag():
+    return f'kb-{kb_digest[0][:32]}'
+
+# Helper: Re-derive embeddings and lexical index after FAQS_DATA changes.
+# Pass `vectors` (normalized, one row per FAQ) when only some rows changed
+# and the caller has already encoded them.
+def rebuild_indexes(vectors=None):
+    global question_embeddings_cache, lexical_index
+    if vectors is None:
+        vectors = snapshot.normalize_rows(model.encode([item["question"] for item in FAQS_DATA]))
+    question_embeddings_cache = vectors
+    lexical_index = LexicalIndex(FAQS_DATA)
+    rebuild_dense_index()
+    update_kb_digest()
+
+def rebuild_dense_index():
+    global dense_index, kb_view
+    dense_index = build_dense_index(FAQS_DATA, question_embeddings_cache)
+    kb_view = (tuple(FAQS_DATA), dense_index, lexical_index)
+    if hot_set:
+        hot_set.load(list(FAQS_DATA), question_embeddings_cache, dense_index.record_prior())
+
+# Refit the calibration when feedback came in (one worker does it) and
+# apply a new one. Runs with the refresher.
+def refresh_calibration():
+    if not CALIBRATION_ENABLED:
+        return
+    calibration.refresh(lambda texts: model.encode(texts), MODEL_ID)
+    if load_calibration():
+        with kb_lock:
+            rebuild_dense_index()
+
+# Questions are encoded IMPORT_BATCH_SIZE at a time when adding FAQs
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '512'))
+IMPORT_MAX_ROWS = int(os.environ.get('IMPORT_MAX_ROWS', '100000'))
 
-# Helper: Load FAQs
+def encode_questions(records):
+    return bulk.encode_batches(model.encode, [item["question"] for item in records], IMPORT_BATCH_SIZE)
+
+# Every save keeps a copy of the previous faqs.json (the newest FAQ_BACKUPS);
+# admin edits within FAQ_FLUSH_DELAY seconds of each other are written once
+FAQ_BACKUPS = int(os.environ.get('FAQ_BACKUPS', '10'))
+FAQ_FLUSH_DELAY = float(os.environ.get('FAQ_FLUSH_DELAY', '0.5'))
+
+# Helper: Load FAQs, falling back to the newest good backup
 def load_faqs():
-    if not os.path.exists(FAQS_PATH):
-        return []
-    with open(FAQS_PATH, 'r', encoding='utf-8') as f:
-        try:
-            return json.load(f)
-        except Exception:
-            return []
+    return storage.load_records(FAQS_PATH)
 
-# Helper: Save FAQs
+# Helper: Save FAQs (locked, atomic rename, rotating backups)
 def save_faqs(faqs):
-    with open(FAQS_PATH, 'w', encoding='utf-8') as f:
-        json.dump(faqs, f, ensure_ascii=False, indent=2)
+    storage.save_records(FAQS_PATH, faqs, FAQ_BACKUPS)
+
+def backup_faqs():
+    return storage.backup(FAQS_PATH, FAQ_BACKUPS)
+
+# FAQ changes this worker hasn't written yet. A write replays them onto
+# the current faqs.json under its lock instead of overwriting it with this
+# worker's copy, so edits made through other workers are kept.
+kb_changes = storage.PendingChanges()
+
+# Helper: Make FAQS_DATA the records from faqs.json plus this worker's
+# unwritten changes, encoding only questions it hasn't embedded yet.
+# Returns True when anything changed.
+def sync_records(records):
+    with kb_lock:
+        known = {faq.get('question') for faq in FAQS_DATA}
+    missing = list(dict.fromkeys(r.get('question', '') for r in records if r.get('question') not in known))
+    encoded = dict(zip(missing, encode_questions([{'question': q} for q in missing]))) if missing else {}
+    with kb_lock:
+        merged = storage.apply_changes(records, kb_changes.pending())
+        if merged == FAQS_DATA:
+            return False
+        rows = {faq.get('question'): row for row, faq in enumerate(FAQS_DATA)}
+        # Questions that arrived while encoding (rare) are encoded here
+        late = list(dict.fromkeys(r.get('question', '') for r in merged
+                                  if r.get('question') not in rows and r.get('question') not in encoded))
+        if late:
+            encoded.update(zip(late, encode_questions([{'question': q} for q in late])))
+        vectors = [question_embeddings_cache[rows[q]] if q in rows else encoded[q]
+                   for q in (r.get('question', '') for r in merged)]
+        FAQS_DATA[:] = merged
+        rebuild_indexes(np.vstack(vectors) if vectors else question_embeddings_cache[:0])
+    return True
+
+# Helper: Write the pending changes into faqs.json, adopt what other
+# workers wrote, and write a matching index snapshot. Changes whose write
+# fails go back in the queue and the coalescer retries.
+def write_knowledge_base():
+    changes = kb_changes.take()
+    try:
+        records = storage.update_records(FAQS_PATH, lambda current: storage.apply_changes(current, changes),
+                                         FAQ_BACKUPS)
+    except BaseException:
+        kb_changes.restore(changes)
+        raise
+    sync_records(records)
+    with kb_lock:
+        if len(kb_changes) or FAQS_DATA != records:
+            return  # newer changes are pending; their write brings the snapshot up to date
+        vectors, lexical = question_embeddings_cache, lexical_index
+    snapshot.write(SNAPSHOT_PATH, records, vectors, lexical, MODEL_ID, snapshot.file_stamp(FAQS_PATH))
+
+kb_writer = storage.WriteCoalescer(write_knowledge_base, FAQ_FLUSH_DELAY)
+
+def save_knowledge_base():
+    kb_writer.schedule()
+
+# Other workers' writes are picked up when faqs.json changes, checked at
+# most every KB_CHECK_INTERVAL seconds before a request is handled
+KB_CHECK_INTERVAL = float(os.environ.get('KB_CHECK_INTERVAL', '1'))
+KB_FILE_STAMP = [KB_STAMP if os.path.exists(FAQS_PATH) else None]
+_kb_checked = [0.0]
+_kb_reload_lock = threading.Lock()
+
+def kb_check_due():
+    return time.monotonic() - _kb_checked[0] >= KB_CHECK_INTERVAL
+
+def reload_if_changed(force=False):
+    if not force and not kb_check_due():
+        return False
+    if not _kb_reload_lock.acquire(blocking=False):
+        return False
+    try:
+        _kb_checked[0] = time.monotonic()
+        try:
+            stamp = snapshot.file_stamp(FAQS_PATH)
+        except OSError:
+            return False
+        if stamp == KB_FILE_STAMP[0]:
+            return False
+        # Stamp first: a write after it is seen by the next check
+        KB_FILE_STAMP[0] = stamp
+        return sync_records(storage.load_records(FAQS_PATH))
+    finally:
+        _kb_reload_lock.release()
+
+@bp.before_request
+def check_knowledge_base():
+    reload_if_changed()
 
 # Helper: Find answer in local faqs
-def find_answer(question):
-    faqs = load_faqs()
+def find_answer(question, category=None):
+    with kb_lock:
+        faqs = list(FAQS_DATA)
     for faq in faqs:
+        if category and category_key(faq.get('category')) != category_key(category):
+            continue
         if question.lower() in faq.get('question', '').lower():
             return faq.get('answer')
     return None
 
-# Scrape CUT website for FAQ-like info
+# Helper: Add records to the knowledge base, encoding only the new rows.
+# Everything is encoded before the lock is taken, then the rows and indexes
+# change together, and the result is persisted with a single write.
+def ingest_faqs(records):
+    if not records:
+        return
+    vectors = encode_questions(records)
+    with kb_lock:
+        kb_changes.add(records)
+        FAQS_DATA.extend(records)
+        rebuild_indexes(np.vstack([question_embeddings_cache.reshape(-1, vectors.shape[1]), vectors]))
+    save_knowledge_base()
+
+# Crawl state (content hashes, ETags) lives next to faqs.json so pages that
+# haven't changed since the last crawl are skipped (CRAWL_* settings)
+CRAWL_STATE_PATH = os.environ.get('CRAWL_STATE_PATH') or os.path.join(os.path.dirname(__file__), '..', 'crawl_state.json')
+
+# Crawl the CUT website and add passages from new or changed pages
 def scrape_cut_website():
-    url = 'https://cut.ac.zw/'
-    response = py_requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
-    # Example: Extract all text from <p> tags (customize as needed)
-    paragraphs = soup.find_all('p')
-    faqs = load_faqs()
+    state = crawler.load_state(CRAWL_STATE_PATH)
+    passages = crawler.from_env(state).crawl()
+    with kb_lock:
+        answers = {f.get('answer') for f in FAQS_DATA}
     new_faqs = []
-    for p in paragraphs:
-        text = p.get_text(strip=True)
-        if text and len(text) > 30 and text not in [f['answer'] for f in faqs]:
-            new_faqs.append({'question': text[:50] + '...', 'answer': text})
-    if new_faqs:
-        faqs.extend(new_faqs)
-        save_faqs(faqs)
+    for passage in passages:
+        if passage['answer'] not in answers:
+            answers.add(passage['answer'])
+            new_faqs.append(passage)
+    ingest_faqs(new_faqs)
+    crawler.save_state(CRAWL_STATE_PATH, state)
     return new_faqs
 
-def search_answer(question, faqs_data, embeddings_cache, top_k=1):
-    question_embedding = model.encode([question])
-    similarities = np.dot(embeddings_cache, question_embedding[0])
-    top_indices = np.argsort(similarities)[::-1][:top_k]
-    results = []
-    for idx in top_indices:
-        results.append((faqs_data[idx], similarities[idx]))
-    return results
+# Scrape status, shared by /scrape/status and the async entry point
+SCRAPE_MIN_INTERVAL = float(os.environ.get('SCRAPE_MIN_INTERVAL', '300'))
+SCRAPE_STATUS = {'running': False, 'runs': 0, 'last_started': None, 'last_finished': None,
+                 'last_added': 0, 'last_error': None}
+_scrape_lock = threading.Lock()
+_last_scrape = [0.0]
 
-@bp.route('/model_status')
-def model_status():
-    return jsonify({'ready': model_ready[0]})
-
-HTML_PAGE = """<!DOCTYPE html>
-<html>
-<head>
-  <title>CUT | FAQ Chatbot </title>
-  <meta name="viewport" content="width=device-width, initial-scale=1">
-  <link rel="icon" type="image/png" href="{{ url_for('static', filename='assets/images/favicon.png') }}">
-  <style>
-    :root {
-      --bg: url('{{ url_for('static', filename='assets/images/background.jpg') }}') center/cover no-repeat fixed, linear-gradient(135deg, #e0e7ff 0%, #f4f7fa 100%);
-      --bubble-bot: #f1f5fb;
-      --bubble-user: #2563eb;
-      --bubble-shadow: 0 2px 8px rgba(0,0,0,0.07);
-      --text: #222;
-      --bot-avatar-bg: #2563eb;
-      --bot-avatar-color: #fff;
-    }
-    body {
-      background: var(--bg);
-      color: var(--text);
-      font-family: 'Segoe UI', Arial, sans-serif;
-      margin: 0;
-      min-height: 100vh;
-      display: flex;
-      flex-direction: column;
-      align-items: center;
-      transition: background 0.3s;
-    }
-    h1 {
-      margin-top: 40px;
-      color: #222;
-      font-weight: 700;
-      letter-spacing: 1px;
-      text-shadow: 0 2px 8px rgba(0,0,0,0.04);
-    }
-    #headman {
-      /* Default color, will be overridden in dark mode */
-      color: #222;
-    }
-    #chatbox {
-      width: 100%;
-      max-width: 420px;
-      background: rgba(255, 255, 255, 0.55); /* semi-transparent white */
-      border-radius: 18px;
-      box-shadow: 0 4px 24px rgba(0,0,0,0.10);
-      padding: 28px 18px 18px 18px;
-      margin: 30px 0 0 0;
-      min-height: 340px;
-      display: flex;
-      flex-direction: column;
-      gap: 14px;
-      overflow-y: auto;
-      transition: box-shadow 0.2s;
-      backdrop-filter: blur(12px); /* glass effect */
-      -webkit-backdrop-filter: blur(12px); /* Safari support */
-    }
-    .bubble {
-      max-width: 80%;
-      padding: 14px 20px;
-      border-radius: 22px;
-      margin-bottom: 6px;
-      font-size: 1rem;
-      line-height: 1.6;
-      word-break: break-word;
-      display: flex;
-      align-items: flex-end;
-      box-shadow: var(--bubble-shadow);
-      position: relative;
-      opacity: 0;
-      animation: fadeIn 0.4s forwards;
-    }
-    @keyframes fadeIn {
-      to { opacity: 1; }
-    }
-    .user {
-      align-self: flex-end;
-      background: var(--bubble-user);
-      color: #fff;
-      border-bottom-right-radius: 8px;
-      justify-content: flex-end;
-    }
-    .bot {
-      align-self: flex-start;
-      background: var(--bubble-bot);
-      color: var(--text);
-      border-bottom-left-radius: 8px;
-      justify-content: flex-start;
-    }
-    .bot-avatar {
-      width: 32px;
-      height: 32px;
-      background: var(--bot-avatar-bg);
-      color: var(--bot-avatar-color);
-      border-radius: 50%;
-      display: flex;
-      align-items: center;
-      justify-content: center;
-      font-size: 1.3em;
-      margin-right: 10px;
-      flex-shrink: 0;
-      box-shadow: 0 1px 4px rgba(37,99,235,0.10);
-    }
-    .bubble-content {
-      flex: 1;
-    }
-    .copy-btn {
-      background: none;
-      border: none;
-      color: #2563eb;
-      font-size: 0.9em;
-      cursor: pointer;
-      margin-left: 8px;
-      padding: 0;
-      transition: color 0.2s;
-    }
-    .copy-btn:hover {
-      color: #1e40af;
-    }
-    .timestamp {
-      font-size: 0.75em;
-      color: #888;
-      margin-top: 4px;
-      margin-left: 2px;
-    }
-    #inputArea {
-      width: 100%;
-      max-width: 420px;
-      display: flex;
-      gap: 8px;
-      margin-top: 18px;
-      align-items: center;
-    }
-    #questionInput {
-      flex: 1;
-      padding: 13px;
-      border-radius: 10px;
-      border: 1.5px solid #c7d2fe;
-      font-size: 1rem;
-      outline: none;
-      transition: border 0.2s;
-      background: #f8fafc;
-    }
-    #questionInput:focus {
-      border: 1.5px solid #2563eb;
-      background: #fff;
-    }
-    #sendBtn {
-      background: #2563eb;
-      color: #fff;
-      border: none;
-      border-radius: 10px;
-      padding: 0 22px;
-      font-size: 1rem;
-      cursor: pointer;
-      transition: background 0.2s;
-      height: 44px;
-    }
-    #sendBtn:disabled {
-      background: #a5b4fc;
-      cursor: not-allowed;
-    }
-    #sendBtn:hover:not(:disabled) {
-      background: #1e40af;
-    }
-    #faqSuggestions {
-      margin-top: 18px;
-      font-size: 0.98rem;
-      color: #555;
-      width: 100%;
-      max-width: 420px;
-      display: flex;
-      flex-wrap: wrap;
-      gap: 8px;
-      align-items: center;
-    }
-    #faqSuggestions button {
-      background: #e0e7ff;
-      color: #2563eb;
-      border: 1px solid #c7d2fe;
-      border-radius: 8px;
-      padding: 8px 12px;
-      cursor: pointer;
-      transition: background 0.2s, color 0.2s;
-      font-size: 0.98em;
-    }
-    #faqSuggestions button:hover {
-      background: #c7d2fe;
-      color: #1e40af;
-    }
-    #themeToggle {
-      position: absolute;
-      top: 18px;
-      right: 18px;
-      background: #fff;
-      border: none;
-      border-radius: 50%;
-      width: 38px;
-      height: 38px;
-      font-size: 1.3em;
-      box-shadow: 0 2px 8px rgba(0,0,0,0.07);
-      cursor: pointer;
-      transition: background 0.2s;
-    }
-    #themeToggle:hover {
-      background: #e0e7ff;
-    }
-    @media (max-width: 500px) {
-      #chatbox, #inputArea, #faqSuggestions {
-        max-width: 98vw;
-        padding: 0 2vw;
-      }
-      h1 {
-        font-size: 1.2em;
-      }
-    }
-    body.dark {
-      --bg: url('{{ url_for('static', filename='assets/images/background.jpg') }}') center/cover no-repeat fixed, linear-gradient(135deg, #23272a 0%, #181a1b 100%);
-      --bubble-bot: #23272a;
-      --bubble-user: #1e40af;
-      --text: #f4f7fa;
-      --bot-avatar-bg: #1e40af;
-      --bot-avatar-color: #fff;
-    }
-    body.dark #chatbox {
-      background: rgba(24, 26, 27, 0.55); /* semi-transparent dark */
-      box-shadow: 0 4px 24px rgba(0,0,0,0.25);
-      backdrop-filter: blur(12px);
-      -webkit-backdrop-filter: blur(12px);
-    }
-    body.dark #questionInput {
-      background: #23272a;
-      color: #f4f7fa;
-      border: 1.5px solid #374151;
-    }
-    body.dark #questionInput:focus {
-      background: #181a1b;
-      border: 1.5px solid #2563eb;
-    }
-    body.dark #sendBtn {
-      background: #1e40af;
-    }
-    body.dark #sendBtn:hover:not(:disabled) {
-      background: #2563eb;
-    }
-    body.dark #faqSuggestions button {
-      background: #23272a;
-      color: #a5b4fc;
-      border: 1px solid #374151;
-    }
-    body.dark #faqSuggestions button:hover {
-      background: #1e293b;
-      color: #fff;
-    }
-    body.dark #themeToggle {
-      background: #23272a;
-      color: #a5b4fc;
-    }
-    body.dark #themeToggle:hover {
-      background: #1e293b;
-    }
-    body.dark #headman {
-      color: #222;
-    }
-
-    /* Responsive styles for mobile */
-    @media (max-width: 600px) {
-      #chatbox,
-      #inputArea,
-      #faqSuggestions {
-        max-width: 98vw;
-        width: 98vw;
-        padding-left: 2vw;
-        padding-right: 2vw;
-        min-width: 0;
-      }
-      h1 {
-        font-size: 1.1em;
-        margin-top: 18px;
-      }
-      #chatbox {
-        padding: 18px 6px 12px 6px;
-        min-height: 220px;
-      }
-      #inputArea {
-        gap: 4px;
-      }
-      #faqSuggestions {
-        font-size: 0.95em;
-        gap: 4px;
-      }
-      .bubble {
-        font-size: 0.98em;
-        padding: 10px 12px;
-      }
-      .bot-avatar {
-        width: 26px;
-        height: 26px;
-        font-size: 1em;
-        margin-right: 6px;
-      }
-    }
-    body.dark form textarea,
-body.dark form input,
-body.dark form select {
-  background: #23272a;
-  color: var(--text);
-  border: 1.5px solid #374151;
-}
-body.dark form textarea:focus,
-body.dark form input:focus,
-body.dark form select:focus {
-  background: #181a1b;
-  border: 1.5px solid var(--primary-dark);
-}
-  </style>
-</head>
-<body>
-  <h1 id="headman">CUT CHATBOT</h1>
-  <button id="themeToggle" title="Toggle theme">🌙</button>
-  <div id="chatbox"></div>
-  <div id="inputArea">
-    <input id="questionInput" placeholder="Type your question..." onkeydown="if(event.key==='Enter'){sendQuestion();}" aria-label="Type your question" autocomplete="off" />
-    <button id="sendBtn" onclick="sendQuestion()">Send</button>
-  </div>
-  <div id="faqSuggestions">
-    <strong style="margin-right:8px;">Popular:</strong>
-    <button onclick="quickAsk('How do I retrieve my reg number?')">How do I retrieve my reg number?</button>
-    <button onclick="quickAsk('How do I accept my offer?')">How do I accept my offer?</button>
-    <button onclick="quickAsk('How do I create a strong recommended password ?')">Strong password?</button>
-    <button onclick="quickAsk('I cannot log in into the system?')">Cannot log in?</button>
-  </div>
-  <div id="loadingOverlay" style="position:fixed;top:0;left:0;width:100vw;height:100vh;display:flex;align-items:center;justify-content:center;background:#fff;z-index:9999;">
-  <h2 style="text-align:center;">Loading AI model, please wait...</h2>
-</div>
-  <div id="toast" style="position:fixed;bottom:30px;left:50%;transform:translateX(-50%);background:#2563eb;color:#fff;padding:12px 24px;border-radius:8px;display:none;z-index:9999;font-size:1.1em;"></div>
-  <script src="https://cdn.jsdelivr.net/npm/marked/marked.min.js"></script>
-  <script>
-    const chatbox = document.getElementById('chatbox');
-    const input = document.getElementById('questionInput');
-    const sendBtn = document.getElementById('sendBtn');
-    sendBtn.disabled = true;
-
-    function addBubble(text, sender) {
-      const bubble = document.createElement('div');
-      bubble.className = 'bubble ' + sender;
-      if (sender === 'bot') {
-        // Bot avatar
-        const avatar = document.createElement('div');
-        avatar.className = 'bot-avatar';
-        avatar.innerText = '🤖';
-        bubble.appendChild(avatar);
-
-        // Bubble content
-        const content = document.createElement('div');
-        content.className = 'bubble-content';
-        content.innerHTML = marked.parse(text);
-
-        // Copy button
-        const copyBtn = document.createElement('button');
-        copyBtn.className = 'copy-btn';
-        copyBtn.innerText = 'Copy';
-        copyBtn.onclick = () => {
-          navigator.clipboard.writeText(content.innerText);
-          copyBtn.innerText = 'Copied!';
-          setTimeout(() => copyBtn.innerText = 'Copy', 1000);
-        };
-        content.appendChild(copyBtn);
-
-        // Timestamp
-        const time = document.createElement('div');
-        time.className = 'timestamp';
-        time.innerText = new Date().toLocaleTimeString();
-        content.appendChild(time);
-
-        bubble.appendChild(content);
-      } else {
-        bubble.innerText = text;
-        const time = document.createElement('div');
-        time.className = 'timestamp';
-        time.innerText = new Date().toLocaleTimeString();
-        bubble.appendChild(time);
-      }
-      chatbox.appendChild(bubble);
-      chatbox.scrollTop = chatbox.scrollHeight;
-    }
-
-    function showTyping() {
-      const typing = document.createElement('div');
-      typing.id = 'typing-indicator';
-      typing.className = 'bubble bot';
-      typing.innerHTML = '<div class="bot-avatar">🤖</div><div class="bubble-content">Bot is typing...</div>';
-      chatbox.appendChild(typing);
-      chatbox.scrollTop = chatbox.scrollHeight;
-    }
-    function hideTyping() {
-      const typing = document.getElementById('typing-indicator');
-      if (typing) typing.remove();
-    }
-
-    async function sendQuestion() {
-      const question = input.value.trim();
-      if (!question) return;
-      addBubble(question, 'user');
-      input.value = '';
-      showTyping();
-      sendBtn.disabled = true;
-      try {
-        const res = await fetch('/ask', {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({ question })
-        });
-        let data;
-        try {
-          data = await res.json();
-        } catch (e) {
-          data = { answer: "Sorry, something went wrong. Please try again later." };
-        }
-        hideTyping();
-        addBubble(data.answer, 'bot');
-      } catch (e) {
-        hideTyping();
-        addBubble("Sorry, something went wrong. Please try again later.", 'bot');
-      }
-      sendBtn.disabled = false;
-      input.focus();
-    }
-
-    function quickAsk(question) {
-      input.value = question;
-      sendQuestion();
-    }
-
-    // Enable send button only if input is not empty
-    input.addEventListener('input', () => {
-      sendBtn.disabled = input.value.trim().length === 0;
-    });
-
-    // Theme toggle
-    const themeToggle = document.getElementById('themeToggle');
-    let darkMode = false;
-    themeToggle.onclick = () => {
-      darkMode = !darkMode;
-      if (darkMode) {
-        document.body.classList.add('dark');
-        themeToggle.innerHTML = '☀️';
-        localStorage.setItem('darkMode', 'true');
-      } else {
-        document.body.classList.remove('dark');
-        themeToggle.innerHTML = '🌙';
-        localStorage.setItem('darkMode', 'false');
-      }
-    };
-    // Load dark mode preference
-    window.onload = () => {
-      const darkModePreference = localStorage.getItem('darkMode');
-      if (darkModePreference === 'true') {
-        darkMode = true;
-        document.body.classList.add('dark');
-        themeToggle.innerHTML = '☀️';
-      } else {
-        darkMode = false;
-        document.body.classList.remove('dark');
-        themeToggle.innerHTML = '🌙';
-      }
-      if (!chatbox.innerHTML) {
-        addBubble("Hi! I'm your CUT FAQ assistant. Ask me anything about the application process.", 'bot');
-      }
-      input.focus();
-    };
-
-    async function waitForModel() {
-      let ready = false;
-      const overlay = document.getElementById('loadingOverlay');
-      while (!ready) {
-        const res = await fetch('/model_status');
-        const data = await res.json();
-        ready = data.ready;
-        if (!ready) {
-          overlay.style.display = 'flex';
-          await new Promise(r => setTimeout(r, 1500));
-        }
-      }
-      overlay.style.display = 'none';
-    }
-
-    function showToast(msg, color="#2563eb") {
-  const toast = document.getElementById('toast');
-  toast.textContent = msg;
-  toast.style.background = color;
-  toast.style.display = 'block';
-  setTimeout(() => { toast.style.display = 'none'; }, 2200);
+# Crawl the website and record how it went; one crawl at a time
+def run_scrape():
+    with _scrape_lock:
+        SCRAPE_STATUS.update(running=True, last_started=datetime.datetime.now().isoformat())
+        added = 0
+        try:
+            added = len(scrape_cut_website())
+            SCRAPE_STATUS['last_error'] = None
+        except Exception as e:
+            SCRAPE_STATUS['last_error'] = str(e)
+        _last_scrape[0] = time.monotonic()
+        SCRAPE_STATUS.update(running=False, runs=SCRAPE_STATUS['runs'] + 1, last_added=added,
+                             last_finished=datetime.datetime.now().isoformat())
+        return added
+
+# Start a crawl on a background thread, unless one is running or the last
+# one finished less than SCRAPE_MIN_INTERVAL ago. Requests never wait for
+# it: what it finds is ingested and answers later questions.
+_scrape_start_lock = threading.Lock()
+
+def request_scrape():
+    with _scrape_start_lock:
+        if SCRAPE_STATUS['running'] or (SCRAPE_STATUS['runs']
+                                        and time.monotonic() - _last_scrape[0] < SCRAPE_MIN_INTERVAL):
+            return False
+        SCRAPE_STATUS['running'] = True
+    threading.Thread(target=run_scrape, name='scrape', daemon=True).start()
+    return True
+
+# Overload protection for /ask: a token bucket per client (RATE_LIMIT_*)
+# and an adaptive cap on concurrent inference (SHED_*)
+rate_limiter = ratelimit.limiter_from_env()
+shedder = ratelimit.shedder_from_env()
+# Minimum trigram score for the lexical-only answers given while shedding
+DEGRADED_THRESHOLD = float(os.environ.get('DEGRADED_THRESHOLD', '0.6'))
+OVERLOADED = {'answer': "We're getting a lot of questions right now. Please try again in a moment.",
+              'source': 'none', 'degraded': True}
+RATE_LIMITED = {'status': 'error', 'message': 'Too many requests',
+                'answer': "You're asking questions too quickly. Please wait a moment and try again."}
+
+# Helper: Embed a user query (normalized, as the index rows are), reusing the
+# vector of any equivalent wording. Raises ratelimit.Overloaded when it would
+# need the model and no slot is free.
+def encode_query(question):
+    # Read once: a vector from one model must never land in another's cache
+    encoder, cache = query_encoder
+    key = query_cache.normalize_query(question)
+    vector = cache.get(key)
+    if vector is None:
+        vector = snapshot.normalize_rows(shedder.run(encoder.encode, [key or question]))[0]
+        cache.put(key, vector)
+    return vector
+
+# Embed the uncached ones among several questions in one encoder call, so
+# answering them one by one afterwards only hits the cache. Exact matches
+# never need the encoder and are skipped.
+def prefetch_query_vectors(questions):
+    encoder, cache = query_encoder
+    keys = []
+    for question in questions:
+        key = query_cache.normalize_query(question)
+        if key and key not in keys and not lexical_index.match(question) and cache.get(key) is None:
+            keys.append(key)
+    if keys:
+        for key, vector in zip(keys, snapshot.normalize_rows(shedder.run(encoder.encode, keys))):
+            cache.put(key, vector)
+
+def search_categories(vector, category=None):
+    if category:
+        return [category]
+    if ROUTE_CATEGORIES and len(dense_index) >= ROUTING_MIN_ENTRIES:
+        return dense_index.route(vector) + [UNCATEGORIZED]
+    return None
+
+def search_answer(question, top_k=1, category=None, timings=None):
+    start = time.perf_counter()
+    records, index, _ = kb_view
+    vector = encode_query(question)
+    if len(vector) != index.matrix.shape[1]:
+        # The index was switched to another model while this query was encoding
+        records, index, _ = kb_view
+        vector = encode_query(question)
+    encoded = time.perf_counter()
+    results = index.search(vector, top_k, search_categories(vector, category))
+    if timings is not None:
+        timings['encode_ms'] = round((encoded - start) * 1000, 2)
+        timings['search_ms'] = round((time.perf_counter() - encoded) * 1000, 2)
+    return [(records[idx], score) for idx, score in results]
+
+# Minimum cosine similarity for a semantic match to count as an answer
+ANSWER_THRESHOLD = float(os.environ.get('ANSWER_THRESHOLD', '0.5'))
+NOT_FOUND = {'answer': "Sorry, I couldn't find an answer.", 'source': 'none'}
+
+# Answer from the local knowledge base only (substring, then semantic search).
+# This is the CPU-bound part of /ask.
+# Exact or near-exact (spelling-tolerant) match: microseconds, no encoder
+def fast_answer(question, category=None):
+    records, _, lexical = kb_view
+    match = lexical.match(question)
+    if match:
+        idx, score, _ = match
+        if category and category_key(records[idx].get('category')) != category_key(category):
+            return None
+        return {'answer': records[idx]['answer'], 'source': 'lexical', 'score': score}
+    return None
+
+def lookup_answer(question, category=None, try_fast=True):
+    result = fast_answer(question, category) if try_fast else None
+    if result:
+        return result
+    answer = find_answer(question, category)
+    if answer:
+        return {'answer': answer, 'source': 'local'}
+    return semantic_answer(question, category)
+
+# Semantic search, then the optional re-ranking pass; falls back to a
+# lexical answer when the encoder is saturated
+def semantic_answer(question, category=None):
+    if not len(dense_index):
+        return None
+    timings = {}
+    try:
+        results = search_answer(question, reranker.top_n if reranker else 1, category, timings)
+    except ratelimit.Overloaded:
+        return degraded_answer(question, category)
+    # Only candidates that would pass on their own are re-ranked
+    results = [(faq, score) for faq, score in results if score >= ANSWER_THRESHOLD]
+    if not results:
+        return None
+    result = {'source': 'semantic'}
+    if reranker and not shedder.saturated():
+        start = time.perf_counter()
+        results, rerank_scores, skipped = reranker.rerank(question, results)
+        timings['rerank_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        if rerank_scores:
+            result['rerank_score'] = rerank_scores[0]
+        else:
+            timings['rerank_skipped'] = skipped
+        result['timings'] = timings
+    faq, score = results[0]
+    result.update(answer=faq['answer'], score=score)
+    return result
+
+# Best lexical match when the encoder is saturated; raises Overloaded if
+# there is nothing good enough to answer with
+def degraded_answer(question, category=None):
+    records, _, lexical = kb_view
+    for idx, score in lexical.search(question, 5):
+        if score < DEGRADED_THRESHOLD:
+            break
+        if not category or category_key(records[idx].get('category')) == category_key(category):
+            return {'answer': records[idx]['answer'], 'source': 'lexical', 'score': score, 'degraded': True}
+    raise ratelimit.Overloaded()
+
+# Reply to a question nothing answered. Without a category filter (scraped
+# passages have none) it also starts a website crawl in the background and
+# says so.
+SCRAPING = {'answer': "Sorry, I couldn't find an answer yet. I'm checking the university website, "
+                      "so please ask again in a minute.", 'source': 'none', 'scraping': True}
+
+def missing_answer(category=None):
+    if not category and (request_scrape() or SCRAPE_STATUS['running']):
+        return SCRAPING
+    return NOT_FOUND
+
+# Answers carry a token that /feedback requires (see feedback.py)
+answer_signer = feedback.signer_from_env()
+
+def signed(question, result):
+    return dict(result, token=answer_signer.sign(question, result['answer']))
+
+def call(fn, *args):
+    return fn(*args)
+
+# Full /ask pipeline over the local knowledge base: (body, status), where
+# body is a dict, or pre-rendered JSON bytes for a hot tier answer (only
+# with `hot`). Exact matches come first and need no encoder. `degrade`
+# answers lexically instead of encoding (the ASGI front end sets it when
+# its encode queue is full). Logging goes through defer(fn, *args), which
+# runs it right away unless the caller hands it to another thread.
+def answer_question(question, category=None, degrade=False, defer=call, hot=True):
+    try:
+        result = fast_answer(question, category)
+        if not result and degrade:
+            result = degraded_answer(question, category)
+        if not result:
+            body = hot_response(question, category, defer) if hot else None
+            if body is not None:
+                return body, 200
+            result = lookup_answer(question, category, False)
+    except ratelimit.Overloaded:
+        defer(log_question, question, 'shed')
+        return OVERLOADED, 503
+    defer(log_answer, question, result)
+    if result:
+        return signed(question, result), 200
+    return missing_answer(category), 404
+
+# /ask/stream sends a trigram guess scoring at least PRELIMINARY_THRESHOLD
+# before the encoder runs, and up to STREAM_RELATED other FAQs scoring at
+# least RELATED_THRESHOLD after the answer
+PRELIMINARY_THRESHOLD = float(os.environ.get('PRELIMINARY_THRESHOLD', '0.4'))
+STREAM_RELATED = int(os.environ.get('STREAM_RELATED', '3'))
+RELATED_THRESHOLD = float(os.environ.get('RELATED_THRESHOLD', '0.35'))
+
+def preliminary_answer(question, category=None):
+    records, _, lexical = kb_view
+    for idx, score in lexical.search(question, 5):
+        if score < PRELIMINARY_THRESHOLD:
+            break
+        if not category or category_key(records[idx].get('category')) == category_key(category):
+            return {'answer': records[idx]['answer'], 'source': 'lexical', 'score': score}
+    return None
+
+# Other FAQs close to the question (the query vector is cached by then)
+def related_faqs(question, category=None, answer=None):
+    if not STREAM_RELATED or not len(dense_index):
+        return []
+    try:
+        results = search_answer(question, STREAM_RELATED + 1, category)
+    except ratelimit.Overloaded:
+        return []
+    return [{'question': faq['question'], 'category': faq.get('category', ''), 'score': score}
+            for faq, score in results
+            if score >= RELATED_THRESHOLD and faq['answer'] != answer][:STREAM_RELATED]
+
+# The /ask pipeline as (event, data) pairs, cheapest stage first:
+#   preliminary  trigram guess, only when there's no exact match
+#   answer       what /ask would return, plus its status code
+#   related      other FAQs close to the question
+#   done         end of the stream
+def stream_answer(question, category=None):
+    result = fast_answer(question, category) or hot_answer(question, category)
+    if not result:
+        answer = find_answer(question, category)
+        if answer:
+            result = {'answer': answer, 'source': 'local'}
+    if not result:
+        guess = preliminary_answer(question, category)
+        if guess:
+            yield 'preliminary', guess
+        try:
+            result = semantic_answer(question, category)
+        except ratelimit.Overloaded:
+            log_question(question, 'shed')
+            yield 'answer', dict(OVERLOADED, status=503)
+            yield 'done', {}
+            return
+    if result:
+        yield 'answer', dict(signed(question, result), status=200)
+    else:
+        yield 'answer', dict(missing_answer(category), status=404)
+    related = related_faqs(question, category, result and result['answer'])
+    if related:
+        yield 'related', {'faqs': related}
+    log_answer(question, result)
+    yield 'done', {}
+
+# Named knowledge bases (one per faculty or department) under TENANTS_DIR,
+# loaded on demand and kept resident within TENANT_MEMORY_MB. They share
+# the encoder, query cache, re-ranker and load shedding with the default
+# knowledge base above, which is always resident.
+tenant_registry = tenants.from_env(MODEL_ID, lambda texts: model.encode(texts))
+
+# Same local pipeline as lookup_answer() for one tenant (no website fallback)
+def tenant_answer(kb, question, category=None):
+    result = kb.fast_answer(question, category)
+    if result or not len(kb):
+        return result
+    try:
+        vector = encode_query(question)
+    except ratelimit.Overloaded:
+        result = kb.lexical_answer(question, category, DEGRADED_THRESHOLD)
+        if result:
+            return result
+        raise
+    results = [(faq, score) for faq, score in kb.search(vector, reranker.top_n if reranker else 1, category)
+               if score >= ANSWER_THRESHOLD]
+    if not results:
+        return None
+    result = {'source': 'semantic'}
+    if reranker and not shedder.saturated():
+        results, rerank_scores, _ = reranker.rerank(question, results)
+        if rerank_scores:
+            result['rerank_score'] = rerank_scores[0]
+    faq, score = results[0]
+    result.update(answer=faq['answer'], score=score)
+    return result
+
+# Helper: Append "<timestamp> - [<source>] <question>" to question_log.txt;
+# source 'none' marks a question nobody could answer
+QUESTION_LOG = 'question_log.txt'
+_question_log_lock = threading.Lock()
+
+def log_question(question, source):
+    line = f"{datetime.datetime.now().isoformat()} - [{source}] {' '.join(question.split())}\n"
+    with _question_log_lock, open(QUESTION_LOG, 'a', encoding='utf-8') as f:
+        f.write(line)
+
+# Unanswered questions with their embeddings and closest FAQ, mined into
+# suggested FAQs for the admin panel
+miss_log = misses.MissLog(os.environ.get('MISSES_DIR', 'misses'))
+
+def record_miss(question):
+    records, index, _ = kb_view
+    vector = encode_query(question)
+    best = index.search(vector, 1) if len(index) and len(vector) == index.matrix.shape[1] else []
+    if best:
+        idx, score = best[0]
+        miss_log.record(question, vector, score, records[idx]['question'])
+    else:
+        miss_log.record(question, vector)
+
+def log_answer(question, result):
+    log_question(question, (result or NOT_FOUND)['source'])
+    if result and hot_set:
+        hot_set.hit(result['answer'])
+    if not result and question.strip():
+        try:
+            record_miss(question)
+        except ratelimit.Overloaded:
+            pass
+
+def scrape_status():
+    return dict(SCRAPE_STATUS, faqs=len(FAQS_DATA), kb_version=kb_etag())
+
+# Helper: Append a feedback record to feedback_log.txt
+def write_feedback(data, signed=True):
+    with open(feedback.FEEDBACK_PATH, 'ab') as f:
+        f.write(serialization.dumps({
+            "question": data.get("question"),
+            "answer": data.get("answer"),
+            "feedback": data.get("feedback"),
+            "signed": signed,
+            "timestamp": datetime.datetime.now().isoformat()
+        }) + b"\n")
+
+# Per-client limits on votes (FEEDBACK_* settings)
+vote_guard = feedback.guard_from_env()
+# Clients written before votes needed a token send none. With
+# FEEDBACK_ALLOW_UNSIGNED=1 (for the transition; it will be removed) their
+# votes are still logged, within the same limits, but marked unsigned so
+# the calibration ignores them.
+FEEDBACK_ALLOW_UNSIGNED = os.environ.get('FEEDBACK_ALLOW_UNSIGNED', '0') == '1'
+FEEDBACK_REJECTED = {
+    'rate': 'Too many requests',
+    'duplicate': 'This answer was already rated',
+    'cap': 'Too many votes, please try again later',
 }
 
-    waitForModel();
-  </script>
-</body>
-</html> """  # Keep all your existing HTML as is
+# The /feedback pipeline: (body, status, Retry-After seconds or None). The
+# vote is recorded only with the token /ask gave for that question and
+# answer (or with no token at all, see FEEDBACK_ALLOW_UNSIGNED), within the
+# client's limits.
+def record_feedback(data, client):
+    question, answer = data.get('question'), data.get('answer')
+    if not isinstance(question, str) or not isinstance(answer, str) or not data.get('feedback'):
+        return {'status': 'error', 'message': 'question, answer and feedback are required'}, 400, None
+    token = data.get('token')
+    signed = answer_signer.verify(token, question, answer)
+    if not signed and not (FEEDBACK_ALLOW_UNSIGNED and token is None):
+        return {'status': 'error', 'message': 'Invalid or expired answer token'}, 400, None
+    rejected = vote_guard.check(client, token if signed else None)
+    if rejected:
+        reason, retry_after = rejected
+        body = {'status': 'error', 'message': FEEDBACK_REJECTED[reason]}
+        if reason == 'duplicate':
+            return body, 409, None
+        return body, 429, math.ceil(retry_after)
+    write_feedback(data, signed)
+    return {'status': 'ok'}, 200, None
+
+@bp.route('/model_status')
+def model_status():
+    return jsonify({'ready': model_ready[0], 'encoder_loaded': getattr(model, 'loaded', True)})
 
 @bp.route('/')
 def index():
-    return render_template_string(HTML_PAGE)
+    return cached_page('index.html')
+
+def request_client():
+    return ratelimit.client_key(request.remote_addr, request.headers.get('X-Forwarded-For'))
+
+# Helper: 429 response when the client is over its rate limit, else None.
+# `cost` is the number of questions in the request.
+def rate_limited(cost=1):
+    if rate_limiter:
+        allowed, retry_after = rate_limiter.allow(request_client(), cost)
+        if not allowed:
+            return jsonify(RATE_LIMITED), 429, {'Retry-After': str(math.ceil(retry_after))}
+    return None
+
+# Helper: (answer, score, pre-rendered /ask body) when the question closely
+# matches a hot FAQ, else None. Exact matches are left to fast_answer(),
+# which needs no encoder, and a busy encoder falls through to the normal
+# pipeline.
+def hot_hit(question, category=None):
+    if not hot_set or not len(hot_set.refresh()) or lexical_index.match(question):
+        return None
+    try:
+        vector = encode_query(question)
+    except ratelimit.Overloaded:
+        return None
+    # Questions with a feedback override go through the full index
+    if dense_index.adjustment(vector) is not None:
+        return None
+    return hot_set.lookup(vector, category)
+
+def hot_response(question, category=None, defer=call):
+    hit = hot_hit(question, category)
+    if hit is None:
+        return None
+    answer, _, body = hit
+    defer(log_answer, question, {'answer': answer, 'source': 'semantic'})
+    return body[:-1] + b',"token":' + serialization.dumps(answer_signer.sign(question, answer)) + b'}'
+
+# A hot tier answer as a dict, for /ask/stream
+def hot_answer(question, category=None):
+    hit = hot_hit(question, category)
+    if hit is None:
+        return None
+    answer, score, _ = hit
+    return {'answer': answer, 'source': 'semantic', 'tier': 'hot', 'score': round(score, 6)}
 
 # Route: Chatbot question
 @bp.route('/ask', methods=['POST'])
 def ask():
+    limited = rate_limited()
+    if limited:
+        return limited
     data = request.get_json()
     question = data.get('question', '')
-    answer = find_answer(question)
-    if answer:
-        return jsonify({'answer': answer, 'source': 'local'}), 200
-    # If not found, scrape and try again
-    scrape_cut_website()
-    answer = find_answer(question)
-    if answer:
-        return jsonify({'answer': answer, 'source': 'scraped'}), 200
-    return jsonify({'answer': "Sorry, I couldn't find an answer.", 'source': 'none'}), 404
+    category = data.get('category') or None
+    if category and not dense_index.has_category(category):
+        return jsonify({'status': 'error', 'message': 'Unknown category'}), 400
+    result, status = answer_question(question, category)
+    if isinstance(result, bytes):
+        return current_app.response_class(result, mimetype='application/json')
+    if status == 503:
+        return jsonify(result), status, {'Retry-After': '1'}
+    return jsonify(result), status
+
+# Route: Chatbot question as server-sent events (see stream_answer). Takes
+# the /ask JSON body, or ?question=...&category=... for EventSource clients.
+@bp.route('/ask/stream', methods=['GET', 'POST'])
+def ask_stream():
+    limited = rate_limited()
+    if limited:
+        return limited
+    data = request.get_json(silent=True) if request.method == 'POST' else request.args
+    data = data or {}
+    question = data.get('question', '')
+    category = data.get('category') or None
+    if category and not dense_index.has_category(category):
+        return jsonify({'status': 'error', 'message': 'Unknown category'}), 400
+    return event_stream_response(stream_answer(question, category))
+
+# Route: Several questions at once ({"questions": [...], "category": ...}),
+# up to BATCH_MAX_QUESTIONS. The questions are encoded together, then each
+# goes through the /ask pipeline; results come back in order, each with
+# the status code /ask would have returned.
+BATCH_MAX_QUESTIONS = int(os.environ.get('BATCH_MAX_QUESTIONS', '32'))
+
+@bp.route('/ask/batch', methods=['POST'])
+def ask_batch():
+    data = request.get_json(silent=True) or {}
+    questions = data.get('questions')
+    if not isinstance(questions, list) or not all(isinstance(q, str) for q in questions):
+        return jsonify({'status': 'error', 'message': 'questions must be a list of strings'}), 400
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return jsonify({'status': 'error', 'message': f'At most {BATCH_MAX_QUESTIONS} questions per batch'}), 400
+    # Charged per question, so a batch can't multiply a client's rate
+    limited = rate_limited(max(1, len(questions)))
+    if limited:
+        return limited
+    category = data.get('category') or None
+    if category and not dense_index.has_category(category):
+        return jsonify({'status': 'error', 'message': 'Unknown category'}), 400
+    try:
+        prefetch_query_vectors(questions)
+    except ratelimit.Overloaded:
+        # Each question is then shed or answered lexically on its own
+        pass
+    results = []
+    for question in questions:
+        result, status = answer_question(question, category, hot=False)
+        results.append(dict(result, status=status))
+    return jsonify({'results': results})
+
+@bp.route('/categories')
+def categories():
+    return jsonify(dense_index.categories())
+
+# Route: Chatbot question for one tenant's knowledge base
+@bp.route('/t/<tenant>/ask', methods=['POST'])
+def tenant_ask(tenant):
+    limited = rate_limited()
+    if limited:
+        return limited
+    try:
+        kb = tenant_registry.get(tenant)
+    except tenants.UnknownTenant:
+        return jsonify({'status': 'error', 'message': 'Unknown tenant'}), 404
+    data = request.get_json()
+    question = data.get('question', '')
+    category = data.get('category') or None
+    if category and not kb.dense.has_category(category):
+        return jsonify({'status': 'error', 'message': 'Unknown category'}), 400
+    try:
+        result = tenant_answer(kb, question, category)
+    except ratelimit.Overloaded:
+        return jsonify(OVERLOADED), 503, {'Retry-After': '1'}
+    tenant_registry.record(tenant, 'answered' if result else 'unanswered')
+    if result:
+        return jsonify(result)
+    return jsonify(NOT_FOUND), 404
+
+@bp.route('/t/<tenant>/categories')
+def tenant_categories(tenant):
+    try:
+        return jsonify(tenant_registry.get(tenant).dense.categories())
+    except tenants.UnknownTenant:
+        return jsonify({'status': 'error', 'message': 'Unknown tenant'}), 404
+
+@bp.route('/scrape/status')
+def scrape_status_route():
+    return jsonify(scrape_status())
 
 @bp.route('/health')
 def health():
@@ -605,448 +850,68 @@ def health():
 
 ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD", "Test@12345")  # Set a strong password!
 
+# Blue/green switch: load the promoted (or rolled back) encoder and its
+# snapshot alongside the current ones, then swap everything over at once.
+# Requests keep being served from the old index until the swap.
+INDEX_STATE_STAMP = [None]
+_index_switch_lock = threading.Lock()
+
+def activate_index(entry):
+    global model, MODEL_NAME, MODEL_ID, SNAPSHOT_PATH, query_embedding_cache, query_encoder, active_index
+    new_model = load_encoder(entry['model'], entry['backend'])
+    new_id = reembed.model_id(entry)
+    kb_writer.flush()
+    records, vectors, lexical, how = snapshot.load_or_build(
+        reembed.snapshot_path(entry), FAQS_PATH, new_id, new_model.encode, storage.load_records)
+    with kb_lock:
+        model, MODEL_NAME, MODEL_ID = new_model, entry['model'], new_id
+        SNAPSHOT_PATH = reembed.snapshot_path(entry)
+        query_embedding_cache = query_cache.from_env(MODEL_ID)
+        query_encoder = (model, query_embedding_cache)
+        active_index = entry
+        FAQS_DATA[:] = records
+        rebuild_indexes(vectors)
+    tenant_registry.switch_model(MODEL_ID)
+    return how
+
+# Switch when index_state.json names a different index than this worker
+# serves. Runs with the refresher and from /admin/index.
+def check_index_state():
+    if EMBEDDING_SOCKET or not os.path.exists(reembed.STATE_PATH):
+        return None
+    with _index_switch_lock:
+        stamp = snapshot.file_stamp(reembed.STATE_PATH)
+        if stamp == INDEX_STATE_STAMP[0]:
+            return None
+        entry = reembed.active_entry()
+        how = activate_index(entry) if entry != active_index else None
+        INDEX_STATE_STAMP[0] = stamp
+        return how
+
+# Dashboard tables, refreshed from the logs every ANALYTICS_INTERVAL seconds
+# (0 disables; python -m app.analytics refreshes by hand)
+ANALYTICS_INTERVAL = float(os.environ.get('ANALYTICS_INTERVAL', '60'))
+log_analytics = analytics.Analytics(os.environ.get('ANALYTICS_DIR', 'analytics'), QUESTION_LOG,
+                                    feedback.FEEDBACK_PATH, lambda texts: model.encode(texts), lambda: FAQS_DATA)
+miss_miner = misses.MissMiner(miss_log.directory, lambda: question_embeddings_cache)
+refresher = None
+if ANALYTICS_INTERVAL > 0:
+    refresher = analytics.start_refresher(ANALYTICS_INTERVAL, index=check_index_state, analytics=log_analytics.refresh,
+                                          suggestions=miss_miner.refresh, calibration=refresh_calibration)
+
+# Run/failure counts and last error of a background job, shown by its admin
+# endpoint; None when the refresher is off
+def refresh_status(job):
+    return refresher.status(job) if refresher else None
+
 @bp.route('/admin', methods=['GET'])
 def admin_page():
     if request.args.get("pw") != ADMIN_PASSWORD:
         return "Unauthorized", 401
-    return render_template_string("""
-<!DOCTYPE html>
-<html>
-<head>
-  <title>CUT | FAQ Admin Panel</title>
-  <meta name="viewport" content="width=device-width, initial-scale=1">
-  <link rel="icon" type="image/png" href="{{ url_for('static', filename='assets/images/favicon.png') }}">
-  <style>
-    :root {
-      --bg: url('{{ url_for('static', filename='assets/images/background.jpg') }}') center/cover no-repeat fixed, linear-gradient(135deg, #e0e7ff 0%, #f4f7fa 100%);
-      --glass: rgba(255,255,255,0.55);
-      --text: #222;
-      --primary: #2563eb;
-      --primary-dark: #1e40af;
-    }
-    body {
-      background: var(--bg);
-      color: var(--text);
-      font-family: 'Segoe UI', Arial, sans-serif;
-      margin: 0;
-      padding: 0;
-      min-height: 100vh;
-      transition: background 0.3s;
-    }
-    .container {
-      max-width: 700px;
-      margin: 40px auto;
-      background: var(--glass);
-      border-radius: 18px;
-      box-shadow: 0 4px 24px rgba(0,0,0,0.13);
-      padding: 36px 28px 28px 28px;
-      backdrop-filter: blur(16px);
-      -webkit-backdrop-filter: blur(16px);
-      position: relative;
-    }
-    h2 {
-      margin-top: 0;
-      font-size: 2em;
-      letter-spacing: 1px;
-      color: var(--primary);
-      text-align: center;
-      display: flex;
-      align-items: center;
-      justify-content: center;
-      gap: 10px;
-    }
-    h2 img {
-      width: 38px;
-      height: 38px;
-      vertical-align: middle;
-    }
-    .theme-toggle {
-      position: absolute;
-      top: 18px;
-      right: 18px;
-      background: #fff;
-      border: none;
-      border-radius: 50%;
-      width: 38px;
-      height: 38px;
-      font-size: 1.3em;
-      box-shadow: 0 2px 8px rgba(0,0,0,0.07);
-      cursor: pointer;
-      transition: background 0.2s;
-      z-index: 10;
-    }
-    .theme-toggle:hover {
-      background: #e0e7ff;
-    }
-    .download-btn {
-      display: inline-flex;
-      align-items: center;
-      gap: 6px;
-      background: #e0e7ff;
-      color: #2563eb;
-      border: 1px solid #c7d2fe;
-      border-radius: 8px;
-      padding: 8px 16px;
-      font-size: 1em;
-      cursor: pointer;
-      transition: background 0.2s, color 0.2s;
-      text-decoration: none;
-      margin-bottom: 10px;
-    }
-    .download-btn:hover {
-      background: #2563eb;
-      color: #fff;
-    }
-    .pdf-btn {
-      display: inline-flex;
-      align-items: center;
-      gap: 6px;
-      background: #f1f5fb;
-      color: #2563eb;
-      border: 1px solid #c7d2fe;
-      border-radius: 8px;
-      padding: 8px 16px;
-      font-size: 1em;
-      cursor: pointer;
-      transition: background 0.2s, color 0.2s;
-      margin-bottom: 18px;
-      margin-top: 8px;
-    }
-    .pdf-btn:hover {
-      background: #2563eb;
-      color: #fff;
-    }
-    form {
-      display: flex;
-      gap: 12px;
-      flex-wrap: wrap;
-      margin-bottom: 18px;
-      align-items: flex-end;
-    }
-    form input, form select {
-      padding: 10px;
-      border-radius: 8px;
-      border: 1.5px solid #c7d2fe;
-      font-size: 1em;
-      flex: 1 1 180px;
-      background: #f8fafc;
-      transition: border 0.2s;
-    }
-    form input:focus, form select:focus {
-      border: 1.5px solid var(--primary);
-      background: #fff;
-      outline: none;
-    }
-    form button {
-      background: var(--primary);
-      color: #fff;
-      border: none;
-      border-radius: 8px;
-      padding: 10px 22px;
-      font-size: 1em;
-      cursor: pointer;
-      transition: background 0.2s;
-    }
-    form button:hover {
-      background: var(--primary-dark);
-    }
-    #faqSearch {
-      width: 100%;
-      margin-bottom: 18px;
-      padding: 10px;
-      border-radius: 8px;
-      border: 1.5px solid #c7d2fe;
-      font-size: 1em;
-      background: #f8fafc;
-      transition: border 0.2s;
-    }
-    #faqSearch:focus {
-      border: 1.5px solid var(--primary);
-      background: #fff;
-      outline: none;
-    }
-    .faq-list {
-      list-style: none;
-      padding: 0;
-      margin: 0;
-    }
-    .faq-item {
-      background: rgba(241,245,251,0.85);
-      border-radius: 12px;
-      margin-bottom: 12px;
-      padding: 16px 14px;
-      display: flex;
-      flex-direction: column;
-      gap: 6px;
-      box-shadow: 0 2px 8px rgba(0,0,0,0.04);
-      position: relative;
-      transition: background 0.2s;
-    }
-    .faq-actions {
-      margin-top: 6px;
-      display: flex;
-      gap: 10px;
-    }
-    .faq-actions button {
-      background: #fff;
-      color: var(--primary);
-      border: 1px solid #c7d2fe;
-      border-radius: 6px;
-      padding: 5px 14px;
-      font-size: 0.98em;
-      cursor: pointer;
-      transition: background 0.2s, color 0.2s;
-    }
-    .faq-actions button:hover {
-      background: var(--primary);
-      color: #fff;
-    }
-    @media (max-width: 700px) {
-      .container { padding: 12px 2vw; }
-      form { flex-direction: column; gap: 8px; }
-      .download-btn { float: none; display: block; width: 100%; margin: 0 0 18px 0; }
-    }
-    /* DARK MODE */
-    body.dark {
-      --bg: url('{{ url_for('static', filename='assets/images/background.jpg') }}') center/cover no-repeat fixed, linear-gradient(135deg, #23272a 0%, #181a1b 100%);
-      --glass: rgba(24,26,27,0.55);
-      --text: #f4f7fa;
-      --primary: #a5b4fc;
-      --primary-dark: #2563eb;
-    }
-    body.dark {
-      color: var(--text);
-    }
-    body.dark .container {
-      background: var(--glass);
-      box-shadow: 0 4px 24px rgba(0,0,0,0.25);
-      backdrop-filter: blur(16px);
-      -webkit-backdrop-filter: blur(16px);
-    }
-    body.dark h2 {
-      color: var(--primary);
-    }
-    body.dark form input, body.dark form select, body.dark #faqSearch {
-      background: #23272a;
-      color: var(--text);
-      border: 1.5px solid #374151;
-    }
-    body.dark form input:focus, body.dark form select:focus, body.dark #faqSearch:focus {
-      background: #181a1b;
-      border: 1.5px solid var(--primary-dark);
-    }
-    body.dark form button, body.dark .faq-actions button {
-      background: var(--primary-dark);
-      color: #fff;
-    }
-    body.dark form button:hover, body.dark .faq-actions button:hover {
-      background: var(--primary);
-      color: #23272a;
-    }
-    body.dark .faq-item {
-      background: rgba(35,39,42,0.85);
-      color: var(--text);
-    }
-    body.dark .download-btn, body.dark .pdf-btn {
-      background: #23272a;
-      color: var(--primary);
-      border: 1px solid #374151;
-    }
-    body.dark .download-btn:hover, body.dark .pdf-btn:hover {
-      background: var(--primary-dark);
-      color: #fff;
-    }
-    body.dark .theme-toggle {
-      background: #23272a;
-      color: var(--primary);
-    }
-    body.dark .theme-toggle:hover {
-      background: #1e293b;
-    }
-  </style>
-</head>
-<body>
-  <button class="theme-toggle" id="themeToggle" title="Toggle theme">🌙</button>
-  <div class="container">
-    <h2>
-      <img src="{{ url_for('static', filename='assets/images/favicon.png') }}" alt="icon">
-      FAQ Admin Panel
-    </h2>
-    <div style="margin-bottom:18px;">
-  <a href="/admin?pw={{request.args.get('pw')}}">FAQ Admin</a> |
-  <a href="/admin/feedback?pw={{request.args.get('pw')}}">Feedback Review</a> 
-  
-</div>
-    <div style="margin: 0 auto 18px auto; display: flex; justify-content: center;">
-      <a href="/admin/export?pw={{request.args.get('pw')}}" class="download-btn" download>
-        <span>⬇️ Download FAQs (JSON)</span>
-      </a>
-    </div>
-    <form id="pdfForm" enctype="multipart/form-data" style="margin-bottom:18px;">
-      <label style="font-weight:600;">Import FAQs from PDF:</label>
-      <input type="file" name="pdf" accept="application/pdf" required>
-      <button type="submit" class="pdf-btn">Upload PDF</button>
-    </form>
-    <form id="faqForm">
-  <label for="questionInput">Question</label>
-  <input id="questionInput" name="question" placeholder="Question" required>
-  <label for="answerInput">Answer</label>
-  <textarea id="answerInput" name="answer" placeholder="Answer" required rows="3" style="resize:vertical;width:100%;"></textarea>
-  <label for="categoryInput">Category (optional)</label>
-  <input id="categoryInput" name="category" placeholder="Category (optional)">
-  <button type="submit">Add FAQ</button>
-  <button type="button" id="cancelEditBtn" style="display:none;margin-left:8px;">Cancel Edit</button>
-</form>
-    <input id="faqSearch" placeholder="Search FAQs...">
-    <ul id="faqList" class="faq-list">
-      {% for faq in faqs %}
-        <li class="faq-item">
-          <div><b>Q:</b> {{ faq.question }}</div>
-          <div><b>A:</b> {{ faq.answer }}</div>
-          {% if faq.category %}
-            <div><b>Category:</b> {{ faq.category }}</div>
-          {% endif %}
-          <div class="faq-actions">
-            <button type="button" onclick="editFAQ({{ loop.index0 }})">Edit</button>
-            <button type="button" onclick="deleteFAQ({{ loop.index0 }})">Delete</button>
-          </div>
-        </li>
-      {% endfor %}
-    </ul>
-  </div>
-  <script>
-    // Theme toggle logic
-    const themeToggle = document.getElementById('themeToggle');
-    let darkMode = false;
-    themeToggle.onclick = () => {
-      darkMode = !darkMode;
-      if (darkMode) {
-        document.body.classList.add('dark');
-        themeToggle.innerHTML = '☀️';
-        localStorage.setItem('adminDarkMode', 'true');
-      } else {
-        document.body.classList.remove('dark');
-        themeToggle.innerHTML = '🌙';
-        localStorage.setItem('adminDarkMode', 'false');
-      }
-    };
-    window.onload = () => {
-      const darkModePreference = localStorage.getItem('adminDarkMode');
-      if (darkModePreference === 'true') {
-        darkMode = true;
-        document.body.classList.add('dark');
-        themeToggle.innerHTML = '☀️';
-      } else {
-        darkMode = false;
-        document.body.classList.remove('dark');
-        themeToggle.innerHTML = '🌙';
-      }
-    };
-
-    // FAQ logic
-    const faqs = {{ faqs|tojson }};
-
-    // Edit FAQ logic
-        const cancelEditBtn = document.getElementById('cancelEditBtn');
-const faqForm = document.getElementById('faqForm');
-
-function editFAQ(index) {
-  const faq = faqs[index];
-  faqForm.question.value = faq.question;
-  faqForm.answer.value = faq.answer;
-  faqForm.category.value = faq.category || '';
-  faqForm.dataset.editing = index;
-  faqForm.querySelector('button[type="submit"]').textContent = "Update FAQ";
-  cancelEditBtn.style.display = "inline-block";
-  faqForm.scrollIntoView({ behavior: 'smooth', block: 'center' });
-  faqForm.question.focus();
-}
-
-cancelEditBtn.onclick = function() {
-  faqForm.reset();
-  faqForm.dataset.editing = "";
-  faqForm.querySelector('button[type="submit"]').textContent = "Add FAQ";
-  cancelEditBtn.style.display = "none";
-};
-
-    // Add/Edit form handler
-    document.getElementById('faqForm').onsubmit = async function(e) {
-      e.preventDefault();
-      const form = e.target;
-      const editing = form.dataset.editing;
-      const url = editing !== undefined && editing !== ""
-        ? `/admin/edit?pw={{ request.args.get('pw') }}`
-        : `/admin/add?pw={{ request.args.get('pw') }}`;
-      const payload = {
-        question: form.question.value,
-        answer: form.answer.value,
-        category: form.category.value || ''
-      };
-      if (editing !== undefined && editing !== "") payload.index = parseInt(editing);
-
-      const res = await fetch(url, {
-        method: 'POST',
-        headers: {'Content-Type': 'application/json'},
-        body: JSON.stringify(payload)
-      });
-
-      if (res.ok) {
-        form.reset();
-        form.dataset.editing = "";
-        form.querySelector('button[type="submit"]').textContent = "Add FAQ";
-        document.getElementById('faqSearch').value = '';
-        location.reload();
-      } else {
-        alert('Failed to ' + (editing !== undefined && editing !== "" ? 'edit' : 'add') + ' FAQ');
-      }
-    };
-
-    // Delete FAQ
-    async function deleteFAQ(index) {
-      if (!confirm("Are you sure you want to delete this FAQ?")) return;
-      const res = await fetch(`/admin/delete?pw={{ request.args.get('pw') }}`, {
-        method: 'POST',
-        headers: {'Content-Type': 'application/json'},
-        body: JSON.stringify({ index })
-      });
-      if (res.ok) {
-        location.reload();
-      } else {
-        alert('Failed to delete FAQ');
-      }
-    }
-
-    // PDF upload handler (clear file input after upload)
-    document.getElementById('pdfForm').onsubmit = async function(e) {
-      e.preventDefault();
-      const form = e.target;
-      const formData = new FormData(form);
-      const res = await fetch('/admin/upload_pdf?pw={{request.args.get("pw")}}', {
-        method: 'POST',
-        body: formData
-      });
-      const data = await res.json();
-      form.reset(); // Clear PDF file input after upload
-      if (data.status === 'ok') {
-        alert('Imported ' + data.added + ' FAQs from PDF!');
-        location.reload();
-      } else {
-        alert('Error: ' + (data.message || 'Could not import PDF'));
-      }
-    };
-
-    // FAQ search (optional: clear on add/edit)
-    document.getElementById('faqSearch').addEventListener('input', function() {
-      const val = this.value.toLowerCase();
-      document.querySelectorAll('#faqList .faq-item').forEach(li => {
-        li.style.display = li.textContent.toLowerCase().includes(val) ? '' : 'none';
-      });
-    });
-
-  </script>
-</body>
-</html>
-    """, faqs=FAQS_DATA)
+    suggestions = (miss_miner.latest() or {}).get('suggestions', [])
+    response = make_response(render_template('admin.html', faqs=FAQS_DATA, suggestions=suggestions))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
 @bp.route('/admin/feedback')
 def admin_feedback():
@@ -1054,48 +919,36 @@ def admin_feedback():
         return "Unauthorized", 401
     feedbacks = []
     try:
-        with open('feedback_log.txt', encoding='utf-8') as f:
+        with open(feedback.FEEDBACK_PATH, encoding='utf-8') as f:
             for line in f:
-                feedbacks.append(json.loads(line))
+                feedbacks.append(serialization.loads(line))
     except FileNotFoundError:
         pass
-    return render_template_string("""
-    <html>
-    <head>
-      <title>Feedback Review</title>
-      <style>
-        body { font-family: Arial, sans-serif; background: #f8fafc; color: #222; }
-        .container { max-width: 800px; margin: 40px auto; background: #fff; border-radius: 10px; box-shadow: 0 2px 12px #0001; padding: 32px; }
-        h2 { text-align: center; }
-        table { width: 100%; border-collapse: collapse; margin-top: 24px; }
-        th, td { border: 1px solid #e5e7eb; padding: 8px 12px; }
-        th { background: #e0e7ff; }
-        tr:nth-child(even) { background: #f1f5fb; }
-      </style>
-    </head>
-    <body>
-      <div class="container">
-        <h2>Feedback Log</h2>
-        <table>
-          <tr>
-            <th>Timestamp</th>
-            <th>Question</th>
-            <th>Answer</th>
-            <th>Feedback</th>
-          </tr>
-          {% for fb in feedbacks %}
-          <tr>
-            <td>{{fb.timestamp}}</td>
-            <td>{{fb.question}}</td>
-            <td>{{fb.answer}}</td>
-            <td>{{fb.feedback}}</td>
-          </tr>
-          {% endfor %}
-        </table>
-      </div>
-    </body>
-    </html>
-    """, feedbacks=feedbacks)
+    response = make_response(render_template('admin_feedback.html', feedbacks=feedbacks))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@bp.route('/admin/analytics')
+def admin_analytics():
+    if request.args.get("pw") != ADMIN_PASSWORD:
+        return "Unauthorized", 401
+    tables = log_analytics.dashboard()
+    if request.args.get('format') == 'json':
+        response = jsonify(dict(tables or {}, refresh=refresh_status('analytics')))
+    else:
+        response = make_response(render_template('admin_analytics.html', tables=tables,
+                                                 refresh=refresh_status('analytics')))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@bp.route('/admin/suggestions', methods=['GET', 'POST'])
+def admin_suggestions():
+    if request.args.get("pw") != ADMIN_PASSWORD:
+        return jsonify({'status': 'unauthorized'}), 401
+    # POST clusters any new misses right away instead of waiting for the refresher
+    if request.method == 'POST' and miss_miner.refresh() is None:
+        return jsonify({'status': 'error', 'message': 'Refresh already running'}), 409
+    return jsonify(dict(miss_miner.latest() or {'suggestions': []}, refresh=refresh_status('suggestions')))
 
 @bp.route('/admin/add', methods=['POST'])
 def admin_add():
@@ -1109,11 +962,7 @@ def admin_add():
         return jsonify({'status': 'error', 'message': 'Question and answer required'}), 400
     if any(faq['question'].lower() == question.lower() for faq in FAQS_DATA):
         return jsonify({'status': 'error', 'message': 'Duplicate question'}), 400
-    FAQS_DATA.append({'question': question, 'answer': answer, 'category': category})
-    global question_embeddings_cache
-    question_embeddings_cache = model.encode([item["question"] for item in FAQS_DATA])
-    with open('faqs.json', 'w', encoding='utf-8') as f:
-        json.dump(FAQS_DATA, f, ensure_ascii=False, indent=2)
+    ingest_faqs([{'question': question, 'answer': answer, 'category': category}])
     return jsonify({'status': 'ok'})
 
 @bp.route('/admin/edit', methods=['POST'])
@@ -1122,11 +971,18 @@ def admin_edit():
         return jsonify({'status': 'unauthorized'}), 401
     data = request.get_json()
     idx = int(data['index'])
-    FAQS_DATA[idx]['question'] = data['question']
-    FAQS_DATA[idx]['answer'] = data['answer']
-    FAQS_DATA[idx]['category'] = data.get('category', '')
-    with open('faqs.json', 'w', encoding='utf-8') as f:
-        json.dump(FAQS_DATA, f, ensure_ascii=False, indent=2)
+    # Only the edited question is re-encoded
+    vector = encode_questions([data])[0]
+    with kb_lock:
+        # A new record, not changed in place: kb_view still holds the old one
+        old = FAQS_DATA[idx]
+        FAQS_DATA[idx] = dict(old, question=data['question'], answer=data['answer'],
+                              category=data.get('category', ''))
+        kb_changes.edit(old, FAQS_DATA[idx])
+        vectors = np.array(question_embeddings_cache)
+        vectors[idx] = vector
+        rebuild_indexes(vectors)
+    save_knowledge_base()
     return jsonify({'status': 'ok'})
 
 @bp.route('/admin/delete', methods=['POST'])
@@ -1134,32 +990,164 @@ def admin_delete():
     if request.args.get("pw") != ADMIN_PASSWORD:
         return jsonify({'status': 'unauthorized'}), 401
     idx = int(request.get_json()['index'])
-    FAQS_DATA.pop(idx)
-    with open('faqs.json', 'w', encoding='utf-8') as f:
-        json.dump(FAQS_DATA, f, ensure_ascii=False, indent=2)
+    with kb_lock:
+        kb_changes.delete(FAQS_DATA.pop(idx))
+        rebuild_indexes(np.delete(question_embeddings_cache, idx, axis=0))
+    save_knowledge_base()
     return jsonify({'status': 'ok'})
 
+@bp.route('/admin/encoder_stats')
+def admin_encoder_stats():
+    if request.args.get("pw") != ADMIN_PASSWORD:
+        return jsonify({'status': 'unauthorized'}), 401
+    if not EMBEDDING_SOCKET:
+        return jsonify({'mode': 'in-process', 'model': MODEL_NAME,
+                        'backend': active_index['backend']})
+    try:
+        return jsonify(dict(model.stats(), mode='server', socket=EMBEDDING_SOCKET))
+    except (OSError, RuntimeError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 503
+
+@bp.route('/admin/rerank_stats')
+def admin_rerank_stats():
+    if request.args.get("pw") != ADMIN_PASSWORD:
+        return jsonify({'status': 'unauthorized'}), 401
+    if reranker is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(reranker.stats(), enabled=True))
+
+@bp.route('/admin/load_stats')
+def admin_load_stats():
+    if request.args.get("pw") != ADMIN_PASSWORD:
+        return jsonify({'status': 'unauthorized'}), 401
+    return jsonify({'shedder': shedder.stats(), 'rate_limiter': rate_limiter.stats() if rate_limiter else None,
+                    'faq_writer': kb_writer.stats()})
+
+@bp.route('/admin/hot_stats')
+def admin_hot_stats():
+    if request.args.get("pw") != ADMIN_PASSWORD:
+        return jsonify({'status': 'unauthorized'}), 401
+    if hot_set is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(hot_set.stats(), enabled=True))
+
+@bp.route('/admin/calibration')
+def admin_calibration():
+    if request.args.get("pw") != ADMIN_PASSWORD:
+        return jsonify({'status': 'unauthorized'}), 401
+    if score_calibration[0] is None:
+        return jsonify({'enabled': CALIBRATION_ENABLED, 'loaded': False, 'votes': vote_guard.stats(),
+                        'refresh': refresh_status('calibration')})
+    return jsonify(dict(score_calibration[0].summary(), enabled=CALIBRATION_ENABLED, loaded=True,
+                        applied=dense_index.prior is not None, votes=vote_guard.stats(),
+                        refresh=refresh_status('calibration')))
+
+@bp.route('/admin/shard_stats')
+def admin_shard_stats():
+    if request.args.get("pw") != ADMIN_PASSWORD:
+        return jsonify({'status': 'unauthorized'}), 401
+    if shard_searcher is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(shard_searcher.stats(), enabled=True, active=dense_index.searcher is not None))
+
+@bp.route('/admin/index', methods=['GET', 'POST'])
+def admin_index():
+    if request.args.get("pw") != ADMIN_PASSWORD:
+        return jsonify({'status': 'unauthorized'}), 401
+    # POST switches to the index in index_state.json now instead of on the next refresh
+    switched = check_index_state() if request.method == 'POST' else None
+    state = reembed.load_state()
+    return jsonify({'serving': MODEL_ID, 'faqs': len(FAQS_DATA), 'switched': switched,
+                    'active': state['active'], 'previous': state['previous'],
+                    'reports': state['reports'], 'history': state['history'][-20:],
+                    'refresh': refresh_status('index')})
+
+@bp.route('/admin/tenants')
+def admin_tenants():
+    if request.args.get("pw") != ADMIN_PASSWORD:
+        return jsonify({'status': 'unauthorized'}), 401
+    return jsonify(tenant_registry.stats())
+
+@bp.route('/admin/cache_stats')
+def admin_cache_stats():
+    if request.args.get("pw") != ADMIN_PASSWORD:
+        return jsonify({'status': 'unauthorized'}), 401
+    return jsonify(query_embedding_cache.stats())
+
 @bp.route('/admin/export')
 def admin_export():
     if request.args.get("pw") != ADMIN_PASSWORD:
         return "Unauthorized", 401
-    return current_app.response_class(
-        json.dumps(FAQS_DATA, ensure_ascii=False, indent=2),
-        mimetype='application/json',
-        headers={"Content-Disposition": "attachment;filename=faqs.json"}
-    )
+    # Stream a snapshot of the list so concurrent edits can't break the output
+    tenant = request.args.get('tenant')
+    if tenant:
+        try:
+            kb = tenant_registry.get(tenant)
+        except tenants.UnknownTenant:
+            return jsonify({'status': 'error', 'message': 'Unknown tenant'}), 404
+        records, etag = list(kb.faqs), f'{tenant}-{kb.stamp}'
+    else:
+        with kb_lock:
+            records, etag = list(FAQS_DATA), kb_etag()
+    fmt = request.args.get('format', 'json')
+    if fmt == 'json':
+        return streamed_json_response(
+            records, etag, pretty=True,
+            headers={"Content-Disposition": "attachment;filename=faqs.json"}
+        )
+    if fmt == 'jsonl':
+        chunks, mimetype = bulk.iter_jsonl(records), 'application/x-ndjson'
+    elif fmt == 'csv':
+        chunks, mimetype = bulk.iter_csv(records), 'text/csv'
+    else:
+        return jsonify({'status': 'error', 'message': 'Unknown format'}), 400
+    return streamed_response(chunks, f'{etag}-{fmt}', mimetype=mimetype,
+                             headers={"Content-Disposition": f"attachment;filename=faqs.{fmt}"})
+
+# Bulk import: a CSV (question,answer,category header), JSON Lines or JSON
+# array upload, as a multipart 'file' field or as the raw request body with
+# ?format=. Rows are validated and deduplicated in one pass; the accepted
+# ones are encoded in batches and added with one index update and one
+# write. ?dry_run=1 only validates. ?tenant=<name> imports into that
+# tenant's knowledge base, creating it if it doesn't exist yet.
+@bp.route('/admin/import', methods=['POST'])
+def admin_import():
+    if request.args.get("pw") != ADMIN_PASSWORD:
+        return jsonify({'status': 'unauthorized'}), 401
+    upload = request.files.get('file')
+    tenant = request.args.get('tenant')
+    if tenant and not tenants.TENANT_NAME.match(tenant):
+        return jsonify({'status': 'error', 'message': 'Tenant names are lowercase letters, digits, - and _'}), 400
+    try:
+        fmt = bulk.detect_format(upload.filename if upload else None, request.args.get('format'))
+        if tenant:
+            existing = ({faq['question'].lower() for faq in tenant_registry.get(tenant).faqs}
+                        if tenant_registry.exists(tenant) else set())
+        else:
+            with kb_lock:
+                existing = {faq['question'].lower() for faq in FAQS_DATA}
+        rows = bulk.iter_rows(upload.stream if upload else request.stream, fmt)
+        records, report = bulk.validate(rows, existing, IMPORT_MAX_ROWS)
+    except (bulk.BadImport, UnicodeDecodeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    if request.args.get('dry_run') != '1':
+        start = time.perf_counter()
+        if tenant and records:
+            tenant_registry.add(tenant, records, encode_questions(records))
+        elif not tenant:
+            ingest_faqs(records)
+        report['seconds'] = round(time.perf_counter() - start, 3)
+    return jsonify(dict(report, status='ok', added=0 if request.args.get('dry_run') == '1' else len(records)))
 
 @bp.route('/feedback', methods=['POST'])
-def feedback():
-    data = request.get_json()
-    with open('feedback_log.txt', 'a', encoding='utf-8') as f:
-        f.write(json.dumps({
-            "question": data.get("question"),
-            "answer": data.get("answer"),
-            "feedback": data.get("feedback"),
-            "timestamp": datetime.datetime.now().isoformat()
-        }) + "\n")
-    return jsonify({'status': 'ok'})
+def feedback_route():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'status': 'error', 'message': 'Invalid JSON'}), 400
+    body, status, retry_after = record_feedback(data, request_client())
+    if retry_after is not None:
+        return jsonify(body), status, {'Retry-After': str(retry_after)}
+    return jsonify(body), status
 
 @bp.route('/admin/upload_pdf', methods=['POST'])
 def admin_upload_pdf():
@@ -1172,6 +1160,7 @@ def admin_upload_pdf():
         return jsonify({'status': 'error', 'message': 'Not a PDF file'}), 400
 
     # Extract text from PDF
+    import pdfplumber
     with pdfplumber.open(file) as pdf:
         text = "\n".join(page.extract_text() or "" for page in pdf.pages)
     lines = text.splitlines()
@@ -1203,12 +1192,6 @@ def admin_upload_pdf():
 
 
     # Add to FAQS_DATA and save
-    FAQS_DATA.extend(new_faqs)
-    global question_embeddings_cache
-    question_embeddings_cache = model.encode([item["question"] for item in FAQS_DATA])
-    with open('faqs.json', 'w', encoding='utf-8') as f:
-        json.dump(FAQS_DATA, f, ensure_ascii=False, indent=2)
+    ingest_faqs(new_faqs)
     return jsonify({'status': 'ok', 'added': len(new_faqs)})
-def backup_faqs():
-    shutil.copyfile('faqs.json', 'faqs_backup.json')
 
@@ -0,0 +1,87 @@
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+
+def _default(obj):
+    # numpy scalars/arrays and anything else the fast path doesn't know about
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    return DefaultJSONProvider.default(obj)
+
+
+# Helper: UTF-8 JSON bytes, compact unless pretty=True (2-space indent)
+def dumps(obj, pretty=False):
+    if orjson is not None:
+        option = ORJSON_OPTIONS | orjson.OPT_INDENT_2 if pretty else ORJSON_OPTIONS
+        return orjson.dumps(obj, default=_default, option=option)
+    if pretty:
+        return json.dumps(obj, ensure_ascii=False, indent=2, default=_default).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_default).encode('utf-8')
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Persisted format: a JSON array with one compact record per line. It loads
+# with any JSON parser and still diffs and hand-edits line by line.
+def dump_records(records):
+    if not records:
+        return b'[]\n'
+    return b'[\n' + b',\n'.join(dumps(record) for record in records) + b'\n]\n'
+
+
+def load_file(path):
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+
+def save_records(path, records):
+    data = dump_records(records)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+# Flask JSON provider so jsonify() and friends go through the same fast path
+class FastJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._orjson_dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._orjson_dumps(obj) + b'\n', mimetype=self.mimetype)
+
+    def _orjson_dumps(self, obj):
+        option = ORJSON_OPTIONS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if self.compact is False or (self.compact is None and self._app.debug):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_default, option=option)
+
+
+def init_app(app):
+    app.json = FastJSONProvider(app)
+
+
+def backend_name():
+    return 'orjson' if orjson is not None else 'json'
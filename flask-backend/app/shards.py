@@ -0,0 +1,407 @@
+import atexit
+import collections
+import contextlib
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import threading
+import time
+import weakref
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Connection
+
+import numpy as np
+
+from .lexical import top_rows
+
+logger = logging.getLogger(__name__)
+
+
+# The shards have moved on to a newer matrix than the caller's
+class StaleSegment(Exception):
+    pass
+
+
+# A shard process died or its pipe broke; the pool restarts itself in the
+# background, and callers search their own copy meanwhile
+class ShardFailure(Exception):
+    pass
+
+
+# Shared-memory copy of a float32 matrix, optionally followed by a score
+# offset per row. Unlinked (and unmapped once no view is left) when the
+# segment object is dropped.
+class Segment:
+    def __init__(self, matrix, prior=None):
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self.shape = matrix.shape
+        size = matrix.nbytes + (4 * self.shape[0] if prior is not None else 0)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.array = np.ndarray(self.shape, dtype=np.float32, buffer=self.shm.buf)
+        self.array[:] = matrix
+        self.array.flags.writeable = False
+        self.prior = None
+        if prior is not None:
+            self.prior = np.ndarray(self.shape[:1], dtype=np.float32, buffer=self.shm.buf, offset=matrix.nbytes)
+            self.prior[:] = prior
+            self.prior.flags.writeable = False
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def release(self):
+        with contextlib.suppress(Exception):
+            self.shm.unlink()
+        # Fails while views are still exported; the mapping then goes with the last view
+        with contextlib.suppress(BufferError, Exception):
+            self.shm.close()
+
+    def __del__(self):
+        self.release()
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 registers the segment again, but shard processes share
+        # the parent's resource tracker, so that only repeats the parent's entry
+        return shared_memory.SharedMemory(name=name)
+
+
+# Give each shard its share of the cores so the shards' BLAS pools don't
+# oversubscribe the CPU. Needs threadpoolctl (installed with
+# sentence-transformers); without it each shard keeps the parent's pool size.
+def _limit_threads(threads):
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return None
+    return threadpool_limits(threads)
+
+
+# Shard process: maps rows [start, stop) of the current segment and answers
+# batched top-k queries over them. Row numbers in replies are global.
+def _shard_main(conn, threads):
+    _limit_threads(threads)
+    shm = block = prior = None
+    start = stop = 0
+    while True:
+        message = conn.recv()
+        if message[0] == 'load':
+            _, name, shape, start, stop, has_prior = message
+            block = prior = None
+            if shm is not None:
+                shm.close()
+            shm = _attach(name)
+            block = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)[start:stop]
+            if has_prior:
+                prior = np.ndarray(shape[:1], dtype=np.float32, buffer=shm.buf,
+                                   offset=4 * shape[0] * shape[1])[start:stop]
+            conn.send('ok')
+        elif message[0] == 'search':
+            _, queries, k, ranges, adjusts = message
+            scores = block @ queries.T
+            if prior is not None:
+                scores += prior[:, None]
+            replies = []
+            for j in range(len(queries)):
+                column = scores[:, j]
+                if adjusts[j] is not None:
+                    rows, offsets = adjusts[j]
+                    inside = (rows >= start) & (rows < stop)
+                    column[rows[inside] - start] += offsets[inside]
+                if ranges[j] is not None:
+                    # Keep only rows inside the requested partitions
+                    mask = np.zeros(len(column), dtype=bool)
+                    for lo, hi in ranges[j]:
+                        mask[max(lo - start, 0):max(hi - start, 0)] = True
+                    column = np.where(mask, column, -np.inf)
+                rows = top_rows(column, k)
+                rows = rows[np.isfinite(column[rows])]
+                replies.append((rows + start, column[rows]))
+            conn.send(replies)
+        else:
+            conn.send('bye')
+            return
+
+
+# Supervisor process: forks every shard, the first ones and any restarted
+# later. It is forked once when the searcher is created, before the app
+# starts other threads, and stays single-threaded, so a restart never forks
+# the multithreaded server (a child forked while another thread holds a
+# lock, e.g. the logging or allocator lock, can deadlock). Each request on
+# `control` carries the shard's end of a socket pair; the shard sends its
+# pid on it first. `parent_end` is the server's end of `control`, closed
+# here so the supervisor exits when the server closes it.
+def _supervisor_main(control, parent_end, threads):
+    parent_end.close()
+    # Shards are reaped automatically, and stop on SIGTERM whatever handler
+    # the server had installed
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    while True:
+        try:
+            message, fds, _, _ = socket.recv_fds(control, 1, 1)
+        except OSError:
+            return
+        if not message:
+            return
+        if not fds:
+            continue
+        if os.fork() == 0:
+            control.close()
+            try:
+                conn = Connection(fds[0])
+                conn.send(os.getpid())
+                _shard_main(conn, threads)
+            finally:
+                os._exit(0)
+        os.close(fds[0])
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class _Query:
+    __slots__ = ('vector', 'top_k', 'ranges', 'segment', 'adjust', 'done', 'result')
+
+    def __init__(self, vector, top_k, ranges, segment, adjust):
+        self.vector = vector
+        self.top_k = top_k
+        self.ranges = ranges
+        self.segment = segment
+        self.adjust = adjust
+        self.done = threading.Event()
+        self.result = None
+
+
+# Exact top-k search over a matrix split row-wise across `shards` processes
+# that share it through one shared-memory segment. Concurrent queries that
+# arrive within max_wait_ms are batched (up to max_batch), scattered to every
+# shard as one matrix product each, and the per-shard top-k lists merged,
+# which gives exactly the result of searching the whole matrix. If a shard
+# dies, queries fail with ShardFailure until the pool has been re-forked
+# and pointed at the latest segment again.
+class ShardedSearch:
+    def __init__(self, shards, max_batch=32, max_wait_ms=0.5):
+        self.shards = shards
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.current = None
+        self.rows = 0
+        self.queries = queue.Queue()
+        self.counts = collections.Counter()
+        self._segments = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._conns = []
+        self._pids = []
+        self._latest = None
+        self.broken = False
+        self._restarting = False
+        self._next_restart = 0.0
+        self._threads = max(1, (os.cpu_count() or 1) // shards)
+        # Forked, not spawned: 'spawn' and 'forkserver' re-run the main module
+        # (run.py builds the whole app) in every child. Create the searcher
+        # before starting other threads; only the supervisor is forked from
+        # this process, and it forks the shards (see _supervisor_main).
+        self._context = multiprocessing.get_context('fork')
+        # Started now so the shards share it (see _attach)
+        resource_tracker.ensure_running()
+        self._control, child = socket.socketpair()
+        self._supervisor = self._context.Process(target=_supervisor_main, name='shard-supervisor', daemon=True,
+                                                 args=(child, self._control, self._threads))
+        self._supervisor.start()
+        child.close()
+        self._start_shards()
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name='shard-dispatch', daemon=True)
+        self._dispatcher.start()
+
+    def _start_shards(self):
+        for _ in range(self.shards):
+            parent, child = socket.socketpair()
+            try:
+                socket.send_fds(self._control, [b's'], [child.fileno()])
+            finally:
+                # Only the shard keeps its end, so a dead shard reads as EOF here
+                child.close()
+            conn = Connection(parent.detach())
+            self._conns.append(conn)
+            if not conn.poll(10):
+                raise ShardFailure('a shard process did not start')
+            self._pids.append(conn.recv())
+
+    # Call with self._lock held
+    def _send_load(self, segment):
+        rows = segment.shape[0]
+        bounds = [rows * i // self.shards for i in range(self.shards + 1)]
+        for conn, start, stop in zip(self._conns, bounds, bounds[1:]):
+            conn.send(('load', segment.name, segment.shape, start, stop, segment.prior is not None))
+        for conn in self._conns:
+            conn.recv()
+
+    # Copy `matrix` (and `prior`, an offset added to each row's score) into
+    # a new segment and point every shard at it. Returns the Segment; its
+    # read-only arrays can replace the caller's own copies, and the segment
+    # is freed when the caller drops it.
+    def load(self, matrix, prior=None):
+        segment = Segment(matrix, prior)
+        self._segments.add(segment)
+        with self._lock:
+            self._latest = weakref.ref(segment)
+            self.current, self.rows = segment.name, segment.shape[0]
+            self.counts['loads'] += 1
+            if not self.broken:
+                try:
+                    self._send_load(segment)
+                except (EOFError, OSError) as e:
+                    self._fail(e)
+        return segment
+
+    # Mark the pool broken and restart it in the background (at most every
+    # 5 s while restarts fail). Call with self._lock held; returns the
+    # ShardFailure to raise.
+    def _fail(self, cause):
+        if not self.broken:
+            self.broken = True
+            self.counts['failures'] += 1
+            logger.warning('shard pool failed (%s), restarting', cause or 'a shard process exited')
+        if not self._restarting and time.monotonic() >= self._next_restart:
+            self._restarting = True
+            threading.Thread(target=self.restart, name='shard-restart', daemon=True).start()
+        return ShardFailure(str(cause or 'a shard process exited'))
+
+    # Replace every shard process and load the latest segment into the new
+    # ones. Runs on its own thread after a failure.
+    def restart(self):
+        with self._lock:
+            try:
+                for conn in self._conns:
+                    conn.close()
+                for pid in self._pids:
+                    with contextlib.suppress(ProcessLookupError):
+                        os.kill(pid, signal.SIGTERM)
+                self._conns, self._pids = [], []
+                self._start_shards()
+                segment = self._latest() if self._latest else None
+                if segment is not None:
+                    self._send_load(segment)
+                self.broken = False
+                self.counts['restarts'] += 1
+            except Exception:
+                self._next_restart = time.monotonic() + 5
+                logger.exception('shard pool restart failed')
+            finally:
+                self._restarting = False
+
+    # (rows, scores) best first over the matrix loaded as `segment` (a name);
+    # raises StaleSegment if a newer matrix has been loaded since. `adjust`
+    # is (rows, offsets) added to those rows' scores for this query only.
+    def search(self, vector, top_k=1, ranges=None, segment=None, adjust=None):
+        query = _Query(np.asarray(vector, dtype=np.float32), top_k, ranges, segment, adjust)
+        self.queries.put(query)
+        query.done.wait()
+        if isinstance(query.result, Exception):
+            raise query.result
+        return query.result
+
+    def _next_batch(self):
+        batch = [self.queries.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queries.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _dispatch_loop(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._run(batch)
+            except Exception as e:
+                for query in batch:
+                    query.result = e
+            for query in batch:
+                query.done.set()
+
+    def _run(self, batch):
+        # Checked under the lock: load() and restart() change the segment
+        # the shards have mapped
+        with self._lock:
+            for query in batch:
+                if query.segment is not None and query.segment != self.current:
+                    query.result = StaleSegment()
+            batch = [query for query in batch if query.result is None]
+            if not batch:
+                return
+            vectors = np.stack([query.vector for query in batch])
+            k = max(query.top_k for query in batch)
+            ranges = [query.ranges for query in batch]
+            adjusts = [query.adjust for query in batch]
+            if self.broken or not all(_alive(pid) for pid in self._pids):
+                raise self._fail(None)
+            try:
+                for conn in self._conns:
+                    conn.send(('search', vectors, k, ranges, adjusts))
+                replies = [conn.recv() for conn in self._conns]
+            except (EOFError, OSError) as e:
+                raise self._fail(e) from e
+        self.counts['batches'] += 1
+        self.counts['queries'] += len(batch)
+        for j, query in enumerate(batch):
+            rows = np.concatenate([reply[j][0] for reply in replies])
+            scores = np.concatenate([reply[j][1] for reply in replies])
+            best = top_rows(scores, query.top_k)
+            query.result = (rows[best], scores[best])
+
+    def stats(self):
+        batches = self.counts['batches']
+        return {'shards': self.shards, 'rows': self.rows, 'healthy': not self.broken,
+                'failures': self.counts['failures'], 'restarts': self.counts['restarts'],
+                'loads': self.counts['loads'], 'queries': self.counts['queries'], 'batches': batches,
+                'avg_batch': round(self.counts['queries'] / batches, 2) if batches else None}
+
+    def close(self):
+        with self._lock:
+            for conn in self._conns:
+                with contextlib.suppress(OSError):
+                    conn.send(('stop',))
+            for conn in self._conns:
+                with contextlib.suppress(OSError, EOFError):
+                    if conn.poll(2):
+                        conn.recv()
+            self._control.close()
+            self._supervisor.join(timeout=2)
+        for segment in list(self._segments):
+            segment.release()
+
+
+# Sharded search when SEARCH_SHARDS > 1, for indexes of at least
+# SHARD_MIN_ENTRIES rows; None otherwise
+SHARD_MIN_ENTRIES = int(os.environ.get('SHARD_MIN_ENTRIES', '100000'))
+
+
+def from_env():
+    shards = int(os.environ.get('SEARCH_SHARDS', '0'))
+    if shards <= 1:
+        return None
+    searcher = ShardedSearch(shards, int(os.environ.get('SHARD_MAX_BATCH', '32')),
+                             float(os.environ.get('SHARD_MAX_WAIT_MS', '0.5')))
+    atexit.register(searcher.close)
+    return searcher
@@ -0,0 +1,192 @@
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+
+from . import serialization
+from .lexical import LexicalIndex
+
+# Single-file index snapshot, so workers can start without parsing
+# faqs.json or running the encoder:
+#
+#   magic (8) | header length (u32) | CRC32 of everything after the prefix (u32)
+#   JSON header | sections, each aligned to 64 bytes
+#
+# The header records the model, the faqs.json it was built from and the
+# offset, length, dtype and shape of every section. Array sections are
+# returned as read-only views of a shared memory map.
+MAGIC = b'CUTSNAP\x01'
+FORMAT_VERSION = 1
+PREFIX = struct.Struct('<8sII')
+ALIGN = 64
+
+
+def records_digest(records):
+    return hashlib.sha256(serialization.dump_records(records)).hexdigest()
+
+
+def file_stamp(path):
+    stat = os.stat(path)
+    return f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+
+
+# Unit-length float32 rows
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if not vectors.size:
+        return np.zeros((len(vectors), 0), dtype=np.float32)
+    vectors = vectors.reshape(len(vectors), -1)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def write(path, records, vectors, lexical_index, model_id, faqs_stamp):
+    lexical_meta, lexical_arrays = lexical_index.state()
+    blobs = {
+        'records': serialization.dump_records(records),
+        'lexical': serialization.dumps(lexical_meta),
+        'vectors': normalize_rows(vectors),
+    }
+    blobs.update(('lexical.' + name, np.ascontiguousarray(array)) for name, array in lexical_arrays.items())
+
+    sections = {}
+    offset = 0
+    for name, blob in blobs.items():
+        offset = -(-offset // ALIGN) * ALIGN
+        if isinstance(blob, np.ndarray):
+            sections[name] = {'offset': offset, 'length': blob.nbytes, 'dtype': blob.dtype.str, 'shape': blob.shape}
+            offset += blob.nbytes
+        else:
+            sections[name] = {'offset': offset, 'length': len(blob)}
+            offset += len(blob)
+    header = serialization.dumps({
+        'format_version': FORMAT_VERSION, 'model': model_id, 'count': len(records),
+        'dim': blobs['vectors'].shape[1], 'faqs_stamp': faqs_stamp, 'faqs_digest': records_digest(records),
+        'created': time.time(), 'sections': sections,
+    })
+    # Section offsets are relative to the first aligned byte after the header
+    base = -(-(PREFIX.size + len(header)) // ALIGN) * ALIGN
+
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w+b') as f:
+        f.write(PREFIX.pack(MAGIC, len(header), 0))
+        f.write(header)
+        for name, blob in blobs.items():
+            f.seek(base + sections[name]['offset'])
+            f.write(blob.tobytes() if isinstance(blob, np.ndarray) else blob)
+        f.flush()
+        f.seek(PREFIX.size)
+        crc = 0
+        while True:
+            chunk = f.read(1 << 20)
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+        f.seek(0)
+        f.write(PREFIX.pack(MAGIC, len(header), crc))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class Snapshot:
+    def __init__(self, path, verify=True):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < PREFIX.size:
+            raise SnapshotError('truncated snapshot')
+        magic, header_length, crc = PREFIX.unpack_from(self._map)
+        if magic != MAGIC:
+            raise SnapshotError('not an index snapshot')
+        if verify and zlib.crc32(memoryview(self._map)[PREFIX.size:]) != crc:
+            raise SnapshotError('checksum mismatch')
+        self.header = serialization.loads(self._map[PREFIX.size:PREFIX.size + header_length])
+        if self.header.get('format_version') != FORMAT_VERSION:
+            raise SnapshotError(f'unsupported format version {self.header.get("format_version")}')
+        self._base = -(-(PREFIX.size + header_length) // ALIGN) * ALIGN
+
+    def _bytes(self, name):
+        section = self.header['sections'][name]
+        start = self._base + section['offset']
+        return self._map[start:start + section['length']]
+
+    def array(self, name):
+        section = self.header['sections'][name]
+        return np.frombuffer(self._map, dtype=section['dtype'], count=int(np.prod(section['shape'])),
+                             offset=self._base + section['offset']).reshape(section['shape'])
+
+    def records(self):
+        return serialization.loads(self._bytes('records'))
+
+    def vectors(self):
+        return self.array('vectors')
+
+    def lexical_index(self):
+        arrays = {name.split('.', 1)[1]: self.array(name)
+                  for name in self.header['sections'] if name.startswith('lexical.')}
+        return LexicalIndex.from_state(serialization.loads(self._bytes('lexical')), arrays)
+
+
+# Start from the snapshot when it was built with `model_id` from the current
+# faqs.json; otherwise rebuild it (encoding the corpus only when the FAQs or
+# the model changed). Returns (records, vectors, lexical index, how).
+def load_or_build(path, faqs_path, model_id, encode, load_records=serialization.load_file):
+    stamp = file_stamp(faqs_path) if os.path.exists(faqs_path) else None
+    try:
+        snapshot = Snapshot(path)
+    except (OSError, ValueError, SnapshotError):
+        snapshot = None
+    if snapshot is not None and snapshot.header['model'] == model_id:
+        if snapshot.header['faqs_stamp'] == stamp:
+            return snapshot.records(), snapshot.vectors(), snapshot.lexical_index(), 'snapshot'
+        # faqs.json was touched; reuse the vectors if the content is the same
+        records = load_records(faqs_path)
+        if records_digest(records) == snapshot.header['faqs_digest']:
+            lexical_index = snapshot.lexical_index()
+            write(path, records, snapshot.vectors(), lexical_index, model_id, stamp)
+            return records, Snapshot(path).vectors(), lexical_index, 'restamped'
+    records = load_records(faqs_path)
+    vectors = normalize_rows(encode([item['question'] for item in records]) if records else [])
+    lexical_index = LexicalIndex(records)
+    if len(vectors):
+        write(path, records, vectors, lexical_index, model_id, stamp)
+    return records, vectors, lexical_index, 'rebuilt'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or inspect the FAQ index snapshot')
+    parser.add_argument('command', choices=['build', 'info'])
+    parser.add_argument('--faqs', default=os.path.join(os.path.dirname(__file__), '..', 'faqs.json'))
+    parser.add_argument('--snapshot')
+    args = parser.parse_args()
+    path = args.snapshot or os.path.splitext(args.faqs)[0] + '.snapshot'
+
+    start = time.perf_counter()
+    if args.command == 'info':
+        snapshot = Snapshot(path)
+        header = dict(snapshot.header, sections=list(snapshot.header['sections']))
+        print(serialization.dumps(header, pretty=True).decode())
+        snapshot.records()
+        snapshot.lexical_index()
+        print(f'verified and loaded in {(time.perf_counter() - start) * 1000:.1f} ms')
+        return
+    from .encoders import load_encoder
+    model_name = os.environ.get('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+    backend = os.environ.get('ENCODER_BACKEND', 'torch')
+    encoder = load_encoder(model_name, backend)
+    if os.path.exists(path):
+        os.remove(path)
+    records, _, _, _ = load_or_build(path, args.faqs, f'{model_name}:{backend}', encoder.encode)
+    print(f'{len(records)} FAQs written to {path} in {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
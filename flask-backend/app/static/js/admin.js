@@ -0,0 +1,157 @@
+// Theme toggle logic
+const themeToggle = document.getElementById('themeToggle');
+let darkMode = false;
+themeToggle.onclick = () => {
+  darkMode = !darkMode;
+  if (darkMode) {
+    document.body.classList.add('dark');
+    themeToggle.innerHTML = '☀️';
+    localStorage.setItem('adminDarkMode', 'true');
+  } else {
+    document.body.classList.remove('dark');
+    themeToggle.innerHTML = '🌙';
+    localStorage.setItem('adminDarkMode', 'false');
+  }
+};
+window.onload = () => {
+  const darkModePreference = localStorage.getItem('adminDarkMode');
+  if (darkModePreference === 'true') {
+    darkMode = true;
+    document.body.classList.add('dark');
+    themeToggle.innerHTML = '☀️';
+  } else {
+    darkMode = false;
+    document.body.classList.remove('dark');
+    themeToggle.innerHTML = '🌙';
+  }
+};
+
+// FAQ logic
+const faqs = JSON.parse(document.getElementById('faqData').textContent);
+const pw = encodeURIComponent(new URLSearchParams(location.search).get('pw') || '');
+
+// Edit FAQ logic
+const cancelEditBtn = document.getElementById('cancelEditBtn');
+const faqForm = document.getElementById('faqForm');
+
+function editFAQ(index) {
+  const faq = faqs[index];
+  faqForm.question.value = faq.question;
+  faqForm.answer.value = faq.answer;
+  faqForm.category.value = faq.category || '';
+  faqForm.dataset.editing = index;
+  faqForm.querySelector('button[type="submit"]').textContent = "Update FAQ";
+  cancelEditBtn.style.display = "inline-block";
+  faqForm.scrollIntoView({ behavior: 'smooth', block: 'center' });
+  faqForm.question.focus();
+}
+
+// Suggested FAQ: start a new FAQ from the most common wording
+const suggestions = JSON.parse(document.getElementById('suggestionData').textContent);
+
+function useSuggestion(index) {
+  cancelEditBtn.onclick();
+  faqForm.question.value = suggestions[index].label;
+  faqForm.scrollIntoView({ behavior: 'smooth', block: 'center' });
+  faqForm.answer.focus();
+}
+
+cancelEditBtn.onclick = function() {
+  faqForm.reset();
+  faqForm.dataset.editing = "";
+  faqForm.querySelector('button[type="submit"]').textContent = "Add FAQ";
+  cancelEditBtn.style.display = "none";
+};
+
+// Add/Edit form handler
+document.getElementById('faqForm').onsubmit = async function(e) {
+  e.preventDefault();
+  const form = e.target;
+  const editing = form.dataset.editing;
+  const url = editing !== undefined && editing !== ""
+    ? `/admin/edit?pw=${pw}`
+    : `/admin/add?pw=${pw}`;
+  const payload = {
+    question: form.question.value,
+    answer: form.answer.value,
+    category: form.category.value || ''
+  };
+  if (editing !== undefined && editing !== "") payload.index = parseInt(editing);
+
+  const res = await fetch(url, {
+    method: 'POST',
+    headers: {'Content-Type': 'application/json'},
+    body: JSON.stringify(payload)
+  });
+
+  if (res.ok) {
+    form.reset();
+    form.dataset.editing = "";
+    form.querySelector('button[type="submit"]').textContent = "Add FAQ";
+    document.getElementById('faqSearch').value = '';
+    location.reload();
+  } else {
+    alert('Failed to ' + (editing !== undefined && editing !== "" ? 'edit' : 'add') + ' FAQ');
+  }
+};
+
+// Delete FAQ
+async function deleteFAQ(index) {
+  if (!confirm("Are you sure you want to delete this FAQ?")) return;
+  const res = await fetch(`/admin/delete?pw=${pw}`, {
+    method: 'POST',
+    headers: {'Content-Type': 'application/json'},
+    body: JSON.stringify({ index })
+  });
+  if (res.ok) {
+    location.reload();
+  } else {
+    alert('Failed to delete FAQ');
+  }
+}
+
+// PDF upload handler (clear file input after upload)
+document.getElementById('pdfForm').onsubmit = async function(e) {
+  e.preventDefault();
+  const form = e.target;
+  const formData = new FormData(form);
+  const res = await fetch(`/admin/upload_pdf?pw=${pw}`, {
+    method: 'POST',
+    body: formData
+  });
+  const data = await res.json();
+  form.reset(); // Clear PDF file input after upload
+  if (data.status === 'ok') {
+    alert('Imported ' + data.added + ' FAQs from PDF!');
+    location.reload();
+  } else {
+    alert('Error: ' + (data.message || 'Could not import PDF'));
+  }
+};
+
+// CSV / JSONL bulk import
+document.getElementById('importForm').onsubmit = async function(e) {
+  e.preventDefault();
+  const form = e.target;
+  const res = await fetch(`/admin/import?pw=${pw}`, {
+    method: 'POST',
+    body: new FormData(form)
+  });
+  const data = await res.json();
+  form.reset();
+  if (data.status === 'ok') {
+    alert(`Imported ${data.added} FAQs (${data.duplicates} duplicates and ${data.invalid} invalid rows skipped)`);
+    location.reload();
+  } else {
+    alert('Error: ' + (data.message || 'Could not import file'));
+  }
+};
+
+// FAQ search (optional: clear on add/edit)
+document.getElementById('faqSearch').addEventListener('input', function() {
+  const val = this.value.toLowerCase();
+  document.querySelectorAll('#faqList .faq-item').forEach(li => {
+    li.style.display = li.textContent.toLowerCase().includes(val) ? '' : 'none';
+  });
+});
+
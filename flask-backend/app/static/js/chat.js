@@ -0,0 +1,227 @@
+const chatbox = document.getElementById('chatbox');
+const input = document.getElementById('questionInput');
+const sendBtn = document.getElementById('sendBtn');
+sendBtn.disabled = true;
+
+function addBubble(text, sender) {
+  const bubble = document.createElement('div');
+  bubble.className = 'bubble ' + sender;
+  if (sender === 'bot') {
+    // Bot avatar
+    const avatar = document.createElement('div');
+    avatar.className = 'bot-avatar';
+    avatar.innerText = '🤖';
+    bubble.appendChild(avatar);
+
+    // Bubble content
+    const content = document.createElement('div');
+    content.className = 'bubble-content';
+    content.innerHTML = marked.parse(text);
+
+    // Copy button
+    const copyBtn = document.createElement('button');
+    copyBtn.className = 'copy-btn';
+    copyBtn.innerText = 'Copy';
+    copyBtn.onclick = () => {
+      navigator.clipboard.writeText(content.innerText);
+      copyBtn.innerText = 'Copied!';
+      setTimeout(() => copyBtn.innerText = 'Copy', 1000);
+    };
+    content.appendChild(copyBtn);
+
+    // Timestamp
+    const time = document.createElement('div');
+    time.className = 'timestamp';
+    time.innerText = new Date().toLocaleTimeString();
+    content.appendChild(time);
+
+    bubble.appendChild(content);
+  } else {
+    bubble.innerText = text;
+    const time = document.createElement('div');
+    time.className = 'timestamp';
+    time.innerText = new Date().toLocaleTimeString();
+    bubble.appendChild(time);
+  }
+  chatbox.appendChild(bubble);
+  chatbox.scrollTop = chatbox.scrollHeight;
+  return bubble;
+}
+
+// Replace the text of a bot bubble, keeping its copy button and timestamp
+function setBubbleText(bubble, text) {
+  const content = bubble.querySelector('.bubble-content');
+  const extras = Array.from(content.querySelectorAll('.copy-btn, .timestamp, .related'));
+  content.innerHTML = marked.parse(text);
+  extras.forEach(el => content.appendChild(el));
+  chatbox.scrollTop = chatbox.scrollHeight;
+}
+
+// "Related questions" buttons under a bot bubble
+function addRelated(bubble, faqs) {
+  const content = bubble.querySelector('.bubble-content');
+  const list = document.createElement('div');
+  list.className = 'related';
+  faqs.forEach(faq => {
+    const btn = document.createElement('button');
+    btn.innerText = faq.question;
+    btn.onclick = () => quickAsk(faq.question);
+    list.appendChild(btn);
+  });
+  content.insertBefore(list, content.querySelector('.copy-btn'));
+  chatbox.scrollTop = chatbox.scrollHeight;
+}
+
+function showTyping() {
+  const typing = document.createElement('div');
+  typing.id = 'typing-indicator';
+  typing.className = 'bubble bot';
+  typing.innerHTML = '<div class="bot-avatar">🤖</div><div class="bubble-content">Bot is typing...</div>';
+  chatbox.appendChild(typing);
+  chatbox.scrollTop = chatbox.scrollHeight;
+}
+function hideTyping() {
+  const typing = document.getElementById('typing-indicator');
+  if (typing) typing.remove();
+}
+
+// Parse a text/event-stream body, calling onEvent(name, data) per event
+async function readEvents(res, onEvent) {
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let end;
+    while ((end = buffer.indexOf('\n\n')) >= 0) {
+      const block = buffer.slice(0, end);
+      buffer = buffer.slice(end + 2);
+      let name = 'message', data = '';
+      block.split('\n').forEach(line => {
+        if (line.startsWith('event: ')) name = line.slice(7);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+      });
+      if (data) onEvent(name, JSON.parse(data));
+    }
+  }
+}
+
+// Ask through /ask/stream: a quick guess shows at once (dimmed) and is
+// replaced by the final answer, followed by related questions
+async function askStreaming(question) {
+  const res = await fetch('/ask/stream', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ question })
+  });
+  if (!res.ok || !res.body || !(res.headers.get('Content-Type') || '').startsWith('text/event-stream')) {
+    const data = await res.json();
+    hideTyping();
+    addBubble(data.answer, 'bot');
+    return;
+  }
+  let bubble = null;
+  await readEvents(res, (name, data) => {
+    if (name === 'preliminary' || name === 'answer') {
+      hideTyping();
+      if (bubble) setBubbleText(bubble, data.answer);
+      else bubble = addBubble(data.answer, 'bot');
+      bubble.classList.toggle('preliminary', name === 'preliminary');
+    } else if (name === 'related' && data.faqs.length) {
+      if (!bubble) {
+        hideTyping();
+        bubble = addBubble('Related questions:', 'bot');
+      }
+      addRelated(bubble, data.faqs);
+    }
+  });
+  hideTyping();
+  if (!bubble) throw new Error('empty stream');
+}
+
+async function sendQuestion() {
+  const question = input.value.trim();
+  if (!question) return;
+  addBubble(question, 'user');
+  input.value = '';
+  showTyping();
+  sendBtn.disabled = true;
+  try {
+    await askStreaming(question);
+  } catch (e) {
+    hideTyping();
+    addBubble("Sorry, something went wrong. Please try again later.", 'bot');
+  }
+  sendBtn.disabled = false;
+  input.focus();
+}
+
+function quickAsk(question) {
+  input.value = question;
+  sendQuestion();
+}
+
+// Enable send button only if input is not empty
+input.addEventListener('input', () => {
+  sendBtn.disabled = input.value.trim().length === 0;
+});
+
+// Theme toggle
+const themeToggle = document.getElementById('themeToggle');
+let darkMode = false;
+themeToggle.onclick = () => {
+  darkMode = !darkMode;
+  if (darkMode) {
+    document.body.classList.add('dark');
+    themeToggle.innerHTML = '☀️';
+    localStorage.setItem('darkMode', 'true');
+  } else {
+    document.body.classList.remove('dark');
+    themeToggle.innerHTML = '🌙';
+    localStorage.setItem('darkMode', 'false');
+  }
+};
+// Load dark mode preference
+window.onload = () => {
+  const darkModePreference = localStorage.getItem('darkMode');
+  if (darkModePreference === 'true') {
+    darkMode = true;
+    document.body.classList.add('dark');
+    themeToggle.innerHTML = '☀️';
+  } else {
+    darkMode = false;
+    document.body.classList.remove('dark');
+    themeToggle.innerHTML = '🌙';
+  }
+  if (!chatbox.innerHTML) {
+    addBubble("Hi! I'm your CUT FAQ assistant. Ask me anything about the application process.", 'bot');
+  }
+  input.focus();
+};
+
+async function waitForModel() {
+  let ready = false;
+  const overlay = document.getElementById('loadingOverlay');
+  while (!ready) {
+    const res = await fetch('/model_status');
+    const data = await res.json();
+    ready = data.ready;
+    if (!ready) {
+      overlay.style.display = 'flex';
+      await new Promise(r => setTimeout(r, 1500));
+    }
+  }
+  overlay.style.display = 'none';
+}
+
+function showToast(msg, color="#2563eb") {
+  const toast = document.getElementById('toast');
+  toast.textContent = msg;
+  toast.style.background = color;
+  toast.style.display = 'block';
+  setTimeout(() => { toast.style.display = 'none'; }, 2200);
+}
+
+waitForModel();
@@ -0,0 +1,259 @@
+import atexit
+import contextlib
+import datetime
+import fcntl
+import glob
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from . import serialization
+
+logger = logging.getLogger(__name__)
+
+
+# Exclusive advisory lock shared by every process writing `path`
+@contextlib.contextmanager
+def locked(path):
+    with open(path + '.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+# Write to a temp file in the same directory, fsync, then rename over
+# `path`: readers see either the old file or the new one, never a torn write
+def atomic_write(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            os.chmod(tmp, os.stat(path).st_mode & 0o777)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp)
+        raise
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def backup_dir(path):
+    return os.path.join(os.path.dirname(os.path.abspath(path)), os.path.splitext(os.path.basename(path))[0] + '_backups')
+
+
+def backups(path):
+    name, ext = os.path.splitext(os.path.basename(path))
+    return sorted(glob.glob(os.path.join(backup_dir(path), f'{name}.*{ext}')), reverse=True)
+
+
+# Copy the current file into the backups folder, keeping the newest `keep`
+def backup(path, keep=10):
+    if keep <= 0 or not os.path.exists(path):
+        return None
+    name, ext = os.path.splitext(os.path.basename(path))
+    os.makedirs(backup_dir(path), exist_ok=True)
+    stamp = datetime.datetime.now().strftime('%Y%m%dT%H%M%S.%f')
+    target = os.path.join(backup_dir(path), f'{name}.{stamp}{ext}')
+    shutil.copy2(path, target)
+    for old in backups(path)[keep:]:
+        with contextlib.suppress(OSError):
+            os.remove(old)
+    return target
+
+
+def _save(path, records, keep_backups):
+    backup(path, keep_backups)
+    atomic_write(path, serialization.dump_records(records))
+
+
+def save_records(path, records, keep_backups=10):
+    with locked(path):
+        _save(path, records, keep_backups)
+
+
+# Read-modify-write under the lock: update(records) returns the new records
+def update_records(path, update, keep_backups=10):
+    with locked(path):
+        records = load_records(path)
+        records = update(records)
+        _save(path, records, keep_backups)
+        return records
+
+
+def _key(record):
+    return ((record.get('question') or '').strip().lower(), (record.get('answer') or '').strip())
+
+
+# FAQ changes not written yet. Instead of saving a process's whole copy of
+# the records, the changes are replayed onto the file's current records
+# under the lock (see apply_changes), so changes other processes wrote in
+# the meantime are kept.
+class PendingChanges:
+    def __init__(self):
+        self._changes = []
+        self._lock = threading.Lock()
+
+    def add(self, records):
+        self._append(('add', [dict(record) for record in records]))
+
+    def edit(self, old, new):
+        self._append(('edit', dict(old), dict(new)))
+
+    def delete(self, old):
+        self._append(('delete', dict(old)))
+
+    def _append(self, change):
+        with self._lock:
+            self._changes.append(change)
+
+    # Remove and return the changes, for writing
+    def take(self):
+        with self._lock:
+            changes, self._changes = self._changes, []
+        return changes
+
+    # Put back changes whose write failed, ahead of newer ones
+    def restore(self, changes):
+        with self._lock:
+            self._changes[:0] = changes
+
+    def pending(self):
+        with self._lock:
+            return list(self._changes)
+
+    def __len__(self):
+        return len(self._changes)
+
+
+# `records` with `changes` from PendingChanges applied. Records are matched
+# by question (case-insensitive) and answer. An add already present is
+# skipped, an edit of a record that is gone is added (unless its new
+# version is already there), and a delete of a record that is gone does
+# nothing.
+def apply_changes(records, changes):
+    records = list(records)
+    positions = {}
+    for i, record in enumerate(records):
+        positions.setdefault(_key(record), i)
+    for change in changes:
+        if change[0] == 'add':
+            for record in change[1]:
+                if _key(record) not in positions:
+                    positions[_key(record)] = len(records)
+                    records.append(record)
+            continue
+        i = positions.pop(_key(change[1]), None)
+        if change[0] == 'edit':
+            if i is None:
+                if _key(change[2]) in positions:
+                    continue
+                i = len(records)
+                records.append(None)
+            records[i] = change[2]
+            positions.setdefault(_key(change[2]), i)
+        elif i is not None:
+            records[i] = None
+    return [record for record in records if record is not None]
+
+
+# The records in `path`, or from the newest readable backup if the file is
+# missing or corrupt. Returns [] only when there is nothing to fall back to.
+def load_records(path):
+    for candidate in [path] + backups(path):
+        try:
+            records = serialization.load_file(candidate)
+        except (OSError, ValueError):
+            continue
+        if isinstance(records, list):
+            return records
+    return []
+
+
+# Debounced writer: schedule() asks for a flush, which runs `delay` seconds
+# after the last request (but never more than `max_delay` after the first),
+# so a burst of admin edits becomes one write. flush() writes now; pending
+# work is also flushed at interpreter exit. A failed write is logged and
+# retried every `retry_delay` seconds until one succeeds.
+class WriteCoalescer:
+    def __init__(self, write, delay=0.5, max_delay=5.0, retry_delay=5.0):
+        self.write = write
+        self.delay = delay
+        self.max_delay = max_delay
+        self.retry_delay = retry_delay
+        self.writes = 0
+        self.requests = 0
+        self.failures = 0
+        self.last_error = None
+        self._first = None
+        self._timer = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        atexit.register(self._background_flush)
+
+    def schedule(self):
+        if self.delay <= 0:
+            self.requests += 1
+            return self.flush(force=True)
+        with self._lock:
+            self.requests += 1
+            now = time.monotonic()
+            if self._first is None:
+                self._first = now
+            self._start_timer(min(self.delay, max(0.0, self._first + self.max_delay - now)))
+
+    # Call with self._lock held
+    def _start_timer(self, wait):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(wait, self._background_flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    # Timer and exit-time flushes: failures are logged and retried by flush()
+    def _background_flush(self):
+        with contextlib.suppress(Exception):
+            self.flush()
+
+    @property
+    def pending(self):
+        return self._first is not None
+
+    def flush(self, force=False):
+        with self._flush_lock:
+            with self._lock:
+                if self._first is None and not force:
+                    return
+                self._first = None
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            try:
+                self.write()
+            except Exception as e:
+                self.failures += 1
+                self.last_error = f'{type(e).__name__}: {e}'
+                logger.exception('write failed, retrying in %.1f s', self.retry_delay)
+                with self._lock:
+                    if self._first is None:
+                        self._first = time.monotonic()
+                    self._start_timer(self.retry_delay)
+                raise
+            self.writes += 1
+
+    def stats(self):
+        return {'requests': self.requests, 'writes': self.writes, 'pending': self.pending,
+                'failures': self.failures, 'last_error': self.last_error,
+                'delay': self.delay, 'max_delay': self.max_delay}
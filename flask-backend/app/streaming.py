@@ -0,0 +1,86 @@
+import zlib
+
+from flask import current_app, request, stream_with_context
+
+from . import serialization
+
+CHUNK_SIZE = 64 * 1024
+
+
+# Helper: encode a list of records as a JSON array, one chunk at a time.
+# With pretty=True the output matches json.dumps(items, indent=2).
+def iter_json_array(items, pretty=False, chunk_size=CHUNK_SIZE):
+    opening, separator, closing = (b'[\n', b',\n', b'\n]') if pretty else (b'[', b',', b']')
+    buffer = []
+    size = 0
+    count = 0
+    for item in items:
+        data = serialization.dumps(item, pretty=pretty)
+        if pretty:
+            data = b'  ' + data.replace(b'\n', b'\n  ')
+        data = (separator if count else opening) + data
+        count += 1
+        buffer.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    buffer.append(closing if count else b'[]')
+    yield b''.join(buffer)
+
+
+# Helper: gzip a stream of byte chunks without buffering the whole body
+def gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# Stream `chunks` as a response, gzip-compressed when the client accepts it.
+# `etag` identifies the uncompressed content; unchanged content returns 304.
+def streamed_response(chunks, etag, mimetype='application/json', headers=None,
+                      cache_control='private, no-cache'):
+    use_gzip = current_app.config.get('STREAM_GZIP', True) and bool(request.accept_encodings['gzip'])
+    tag = f'{etag}-gzip' if use_gzip else etag
+    if request.if_none_match.contains(tag):
+        response = current_app.response_class(status=304)
+    else:
+        if use_gzip:
+            chunks = gzip_chunks(chunks)
+        response = current_app.response_class(stream_with_context(chunks), mimetype=mimetype)
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+        for key, value in (headers or {}).items():
+            response.headers[key] = value
+    response.set_etag(tag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def streamed_json_response(items, etag, pretty=False, headers=None):
+    return streamed_response(iter_json_array(items, pretty=pretty), etag, headers=headers)
+
+
+# Helper: one server-sent event with a JSON payload
+def sse_event(event, data):
+    return b'event: ' + event.encode() + b'\ndata: ' + serialization.dumps(data) + b'\n\n'
+
+
+# Stream (event, data) pairs as text/event-stream. Each event is flushed as
+# it is produced, so this is never compressed or buffered by a proxy.
+def event_stream_response(events):
+    def chunks():
+        # A comment line, so the headers go out before the first stage runs
+        yield b': stream\n\n'
+        for event, data in events:
+            yield sse_event(event, data)
+
+    response = current_app.response_class(stream_with_context(chunks()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,221 @@
+import collections
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from . import serialization, snapshot, storage
+from .lexical import LexicalIndex
+from .retrieval import DenseIndex, category_key
+
+TENANT_NAME = re.compile(r'^[a-z0-9][a-z0-9_-]{0,63}$')
+# Decoded records take roughly this many times their JSON size in memory
+RECORD_OVERHEAD = 3
+FAQ_BACKUPS = int(os.environ.get('FAQ_BACKUPS', '10'))
+
+
+class UnknownTenant(KeyError):
+    pass
+
+
+# One tenant's FAQs and the indexes built from them, stored in its own
+# directory as faqs.json plus an index snapshot (see snapshot.py)
+class KnowledgeBase:
+    def __init__(self, name, directory, model_id, encode):
+        self.name = name
+        self.directory = directory
+        self.model_id = model_id
+        self.encode = encode
+        self.faqs_path = os.path.join(directory, 'faqs.json')
+        self.snapshot_path = os.path.join(directory, 'faqs.snapshot')
+        self.lock = threading.RLock()
+        self.stamp = self._stamp()
+        records, vectors, lexical, self.loaded_from = snapshot.load_or_build(
+            self.snapshot_path, self.faqs_path, model_id, encode, storage.load_records)
+        self._set(records, vectors, lexical)
+
+    def _stamp(self):
+        return snapshot.file_stamp(self.faqs_path) if os.path.exists(self.faqs_path) else None
+
+    def _set(self, records, vectors, lexical=None):
+        self.faqs = records
+        self.vectors = vectors
+        self.lexical = lexical or LexicalIndex(records)
+        self.dense = DenseIndex(records, vectors)
+        self.nbytes = (np.asarray(vectors).nbytes + self.dense.matrix.nbytes
+                       + sum(rows.nbytes for rows in self.lexical.postings.values())
+                       + RECORD_OVERHEAD * len(serialization.dump_records(records)))
+
+    # True when faqs.json was changed by someone else (another worker)
+    def stale(self):
+        return self._stamp() != self.stamp
+
+    def __len__(self):
+        return len(self.faqs)
+
+    def _category_ok(self, idx, category):
+        return not category or category_key(self.faqs[idx].get('category')) == category_key(category)
+
+    def fast_answer(self, question, category=None):
+        match = self.lexical.match(question)
+        if match and self._category_ok(match[0], category):
+            return {'answer': self.faqs[match[0]]['answer'], 'source': 'lexical', 'score': match[1]}
+        return None
+
+    def lexical_answer(self, question, category=None, threshold=0.6):
+        for idx, score in self.lexical.search(question, 5):
+            if score < threshold:
+                break
+            if self._category_ok(idx, category):
+                return {'answer': self.faqs[idx]['answer'], 'source': 'lexical', 'score': score, 'degraded': True}
+        return None
+
+    # [(faq, score)] for a normalized query vector, best first
+    def search(self, vector, top_k=1, category=None):
+        if not len(self.dense):
+            return []
+        results = self.dense.search(vector, top_k, [category] if category else None)
+        return [(self.faqs[idx], score) for idx, score in results]
+
+    # Add records (already encoded as `vectors`) to faqs.json under its lock,
+    # keeping what other workers added meanwhile, then write the snapshot.
+    # Only records this copy hasn't embedded yet are encoded.
+    def add(self, records, vectors):
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            changes = [('add', records)]
+            faqs = storage.update_records(self.faqs_path, lambda current: storage.apply_changes(current, changes),
+                                          FAQ_BACKUPS)
+            self.stamp = self._stamp()
+            known = dict(zip((faq.get('question') for faq in self.faqs), np.asarray(self.vectors)))
+            known.update(zip((faq.get('question') for faq in records), vectors))
+            missing = list(dict.fromkeys(faq.get('question', '') for faq in faqs if faq.get('question') not in known))
+            if missing:
+                known.update(zip(missing, snapshot.normalize_rows(self.encode(missing))))
+            rows = [known[faq.get('question', '')] for faq in faqs]
+            self._set(faqs, np.vstack(rows) if rows else np.asarray(vectors)[:0])
+            snapshot.write(self.snapshot_path, faqs, self.vectors, self.lexical, self.model_id, self.stamp)
+
+
+# Tenants' knowledge bases, loaded on first use and kept resident while
+# their estimated size fits in `memory_budget` bytes; past that the least
+# recently used ones are dropped (and reloaded from their snapshot, which
+# is fast, the next time they are asked). Usage is counted per tenant,
+# resident or not.
+class TenantRegistry:
+    def __init__(self, root, model_id, encode, memory_budget):
+        self.root = root
+        self.model_id = model_id
+        self.encode = encode
+        self.memory_budget = memory_budget
+        self._resident = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = collections.defaultdict(threading.Lock)
+        self._metrics = collections.defaultdict(collections.Counter)
+        self._last_used = {}
+        self._load_ms = {}
+
+    def directory(self, name):
+        return os.path.join(self.root, name)
+
+    def exists(self, name):
+        return bool(TENANT_NAME.match(name or '')) and os.path.isdir(self.directory(name))
+
+    def names(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if self.exists(name))
+
+    # The tenant's knowledge base, loading it if needed. create=True makes
+    # an empty one for a new tenant (used by imports).
+    def get(self, name, create=False):
+        if not TENANT_NAME.match(name or ''):
+            raise UnknownTenant(name)
+        with self._lock:
+            kb = self._resident.get(name)
+            if kb is not None and not kb.stale():
+                self._resident.move_to_end(name)
+                self._touch(name, 'hits')
+                return kb
+        if not create and not self.exists(name):
+            raise UnknownTenant(name)
+        # One load per tenant at a time; other tenants load in parallel
+        with self._load_locks[name]:
+            with self._lock:
+                kb = self._resident.get(name)
+                if kb is not None and not kb.stale():
+                    self._touch(name, 'hits')
+                    return kb
+            start = time.perf_counter()
+            os.makedirs(self.directory(name), exist_ok=True)
+            kb = KnowledgeBase(name, self.directory(name), self.model_id, self.encode)
+            with self._lock:
+                self._load_ms[name] = round((time.perf_counter() - start) * 1000, 2)
+                self._resident[name] = kb
+                self._touch(name, 'loads')
+                self._evict(keep=name)
+            return kb
+
+    def _touch(self, name, event):
+        self._metrics[name][event] += 1
+        self._last_used[name] = time.time()
+
+    def _evict(self, keep):
+        while self.resident_bytes() > self.memory_budget and len(self._resident) > 1:
+            name = next(iter(self._resident))
+            if name == keep:
+                self._resident.move_to_end(name)
+                continue
+            del self._resident[name]
+            self._metrics[name]['evictions'] += 1
+
+    # After a model switch every tenant is reloaded (and re-encoded) lazily
+    def switch_model(self, model_id):
+        with self._lock:
+            self.model_id = model_id
+            self._resident.clear()
+
+    def resident_bytes(self):
+        return sum(kb.nbytes for kb in self._resident.values())
+
+    # Add records to a tenant (creating it if needed) with one write
+    def add(self, name, records, vectors):
+        kb = self.get(name, create=True)
+        # Held so no request reloads the tenant halfway through the write
+        with self._load_locks[name]:
+            kb.add(records, vectors)
+        with self._lock:
+            self._evict(keep=name)
+        return kb
+
+    def record(self, name, event):
+        with self._lock:
+            self._metrics[name][event] += 1
+
+    def stats(self):
+        with self._lock:
+            resident = dict(self._resident)
+            tenants = []
+            for name in sorted(set(self.names()) | set(self._metrics)):
+                kb = resident.get(name)
+                counts = self._metrics.get(name, {})
+                tenants.append({
+                    'tenant': name, 'resident': kb is not None,
+                    'faqs': len(kb) if kb is not None else None,
+                    'bytes': kb.nbytes if kb is not None else 0,
+                    'requests': counts.get('hits', 0) + counts.get('loads', 0),
+                    'answered': counts.get('answered', 0), 'unanswered': counts.get('unanswered', 0),
+                    'loads': counts.get('loads', 0), 'evictions': counts.get('evictions', 0),
+                    'last_load_ms': self._load_ms.get(name),
+                    'idle_seconds': round(time.time() - self._last_used[name], 1) if name in self._last_used else None,
+                })
+        tenants.sort(key=lambda t: t['requests'], reverse=True)
+        return {'resident': len(resident), 'resident_bytes': sum(kb.nbytes for kb in resident.values()),
+                'memory_budget': self.memory_budget, 'tenants': tenants}
+
+
+def from_env(model_id, encode):
+    root = os.environ.get('TENANTS_DIR') or os.path.join(os.path.dirname(__file__), '..', 'tenants')
+    return TenantRegistry(root, model_id, encode, float(os.environ.get('TENANT_MEMORY_MB', '512')) * 1024 * 1024)
@@ -0,0 +1,9 @@
+from app import create_app
+from app.aio import AsyncApp
+
+# Async entry point: uvicorn asgi:app  (or gunicorn asgi:app -k uvicorn.workers.UvicornWorker)
+app = AsyncApp(create_app())
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app)
@@ -0,0 +1,91 @@
+"""Compare encoder backends: import/load time, RSS, query latency, throughput.
+
+Each backend runs in a fresh subprocess so import time and memory are
+measured in isolation. ONNX backends need `python -m app.encoders export`
+first; the parity check needs torch as well.
+
+    python benchmarks/bench_encoders.py --backends torch onnx onnx-int8 --parity
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+
+def worker(backend, model_name, queries, batch_size):
+    start = time.perf_counter()
+    from app import serialization
+    from app.encoders import load_encoder
+    encoder = load_encoder(model_name, backend)
+    load_s = time.perf_counter() - start
+
+    import numpy as np
+    texts = [faq['question'] for faq in serialization.load_file(os.path.join(ROOT, 'faqs.json'))]
+    encoder.encode(texts[:4])  # warm up
+    latencies = []
+    for i in range(queries):
+        t = time.perf_counter()
+        encoder.encode([texts[i % len(texts)]])
+        latencies.append((time.perf_counter() - t) * 1000)
+    corpus = (texts * (2048 // len(texts) + 1))[:2048]
+    t = time.perf_counter()
+    encoder.encode(corpus, batch_size=batch_size)
+    throughput = len(corpus) / (time.perf_counter() - t)
+    p50, p95 = np.percentile(latencies, [50, 95])
+    return {
+        'backend': backend,
+        'load_s': round(load_s, 2),
+        'query_p50_ms': round(float(p50), 2),
+        'query_p95_ms': round(float(p95), 2),
+        'batch_texts_per_s': round(throughput, 1),
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backends', nargs='+', default=['torch', 'onnx', 'onnx-int8'])
+    parser.add_argument('--model', default=os.environ.get('EMBEDDING_MODEL', 'all-MiniLM-L6-v2'))
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--parity', action='store_true', help='also report cosine agreement with torch')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(args.worker, args.model, args.queries, args.batch_size)))
+        return
+
+    rows = []
+    for backend in args.backends:
+        proc = subprocess.run(
+            [sys.executable, __file__, '--worker', backend, '--model', args.model,
+             '--queries', str(args.queries), '--batch-size', str(args.batch_size)],
+            capture_output=True, text=True)
+        if proc.returncode:
+            print(f'{backend}: failed\n{proc.stderr.strip().splitlines()[-1]}')
+            continue
+        rows.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    columns = ['backend', 'load_s', 'query_p50_ms', 'query_p95_ms', 'batch_texts_per_s', 'max_rss_mb']
+    print(''.join(f'{c:>18}' for c in columns))
+    for row in rows:
+        print(''.join(f'{row[c]:>18}' for c in columns))
+
+    if args.parity:
+        from app import serialization
+        from app.encoders import parity
+        texts = [faq['question'] for faq in serialization.load_file(os.path.join(ROOT, 'faqs.json'))]
+        for backend in args.backends:
+            if backend != 'torch':
+                print(json.dumps(parity(args.model, texts, backend)))
+
+
+if __name__ == '__main__':
+    main()
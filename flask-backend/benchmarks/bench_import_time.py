@@ -0,0 +1,81 @@
+"""Import-time breakdown and time to the first /health response.
+
+Runs `python -X importtime` on the app factory in a fresh process and
+sums the import time of every module per top-level package, then starts
+another fresh process and times interpreter start -> first 200 from
+/health. Run it after the index snapshot exists (the first start builds
+it, which needs the model). Exits non-zero when the /health time is over
+--target-ms.
+
+    python benchmarks/bench_import_time.py --top 15 --target-ms 1500
+"""
+import argparse
+import collections
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+STARTUP = '''
+import time
+from app import create_app
+app = create_app()
+response = app.test_client().get('/health')
+assert response.status_code == 200, response.status_code
+print(time.time())
+'''
+
+
+def child_env():
+    # Measure the cold path: no background model warm-up, no refresher thread
+    return dict(os.environ, MODEL_WARMUP='0', ANALYTICS_INTERVAL='0', PYTHONPATH=ROOT)
+
+
+def import_breakdown():
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'from app import create_app; create_app()'],
+                            cwd=ROOT, env=child_env(), capture_output=True, text=True, check=True)
+    packages = collections.Counter()
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        # Self times add up without double counting nested imports
+        packages[name.strip().split('.')[0]] += int(self_us)
+        total += int(self_us)
+    return packages, total
+
+
+def time_to_health(runs):
+    timings = []
+    for _ in range(runs):
+        start = time.time()
+        result = subprocess.run([sys.executable, '-c', STARTUP], cwd=ROOT, env=child_env(),
+                                capture_output=True, text=True, check=True)
+        timings.append((float(result.stdout.strip().splitlines()[-1]) - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--target-ms', type=float, default=1500.0)
+    args = parser.parse_args()
+
+    packages, total = import_breakdown()
+    print(f'imports: {total / 1000:.0f} ms total')
+    for name, micros in packages.most_common(args.top):
+        print(f'  {name:<28} {micros / 1000:8.1f} ms')
+
+    timings = sorted(time_to_health(args.runs))
+    best, median = timings[0], timings[len(timings) // 2]
+    print(f'time to first /health: best {best:.0f} ms, median {median:.0f} ms (target {args.target_ms:.0f} ms)')
+    if median > args.target_ms:
+        raise SystemExit(f'time to first /health {median:.0f} ms is over the {args.target_ms:.0f} ms target')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Measure what the cross-encoder re-ranking stage buys and what it costs.
+
+Each FAQ question is turned into a noisy paraphrase (a word dropped, words
+swapped) and searched with the bi-encoder alone and with re-ranking of the
+top N. Reports top-1 accuracy and per-stage latency percentiles.
+
+    python benchmarks/bench_rerank.py --top-n 5 --budget-ms 150
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from app import serialization  # noqa: E402
+from app.encoders import load_encoder  # noqa: E402
+from app.rerank import Reranker  # noqa: E402
+from app.lexical import top_rows  # noqa: E402
+
+
+def perturb(text, rng):
+    words = text.split()
+    if len(words) > 3:
+        words.pop(rng.randrange(len(words)))
+    if len(words) > 2:
+        i = rng.randrange(len(words) - 1)
+        words[i], words[i + 1] = words[i + 1], words[i]
+    return ' '.join(words)
+
+
+def percentiles(values):
+    p50, p95 = np.percentile(values, [50, 95])
+    return f'p50 {p50:7.2f} ms  p95 {p95:7.2f} ms'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default=os.environ.get('EMBEDDING_MODEL', 'all-MiniLM-L6-v2'))
+    parser.add_argument('--rerank-model', default=os.environ.get('RERANK_MODEL', 'cross-encoder/ms-marco-MiniLM-L-6-v2'))
+    parser.add_argument('--top-n', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=150.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    faqs = serialization.load_file(os.path.join(ROOT, 'faqs.json'))
+    rng = random.Random(args.seed)
+    queries = [(perturb(faq['question'], rng), i) for i, faq in enumerate(faqs)]
+
+    encoder = load_encoder(args.model)
+    matrix = np.asarray(encoder.encode([faq['question'] for faq in faqs]), dtype=np.float32)
+    reranker = Reranker(args.rerank_model, top_n=args.top_n, budget_ms=args.budget_ms)
+    while reranker.model() is None:
+        if reranker.stats()['error']:
+            raise SystemExit(reranker.stats()['error'])
+        time.sleep(0.1)
+
+    encode_ms, search_ms, rerank_ms = [], [], []
+    bi_hits = rerank_hits = 0
+    for question, expected in queries:
+        t0 = time.perf_counter()
+        vector = encoder.encode([question])[0]
+        t1 = time.perf_counter()
+        scores = matrix @ vector
+        rows = top_rows(scores, args.top_n)
+        t2 = time.perf_counter()
+        candidates = [(dict(faqs[row], row=int(row)), float(scores[row])) for row in rows]
+        reranked, _, _ = reranker.rerank(question, candidates)
+        t3 = time.perf_counter()
+        encode_ms.append((t1 - t0) * 1000)
+        search_ms.append((t2 - t1) * 1000)
+        rerank_ms.append((t3 - t2) * 1000)
+        bi_hits += candidates[0][0]['row'] == expected
+        rerank_hits += reranked[0][0]['row'] == expected
+
+    print(f'{len(queries)} queries, top-{args.top_n} candidates, budget {args.budget_ms} ms')
+    print(f'  encode  {percentiles(encode_ms)}')
+    print(f'  search  {percentiles(search_ms)}')
+    print(f'  rerank  {percentiles(rerank_ms)}')
+    print(f'  top-1 bi-encoder {bi_hits / len(queries):.3f}  re-ranked {rerank_hits / len(queries):.3f}')
+    print('  ' + ', '.join(f'{k}={v}' for k, v in reranker.stats().items() if k in
+                           ('pair_ms', 'affordable_pairs', 'changed_top', 'over_budget', 'skipped_budget')))
+
+
+if __name__ == '__main__':
+    main()
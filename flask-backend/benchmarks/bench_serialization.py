@@ -0,0 +1,94 @@
+"""Compare load/save/serialize cost of the FAQ knowledge base.
+
+Builds a synthetic corpus (50k entries by default) and times the old
+stdlib path (indent=2) against app.serialization (orjson when installed,
+compact one-record-per-line file format).
+
+    python benchmarks/bench_serialization.py --entries 50000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import serialization  # noqa: E402
+
+WORDS = ('application accommodation results wifi portal registration fee offer '
+         'student campus library password programme deadline transcript '
+         'bursary exam timetable medical aid food hostel login').split()
+
+
+def make_corpus(n, seed=0):
+    rng = random.Random(seed)
+    categories = ['Service', 'Application', 'Enrollment', 'Orientation', '']
+    return [{
+        'question': ' '.join(rng.choices(WORDS, k=8)).capitalize() + '?',
+        'answer': ' '.join(rng.choices(WORDS, k=40)).capitalize() + '. Contact icthelpdesk@cut.ac.zw.',
+        'category': rng.choice(categories),
+    } for _ in range(n)]
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.entries)
+    payload = {'answer': corpus[0]['answer'], 'source': 'local', 'score': 0.87}
+    tmp = tempfile.mkdtemp()
+    old_path = os.path.join(tmp, 'faqs_indent.json')
+    new_path = os.path.join(tmp, 'faqs_compact.json')
+
+    def old_save():
+        with open(old_path, 'w', encoding='utf-8') as f:
+            json.dump(corpus, f, ensure_ascii=False, indent=2)
+
+    def old_load():
+        with open(old_path, encoding='utf-8') as f:
+            json.load(f)
+
+    def new_save():
+        serialization.save_records(new_path, corpus)
+
+    def new_load():
+        serialization.load_file(new_path)
+
+    def old_responses():
+        for _ in range(10000):
+            json.dumps(payload, ensure_ascii=False, sort_keys=True)
+
+    def new_responses():
+        for _ in range(10000):
+            serialization.dumps(payload)
+
+    rows = [
+        ('save', timed(old_save, args.repeat), timed(new_save, args.repeat)),
+        ('load', timed(old_load, args.repeat), timed(new_load, args.repeat)),
+        ('serialize corpus', timed(lambda: json.dumps(corpus, ensure_ascii=False, indent=2), args.repeat),
+         timed(lambda: serialization.dump_records(corpus), args.repeat)),
+        ('10k /ask payloads', timed(old_responses, args.repeat), timed(new_responses, args.repeat)),
+    ]
+    print(f'{args.entries} entries, backend={serialization.backend_name()}')
+    print(f'{"operation":<20}{"stdlib ms":>12}{"new ms":>12}{"speedup":>10}')
+    for name, old, new in rows:
+        print(f'{name:<20}{old:>12.1f}{new:>12.1f}{old / new:>9.1f}x')
+    print(f'file size: {os.path.getsize(old_path) / 1e6:.1f} MB -> {os.path.getsize(new_path) / 1e6:.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Measure sharded vector search against the in-process matrix product.
+
+Builds a random normalized corpus of --rows embeddings, then for 1, 2, 4, ...
+shards up to the number of cores (or --shards) checks that every sharded
+result equals the in-process top-k and reports single-query latency and the
+throughput of --clients threads searching at once (which is where
+micro-batching and the extra cores pay off).
+
+    python benchmarks/bench_shards.py --rows 300000 --dim 384 --clients 8
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from app.lexical import top_rows  # noqa: E402
+from app.shards import ShardedSearch  # noqa: E402
+
+
+def percentiles(values):
+    p50, p95 = np.percentile(values, [50, 95])
+    return f'p50 {p50:7.2f} ms  p95 {p95:7.2f} ms'
+
+
+def normalized(rng, rows, dim):
+    matrix = rng.standard_normal((rows, dim), dtype=np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def latency(search, queries):
+    times = []
+    for query in queries:
+        t = time.perf_counter()
+        search(query)
+        times.append((time.perf_counter() - t) * 1000)
+    return times
+
+
+def throughput(search, queries, clients):
+    chunks = [queries[i::clients] for i in range(clients)]
+
+    def run(chunk):
+        for query in chunk:
+            search(query)
+
+    threads = [threading.Thread(target=run, args=(chunk,)) for chunk in chunks]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(queries) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=300000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=400)
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--shards', type=int, default=os.cpu_count() or 1, help='largest shard count to try')
+    parser.add_argument('--max-batch', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=0.5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    matrix = normalized(rng, args.rows, args.dim)
+    queries = normalized(rng, args.queries, args.dim)
+    print(f'{args.rows} x {args.dim} float32 ({matrix.nbytes / 2 ** 20:.0f} MB), top-{args.top_k}, '
+          f'{args.queries} queries, {args.clients} clients, {os.cpu_count()} cores')
+
+    def local(query):
+        scores = matrix @ query
+        return top_rows(scores, args.top_k)
+
+    expected = [local(query) for query in queries]
+    print(f'in-process    {percentiles(latency(local, queries))}  '
+          f'{throughput(local, queries, args.clients):8.1f} q/s')
+
+    counts = [1]
+    while counts[-1] * 2 <= args.shards:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != args.shards:
+        counts.append(args.shards)
+    for count in counts:
+        searcher = ShardedSearch(count, args.max_batch, args.max_wait_ms)
+        segment = searcher.load(matrix)
+
+        def sharded(query):
+            return searcher.search(query, args.top_k, None, segment.name)[0]
+
+        wrong = sum(not np.array_equal(sharded(query), rows) for query, rows in zip(queries, expected))
+        times = latency(sharded, queries)
+        qps = throughput(sharded, queries, args.clients)
+        stats = searcher.stats()
+        print(f'{count:2d} shard(s)   {percentiles(times)}  {qps:8.1f} q/s  '
+              f'avg batch {stats["avg_batch"]}  mismatches {wrong}')
+        searcher.close()
+        del segment
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""Local stand-in for the university website, for the crawler and load tests.
+
+Serves a generated site of linked pages with headings and paragraphs, a
+robots.txt that disallows /private/, links off-site and outside /info/, and
+ETag / Last-Modified validators. Each response can be delayed by
+--latency-ms to look like a real server. With --check it crawls itself twice and
+verifies the politeness rules and that the second crawl finds nothing new.
+
+    python benchmarks/fake_site.py --pages 40 --port 8765
+    python benchmarks/fake_site.py --pages 40 --check
+"""
+import argparse
+import email.utils
+import hashlib
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+TOPICS = ['admissions', 'fees', 'accommodation', 'library', 'registration', 'examinations',
+          'graduation', 'transport', 'scholarships', 'sports', 'clinic', 'ict support']
+STARTED = email.utils.formatdate(time.time(), usegmt=True)
+
+
+def page_html(index, pages, version=0):
+    topic = TOPICS[index % len(TOPICS)]
+    links = ''.join(f'<li><a href="/info/page{(index * 7 + k) % pages}.html#top">Page {k}</a></li>' for k in (1, 2, 3))
+    return f'''<html><head><title>{topic}</title><script>var x = 1;</script></head><body>
+<nav><a href="/">Home</a> <a href="/private/staff.html">Staff</a> <a href="/news/today.html">News</a>
+<a href="https://example.org/elsewhere">Elsewhere</a> <a href="/files/handbook.pdf">Handbook</a></nav>
+<h1>How do I sort out {topic} (section {index})?</h1>
+<p>Students should visit the {topic} office in block {index % 9} between 8am and 4pm on weekdays (v{version}).</p>
+<p>Short text.</p>
+<h2>Who do I contact about {topic}?</h2>
+<p>Email {topic.replace(' ', '')}@cut.ac.zw or call extension {1000 + index} for help with {topic} number {index}.</p>
+<ul>{links}</ul>
+<footer><p>Chinhoyi University of Technology, private bag 7724, Chinhoyi, Zimbabwe.</p></footer>
+</body></html>'''
+
+
+class FakeSite:
+    def __init__(self, pages=40, latency_ms=0.0):
+        self.pages = pages
+        self.latency_ms = latency_ms
+        self.version = 0
+        self.hits = {}
+        self._lock = threading.Lock()
+
+    def body(self, path):
+        if path == '/robots.txt':
+            return 'User-agent: *\nDisallow: /private/\n', 'text/plain'
+        if path in ('/', '/index.html'):
+            links = ''.join(f'<a href="/info/page{i}.html">Page {i}</a>' for i in range(0, self.pages, 5))
+            return f'<html><body><h1>Welcome</h1>{links}</body></html>', 'text/html'
+        if path.startswith('/info/page') and path.endswith('.html'):
+            index = path[len('/info/page'):-len('.html')]
+            if index.isdigit() and int(index) < self.pages:
+                return page_html(int(index), self.pages, self.version), 'text/html'
+        if path.startswith(('/private/', '/news/')):
+            return '<html><body><p>This page should never be crawled by the FAQ bot.</p></body></html>', 'text/html'
+        return None, None
+
+    def handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                path = self.path.split('?')[0]
+                with site._lock:
+                    site.hits[path] = site.hits.get(path, 0) + 1
+                if site.latency_ms:
+                    time.sleep(site.latency_ms / 1000)
+                body, content_type = site.body(path)
+                if body is None:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                etag = '"%s"' % hashlib.sha1(body.encode()).hexdigest()[:16]
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                data = body.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', content_type + '; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.send_header('ETag', etag)
+                self.send_header('Last-Modified', STARTED)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+# Start the site on a background thread; returns (server, base url)
+def serve(site, port=0, host='127.0.0.1'):
+    server = ThreadingHTTPServer((host, port), site.handler())
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-site', daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}/'
+
+
+def check(site, base):
+    from app import crawler
+
+    state = {}
+
+    def run():
+        # /private/ is allowed by prefix so robots.txt is what has to keep it out
+        c = crawler.Crawler([base + 'info/page0.html'], path_prefixes=['/info/', '/private/'],
+                            max_pages=site.pages + 10, max_depth=10, concurrency=4, host_delay=0.0, state=state)
+        start = time.perf_counter()
+        passages = c.crawl()
+        return c, passages, time.perf_counter() - start
+
+    first, passages, elapsed = run()
+    print(f'first crawl: {len(passages)} passages, {dict(first.stats)} in {elapsed:.2f}s')
+    forbidden = [path for path in site.hits if path.startswith(('/private/', '/files/'))]
+    assert not forbidden, f'crawled disallowed paths: {forbidden}'
+    assert all(p['url'].startswith(base) for p in passages)
+    assert len({p['url'] for p in passages}) == site.pages, 'not every page was reached'
+    assert not any('private bag' in p['answer'] or 'never be crawled' in p['answer'] for p in passages)
+
+    second, passages, elapsed = run()
+    print(f'second crawl: {len(passages)} passages, {dict(second.stats)} in {elapsed:.2f}s')
+    assert not passages and second.stats['not_modified'] == second.stats['fetched']
+
+    site.version += 1
+    third, passages, elapsed = run()
+    print(f'after a content change: {len(passages)} passages, {dict(third.stats)} in {elapsed:.2f}s')
+    assert len({p['url'] for p in passages}) == site.pages
+    print('ok')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=40)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--check', action='store_true', help='crawl the site twice and verify the results')
+    args = parser.parse_args()
+
+    site = FakeSite(args.pages, args.latency_ms)
+    server, base = serve(site, 0 if args.check else args.port)
+    if args.check:
+        check(site, base)
+        server.shutdown()
+        return
+    print(f'serving {args.pages} pages on {base} (Ctrl-C to stop)')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,462 @@
+"""Load-test the app under gunicorn against a local stand-in for the website.
+
+Copies the app and faqs.json into a scratch directory (edits, uploads and
+logs never touch the real knowledge base), starts fake_site.py and points
+the crawler at it, so /ask misses scrape the fake site and not cut.ac.zw,
+then starts `gunicorn run:app` with --workers workers and drives open-loop
+traffic at a fixed rate per request type:
+
+    ask       /ask with a --mix of exact FAQ questions, paraphrases, questions
+              only the fake site answers, and questions nobody answers
+    batch     /ask/batch with --batch-size of the same questions
+    feedback  /feedback votes on FAQ answers, signed with a shared FEEDBACK_SECRET
+    edit      /admin/edit rewriting a random FAQ (re-encode, reindex, save)
+    pdf       /admin/upload_pdf with a generated PDF of new Q/A pairs
+
+Latency is measured from when a request was due, not when a client thread
+got to send it, so a saturated server shows up as latency instead of a lower
+send rate. The first --warmup seconds are not counted. CPU and RSS of every
+gunicorn worker (shard processes included) are sampled from /proc, so that
+part needs Linux. The report lists latency percentiles, error and shed
+rates per request type and CPU / RSS per worker; --json saves it and
+--compare prints the change against a saved one.
+
+    python benchmarks/load_test.py --workers 2 --ask-rps 20 --duration 60 --json w2.json
+    python benchmarks/load_test.py --workers 4 --ask-rps 20 --duration 60 --compare w2.json
+"""
+import argparse
+import collections
+import concurrent.futures
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import feedback, storage  # noqa: E402
+from fake_site import TOPICS, FakeSite, serve  # noqa: E402
+
+KINDS = ['ask', 'batch', 'feedback', 'edit', 'pdf']
+# Files the app reads next to faqs.json, copied when they exist so the
+# workers start from the existing snapshot instead of re-encoding
+STATE_FILES = ['faqs.json', 'index_state.json', 'calibration.npz']
+CLK_TCK = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+UNKNOWN = ['What is the wifi password for the moon base?', 'Can I park a boat in the library?',
+           'Who won the chess tournament in 1987?', 'Is there a dress code for dragons?']
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# Scratch copy of the app and its data; models/ is linked, not copied
+def prepare(workdir):
+    shutil.copytree(os.path.join(ROOT, 'app'), os.path.join(workdir, 'app'),
+                    ignore=shutil.ignore_patterns('__pycache__'))
+    shutil.copy2(os.path.join(ROOT, 'run.py'), workdir)
+    for name in os.listdir(ROOT):
+        if name in STATE_FILES or name.endswith('.snapshot'):
+            shutil.copy2(os.path.join(ROOT, name), workdir)
+    if os.path.isdir(os.path.join(ROOT, 'models')):
+        os.symlink(os.path.abspath(os.path.join(ROOT, 'models')), os.path.join(workdir, 'models'))
+
+
+# A one-page PDF with `lines` of text, enough for pdfplumber
+def make_pdf(lines):
+    escape = str.maketrans({'\\': '\\\\', '(': '\\(', ')': '\\)'})
+    text = ['BT', '/F1 10 Tf', '14 TL', '40 800 Td']
+    text += [f'({line.translate(escape)}) Tj T*' for line in lines]
+    stream = '\n'.join(text + ['ET']).encode('latin-1', 'replace')
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>',
+               b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+               b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R '
+               b'/Resources << /Font << /F1 5 0 R >> >> >>',
+               b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream),
+               b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    pdf = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(pdf)
+    pdf += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    pdf += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    pdf += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(pdf)
+
+
+# Request bodies for each kind of traffic, drawn from the knowledge base
+class Traffic:
+    def __init__(self, faqs, mix, batch_size, password, secret, seed=0):
+        # (position in faqs.json, record): edits must name the server's index
+        self.faqs = [(i, faq) for i, faq in enumerate(faqs) if faq.get('question') and faq.get('answer')]
+        self.mix = mix
+        self.batch_size = batch_size
+        self.password = password
+        self.signer = feedback.AnswerSigner(secret.encode())
+        self.random = random.Random(seed)
+        self.uploads = 0
+        self._lock = threading.Lock()
+
+    def question(self):
+        with self._lock:
+            kind = self.random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+            _, faq = self.random.choice(self.faqs)
+            if kind == 'known':
+                return faq['question']
+            if kind == 'paraphrase':
+                words = faq['question'].rstrip('?').lower().split()
+                if len(words) > 3:
+                    words.pop(self.random.randrange(len(words)))
+                return 'please tell me ' + ' '.join(words)
+            if kind == 'site':
+                topic = self.random.choice(TOPICS)
+                return self.random.choice([f'Who do I contact about {topic}?', f'How do I sort out {topic}?'])
+            return self.random.choice(UNKNOWN)
+
+    # (method, path, keyword arguments for requests)
+    def request(self, kind):
+        pw = {'pw': self.password}
+        if kind == 'ask':
+            return 'POST', '/ask', {'json': {'question': self.question()}}
+        if kind == 'batch':
+            return 'POST', '/ask/batch', {'json': {'questions': [self.question() for _ in range(self.batch_size)]}}
+        with self._lock:
+            index, faq = self.random.choice(self.faqs)
+            vote = self.random.choice(['up', 'down'])
+        if kind == 'feedback':
+            question = self.question()
+            return 'POST', '/feedback', {'json': {'question': question, 'answer': faq['answer'], 'feedback': vote,
+                                                  'token': self.signer.sign(question, faq['answer'])}}
+        if kind == 'edit':
+            # Same content, so the answers other requests expect don't change
+            return 'POST', '/admin/edit', {'params': pw, 'json': dict(faq, index=index)}
+        with self._lock:
+            self.uploads += 1
+            upload = self.uploads
+        lines = []
+        for n in range(3):
+            lines += [f'Q: Where is load test office {upload}-{n}?',
+                      f'A: Load test office {upload}-{n} is in block {n} next to the main gate.']
+        return 'POST', '/admin/upload_pdf', {'params': pw, 'files': {'pdf': (f'load{upload}.pdf', make_pdf(lines),
+                                                                              'application/pdf')}}
+
+
+# CPU time and RSS of every gunicorn worker, counting each worker's own
+# children (shard processes) as part of it
+class ProcessSampler:
+    def __init__(self, master, interval=1.0):
+        self.master = master
+        self.interval = interval
+        self.samples = collections.defaultdict(list)  # worker pid -> [(time, cpu seconds, rss bytes)]
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='sampler', daemon=True)
+
+    @staticmethod
+    def _processes():
+        parents, usage = {}, {}
+        for name in os.listdir('/proc'):
+            if not name.isdigit():
+                continue
+            try:
+                with open(f'/proc/{name}/stat') as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+            except OSError:
+                continue
+            pid = int(name)
+            parents[pid] = int(fields[1])
+            usage[pid] = ((int(fields[11]) + int(fields[12])) / CLK_TCK, int(fields[21]) * PAGE_SIZE)
+        return parents, usage
+
+    def sample(self):
+        parents, usage = self._processes()
+        now = time.monotonic()
+        workers = [pid for pid, parent in parents.items() if parent == self.master]
+        for worker in workers:
+            cpu, rss = usage[worker]
+            for pid, parent in parents.items():
+                if parent == worker:
+                    cpu += usage[pid][0]
+                    rss += usage[pid][1]
+            self.samples[worker].append((now, cpu, rss))
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.sample()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+    def report(self):
+        workers = []
+        for pid, samples in sorted(self.samples.items()):
+            if len(samples) < 2:
+                continue
+            times, cpu, rss = (np.array(column, dtype=float) for column in zip(*samples))
+            usage = np.diff(cpu) / np.maximum(np.diff(times), 1e-9) * 100
+            workers.append({'pid': pid, 'cpu_avg_pct': round((cpu[-1] - cpu[0]) / (times[-1] - times[0]) * 100, 1),
+                            'cpu_peak_pct': round(float(usage.max()), 1),
+                            'rss_avg_mb': round(float(rss.mean()) / 2 ** 20, 1),
+                            'rss_peak_mb': round(float(rss.max()) / 2 ** 20, 1)})
+        return workers
+
+
+def run_traffic(base, traffic, rates, duration, warmup, concurrency, timeout):
+    records = []
+    records_lock = threading.Lock()
+    local = threading.local()
+    start = time.monotonic() + 0.5
+    measured_from = start + warmup
+    end = measured_from + duration
+    pool = concurrent.futures.ThreadPoolExecutor(concurrency)
+
+    def send(kind, due):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        method, path, kwargs = traffic.request(kind)
+        sent = time.monotonic()
+        try:
+            status = session.request(method, base + path, timeout=timeout, **kwargs).status_code
+        except requests.RequestException as e:
+            status = type(e).__name__
+        if due >= measured_from:
+            with records_lock:
+                records.append((kind, status, (time.monotonic() - due) * 1000, (sent - due) * 1000))
+
+    # One scheduler per kind with Poisson arrivals at its rate
+    def schedule(kind, rate, seed):
+        arrivals = random.Random(seed)
+        due = start + arrivals.expovariate(rate)
+        while due < end:
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, kind, due)
+            due += arrivals.expovariate(rate)
+
+    schedulers = [threading.Thread(target=schedule, args=(kind, rate, seed), daemon=True)
+                  for seed, (kind, rate) in enumerate(rates.items()) if rate > 0]
+    for thread in schedulers:
+        thread.start()
+    time.sleep(max(measured_from - time.monotonic(), 0))
+    yield 'measuring'
+    for thread in schedulers:
+        thread.join()
+    pool.shutdown(wait=True)
+    yield records
+
+
+def summarize(records, duration):
+    kinds = {}
+    for kind in KINDS:
+        rows = [r for r in records if r[0] == kind]
+        if not rows:
+            continue
+        ok = shed = errors = 0
+        for _, status, _, _ in rows:
+            # An unanswered question (404) is a normal /ask outcome
+            if isinstance(status, int) and (status < 400 or (status == 404 and kind == 'ask')):
+                ok += 1
+            elif status in (429, 503):
+                shed += 1
+            else:
+                errors += 1
+        latency = np.array([r[2] for r in rows])
+        p50, p90, p95, p99 = np.percentile(latency, [50, 90, 95, 99])
+        kinds[kind] = {'requests': len(rows), 'ok': ok, 'shed': shed, 'errors': errors,
+                       'error_rate': round(errors / len(rows), 4), 'shed_rate': round(shed / len(rows), 4),
+                       'throughput_rps': round(ok / duration, 2),
+                       'latency_ms': {'mean': round(float(latency.mean()), 1), 'p50': round(p50, 1),
+                                      'p90': round(p90, 1), 'p95': round(p95, 1), 'p99': round(p99, 1),
+                                      'max': round(float(latency.max()), 1)},
+                       # Sent over 100 ms late: the client, not the server, was the bottleneck
+                       'late_sends': sum(r[3] > 100 for r in rows),
+                       'statuses': dict(collections.Counter(str(r[1]) for r in rows))}
+    return kinds
+
+
+def print_report(report):
+    print(f"\n{report['label']}: {report['config']['workers']} worker(s) x {report['config']['threads']} thread(s), "
+          f"{report['duration_s']:.0f} s measured, {report['cores']} cores")
+    print(f"{'':10}{'reqs':>7}{'ok/s':>8}{'err%':>7}{'shed%':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  ms")
+    for kind, stats in report['requests'].items():
+        latency = stats['latency_ms']
+        print(f"{kind:10}{stats['requests']:7d}{stats['throughput_rps']:8.1f}{stats['error_rate'] * 100:7.1f}"
+              f"{stats['shed_rate'] * 100:7.1f}{latency['p50']:9.1f}{latency['p95']:9.1f}{latency['p99']:9.1f}"
+              f"{latency['max']:9.1f}")
+        if stats['late_sends']:
+            print(f"{'':10}{stats['late_sends']} sent late; raise --concurrency")
+    print(f"\n{'worker':10}{'cpu avg%':>10}{'cpu peak%':>11}{'rss avg MB':>12}{'rss peak MB':>13}")
+    for worker in report['workers']:
+        print(f"{worker['pid']:<10}{worker['cpu_avg_pct']:10.1f}{worker['cpu_peak_pct']:11.1f}"
+              f"{worker['rss_avg_mb']:12.1f}{worker['rss_peak_mb']:13.1f}")
+    print(f"\nfake site: {report['site_requests']} requests; scrape status: {report['scrape']}")
+
+
+def print_comparison(report, previous):
+    print(f"\nchange against {previous['label']} ({previous['config']['workers']} worker(s)):")
+    for kind, stats in report['requests'].items():
+        old = previous['requests'].get(kind)
+        if not old:
+            continue
+        print(f"{kind:10}ok/s {old['throughput_rps']:.1f} -> {stats['throughput_rps']:.1f}   "
+              f"p95 {old['latency_ms']['p95']:.1f} -> {stats['latency_ms']['p95']:.1f} ms   "
+              f"p99 {old['latency_ms']['p99']:.1f} -> {stats['latency_ms']['p99']:.1f} ms   "
+              f"errors {old['error_rate'] * 100:.1f}% -> {stats['error_rate'] * 100:.1f}%")
+
+    def total(r, key):
+        return sum(worker[key] for worker in r['workers'])
+
+    print(f"{'workers':10}cpu {total(previous, 'cpu_avg_pct'):.0f}% -> {total(report, 'cpu_avg_pct'):.0f}%   "
+          f"rss peak {total(previous, 'rss_peak_mb'):.0f} -> {total(report, 'rss_peak_mb'):.0f} MB")
+
+
+def wait_healthy(base, server, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f'gunicorn exited with {server.returncode}')
+        try:
+            if requests.get(base + '/health', timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise SystemExit(f'no /health response within {timeout:.0f} s')
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - {'known', 'paraphrase', 'site', 'unknown'}
+    if unknown:
+        raise argparse.ArgumentTypeError(f'unknown question kinds: {", ".join(sorted(unknown))}')
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=1, help='threads per worker (gthread when > 1)')
+    parser.add_argument('--duration', type=float, default=60, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=10, help='seconds of traffic before measuring')
+    parser.add_argument('--ask-rps', type=float, default=10)
+    parser.add_argument('--batch-rps', type=float, default=1)
+    parser.add_argument('--feedback-rps', type=float, default=2)
+    parser.add_argument('--edit-rps', type=float, default=0.2)
+    parser.add_argument('--pdf-rps', type=float, default=0.05)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('known=0.4,paraphrase=0.4,site=0.15,unknown=0.05'),
+                        help='weights of the question kinds in ask and batch traffic')
+    parser.add_argument('--concurrency', type=int, default=64, help='client threads')
+    parser.add_argument('--timeout', type=float, default=30, help='per request, seconds')
+    parser.add_argument('--pages', type=int, default=40, help='fake site pages')
+    parser.add_argument('--site-latency-ms', type=float, default=50)
+    parser.add_argument('--scrape-interval', type=float, default=30, help='SCRAPE_MIN_INTERVAL for the app')
+    parser.add_argument('--startup-timeout', type=float, default=300)
+    parser.add_argument('--label', default=None, help='name of this run in the report')
+    parser.add_argument('--json', help='write the report to this file')
+    parser.add_argument('--compare', help='report to compare this run with')
+    parser.add_argument('--keep', action='store_true', help="keep the scratch directory and gunicorn's log")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='cut-load-')
+    prepare(workdir)
+    faqs = storage.load_records(os.path.join(workdir, 'faqs.json'))
+    if not faqs:
+        raise SystemExit('faqs.json has no FAQs to draw questions from')
+    site = FakeSite(args.pages, args.site_latency_ms)
+    site_server, site_base = serve(site)
+    password = 'load-test'
+    secret = 'load-test-feedback'
+    port = free_port()
+    base = f'http://127.0.0.1:{port}'
+    env = dict(os.environ, ADMIN_PASSWORD=password, RATE_LIMIT_PER_MIN='0', FEEDBACK_SECRET=secret,
+               FEEDBACK_RATE_PER_MIN='0', FEEDBACK_MAX_VOTES='0',
+               SCRAPE_MIN_INTERVAL=str(args.scrape_interval),
+               CRAWL_START_URLS=site_base + 'info/page0.html',
+               CRAWL_PATH_PREFIXES='/info/', CRAWL_HOST_DELAY='0', CRAWL_MAX_PAGES=str(args.pages))
+    log = open(os.path.join(workdir, 'gunicorn.log'), 'w')
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'run:app', '--chdir', workdir,
+                               '--bind', f'127.0.0.1:{port}', '--workers', str(args.workers),
+                               '--threads', str(args.threads), '--timeout', '120'],
+                              cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        started = time.monotonic()
+        wait_healthy(base, server, args.startup_timeout)
+        print(f'gunicorn up in {time.monotonic() - started:.1f} s on {base}, fake site on {site_base}')
+        rates = {'ask': args.ask_rps, 'batch': args.batch_rps, 'feedback': args.feedback_rps,
+                 'edit': args.edit_rps, 'pdf': args.pdf_rps}
+        traffic = Traffic(faqs, args.mix, args.batch_size, password, secret)
+        sampler = ProcessSampler(server.pid)
+        phases = run_traffic(base, traffic, rates, args.duration, args.warmup, args.concurrency, args.timeout)
+        next(phases)
+        sampler.start()
+        print(f'measuring for {args.duration:.0f} s ...')
+        records = next(phases)
+        sampler.stop()
+        try:
+            scrape = requests.get(base + '/scrape/status', timeout=5).json()
+        except (requests.RequestException, ValueError):
+            scrape = None
+    except BaseException:
+        log.flush()
+        with open(log.name) as f:
+            sys.stderr.write(f.read()[-4000:])
+        raise
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        log.close()
+        site_server.shutdown()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {'label': args.label or f'{args.workers}w-{args.threads}t', 'cores': os.cpu_count(),
+              'config': {key: value for key, value in vars(args).items()
+                         if key not in ('json', 'compare', 'keep', 'label')},
+              'duration_s': args.duration, 'requests': summarize(records, args.duration),
+              'workers': sampler.report(), 'site_requests': sum(site.hits.values()),
+              'scrape': {key: scrape.get(key) for key in ('runs', 'last_added', 'last_error', 'faqs')}
+              if scrape else None}
+    print_report(report)
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(report, json.load(f))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.keep:
+        print(f'scratch directory: {workdir}')
+
+
+if __name__ == '__main__':
+    main()
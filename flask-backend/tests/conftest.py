@@ -0,0 +1,84 @@
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# The app keeps its state in files next to faqs.json and in the working
+# directory, so the tests import a scratch copy of it (like
+# benchmarks/load_test.py) and never touch the real knowledge base.
+WORKDIR = tempfile.mkdtemp(prefix='cut-tests-')
+shutil.copytree(os.path.join(ROOT, 'app'), os.path.join(WORKDIR, 'app'),
+                ignore=shutil.ignore_patterns('__pycache__'))
+shutil.copy(os.path.join(ROOT, 'faqs.json'), WORKDIR)
+sys.path.insert(0, WORKDIR)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+ADMIN_PASSWORD = 'test-password'
+os.environ.update(
+    ADMIN_PASSWORD=ADMIN_PASSWORD, ANALYTICS_INTERVAL='0', MODEL_WARMUP='0', FAQ_FLUSH_DELAY='0',
+    KB_CHECK_INTERVAL='0', FEEDBACK_SECRET='test-secret', HOT_SIZE='0',
+    # A miss starts a crawl; point it at a closed port instead of cut.ac.zw
+    CRAWL_START_URLS='http://127.0.0.1:9/', CRAWL_MAX_PAGES='1',
+)
+
+
+# Deterministic stand-in for SentenceTransformer: a hashed bag of words, so
+# questions sharing words are close and no model has to be downloaded
+class HashEncoder:
+    dim = 64
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, sentences, batch_size=32, normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        sentences = [sentences] if single else list(sentences)
+        vectors = np.zeros((len(sentences), self.dim), dtype=np.float32)
+        for i, sentence in enumerate(sentences):
+            for word in str(sentence).lower().split():
+                digest = hashlib.md5(word.strip('?.,!').encode()).digest()
+                vectors[i, digest[0] % self.dim] += 1.0
+        if normalize_embeddings:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors[0] if single else vectors
+
+
+from app import encoders  # noqa: E402
+
+encoders.load_encoder = lambda model_name, backend=None, threads=None: HashEncoder()
+
+
+@pytest.fixture(scope='session')
+def flask_app():
+    from app import create_app
+    return create_app()
+
+
+@pytest.fixture(scope='session')
+def routes(flask_app):
+    from app import routes
+    return routes
+
+
+@pytest.fixture
+def client(flask_app):
+    return flask_app.test_client()
+
+
+@pytest.fixture
+def admin():
+    return {'pw': ADMIN_PASSWORD}
+
+
+def pytest_configure(config):
+    os.chdir(WORKDIR)
+
+
+def pytest_unconfigure(config):
+    os.chdir(ROOT)
+    shutil.rmtree(WORKDIR, ignore_errors=True)
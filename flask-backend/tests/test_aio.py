@@ -0,0 +1,67 @@
+import asyncio
+import json
+
+import pytest
+
+from app import serialization
+
+
+@pytest.fixture(scope='module')
+def asgi_app(flask_app):
+    from app.aio import AsyncApp
+    return AsyncApp(flask_app, encode_workers=2, io_workers=2)
+
+
+def call(app, method, path, payload=None, client='10.0.0.1'):
+    body = serialization.dumps(payload) if payload is not None else b''
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'http_version': '1.1', 'method': method, 'path': path, 'root_path': '',
+             'scheme': 'http', 'server': ('testserver', 80), 'query_string': b'',
+             'headers': [(b'content-type', b'application/json')], 'client': (client, 1234)}
+    asyncio.run(app(scope, receive, send))
+    start = messages[0]
+    body = b''.join(message.get('body', b'') for message in messages[1:])
+    return start['status'], dict(start['headers']), body
+
+
+def test_ask_matches_flask(asgi_app, client, routes):
+    question = routes.FAQS_DATA[0]['question']
+    status, _, body = call(asgi_app, 'POST', '/ask', {'question': question})
+    assert status == 200
+    result = json.loads(body)
+    assert result['answer'] == client.post('/ask', json={'question': question}).get_json()['answer']
+    assert result['token']
+
+
+def test_ask_rejects_bad_json(asgi_app):
+    assert call(asgi_app, 'POST', '/ask', None)[0] == 400
+
+
+def test_oversized_bodies_get_413(asgi_app):
+    from app.aio import MAX_BODY
+    for path in ('/ask', '/feedback'):
+        status, _, body = call(asgi_app, 'POST', path, {'question': 'x' * MAX_BODY})
+        assert status == 413 and json.loads(body)['message'] == 'Request body too large'
+
+
+def test_feedback_requires_served_answer(asgi_app, routes):
+    question = routes.FAQS_DATA[1]['question']
+    _, _, body = call(asgi_app, 'POST', '/ask', {'question': question})
+    answer = json.loads(body)
+    vote = {'question': question, 'answer': answer['answer'], 'feedback': 'up', 'token': answer['token']}
+    assert call(asgi_app, 'POST', '/feedback', dict(vote, answer='Something else'))[0] == 400
+    assert call(asgi_app, 'POST', '/feedback', vote)[0] == 200
+    assert call(asgi_app, 'POST', '/feedback', vote)[0] == 409
+
+
+def test_other_paths_go_to_flask(asgi_app):
+    status, _, body = call(asgi_app, 'GET', '/health')
+    assert status == 200
+    assert json.loads(body) == {'status': 'ok'}
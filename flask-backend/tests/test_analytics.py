@@ -0,0 +1,87 @@
+import json
+import logging
+
+from app import analytics
+from conftest import HashEncoder
+
+
+def test_log_tail_reads_only_complete_new_lines(tmp_path):
+    path = tmp_path / 'log.txt'
+    tail = analytics.LogTail(str(path))
+    assert tail.read_lines() == []
+    path.write_text('one\ntwo\npart')
+    assert tail.read_lines() == ['one', 'two']
+    assert tail.read_lines() == []
+    with open(path, 'a') as f:
+        f.write('ial\nthree\n')
+    assert tail.read_lines() == ['partial', 'three']
+    # A rotated log is read from the start
+    path.write_text('new\n')
+    assert tail.read_lines() == ['new']
+
+
+def write_questions(path, *lines):
+    with open(path, 'a') as f:
+        for line in lines:
+            f.write(line + '\n')
+
+
+def test_refresh_is_incremental_and_survives_restarts(tmp_path):
+    questions, feedback = tmp_path / 'questions.txt', tmp_path / 'feedback.txt'
+    faqs = [{'question': 'Where is the library?', 'answer': 'Next to the hall.'}]
+    write_questions(questions, '2025-06-26T10:58:11.459615 - [lexical] Where is the library?',
+                    '2025-06-26T11:00:00 - [none] Can I park on campus?',
+                    '2025-06-27T09:00:00 - Old line without a source')
+    feedback.write_text(json.dumps({'answer': 'Next to the hall.', 'feedback': 'down'}) + '\n')
+    stats = analytics.Analytics(str(tmp_path / 'state'), str(questions), str(feedback), faqs=lambda: faqs)
+    assert stats.refresh()
+    tables = stats.dashboard()
+    assert tables['totals'] == {'questions': 3, 'feedback': 1}
+    assert tables['sources'] == {'lexical': 1, 'none': 1, 'unknown': 1}
+    assert tables['unanswered'] == [{'question': 'Can I park on campus?', 'count': 1}]
+    assert tables['thumbs_down'][0]['question'] == 'Where is the library?'
+    assert tables['by_hour'][10] == 1 and tables['by_hour'][11] == 1
+
+    # A new instance picks up where the last one stopped
+    write_questions(questions, '2025-06-28T08:00:00 - [none] can I PARK on campus')
+    stats = analytics.Analytics(str(tmp_path / 'state'), str(questions), str(feedback), faqs=lambda: faqs)
+    assert stats.refresh()
+    tables = stats.dashboard()
+    assert tables['totals'] == {'questions': 4, 'feedback': 1}
+    assert tables['unanswered'] == [{'question': 'Can I park on campus?', 'count': 2}]
+
+
+def test_refresh_clusters_questions(tmp_path):
+    questions = tmp_path / 'questions.txt'
+    write_questions(questions, *[f'2025-06-26T10:00:00 - [none] where is the library {i}' for i in range(3)])
+    encoder = HashEncoder()
+    stats = analytics.Analytics(str(tmp_path / 'state'), str(questions), str(tmp_path / 'none.txt'),
+                                encode=lambda texts: encoder.encode(texts, normalize_embeddings=True))
+    stats.refresh()
+    assert len(stats.clusters) >= 1
+    assert sum(cluster['count'] for cluster in stats.dashboard()['clusters']) == 3
+
+
+def test_refresher_logs_failures_and_keeps_running(caplog):
+    calls = []
+
+    def broken():
+        raise ValueError('bad log line')
+
+    refresher = analytics.Refresher(60, {'broken': broken, 'ok': lambda: calls.append(1)})
+    with caplog.at_level(logging.ERROR, logger='app.analytics'):
+        refresher.run_once()
+        refresher.run_once()
+    assert calls == [1, 1]
+    status = refresher.status('broken')
+    assert status['runs'] == 2 and status['failures'] == 2
+    assert status['last_error'] == 'ValueError: bad log line'
+    assert refresher.status('ok')['failures'] == 0
+    assert "refresh job 'broken' failed" in caplog.text
+
+
+def test_admin_analytics_json(client, admin):
+    response = client.get('/admin/analytics', query_string=dict(admin, format='json'))
+    assert response.status_code == 200
+    assert 'refresh' in response.get_json()
+    assert client.get('/admin/analytics').status_code == 401
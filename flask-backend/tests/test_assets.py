@@ -0,0 +1,30 @@
+import gzip
+import re
+
+
+def test_index_links_hashed_assets(client):
+    response = client.get('/')
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'].startswith('public')
+    urls = re.findall(r'/static/js/chat\.[0-9a-f]{12}\.js', response.get_data(as_text=True))
+    assert urls
+
+
+def test_hashed_asset_is_immutable_and_precompressed(client):
+    page = client.get('/').get_data(as_text=True)
+    url = re.search(r'/static/js/chat\.[0-9a-f]{12}\.js', page).group(0)
+    plain = client.get(url)
+    assert 'immutable' in plain.headers['Cache-Control']
+    compressed = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.data) == plain.data
+
+
+def test_conditional_get(client):
+    first = client.get('/')
+    again = client.get('/', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+
+
+def test_unknown_hash_is_not_served(client):
+    assert client.get('/static/js/chat.000000000000.js').status_code == 404
@@ -0,0 +1,96 @@
+import csv
+import io
+import json
+
+import pytest
+
+from app import bulk
+
+RECORDS = [
+    {'question': 'Where is the library?', 'answer': 'Block A, next to the "main" hall.', 'category': 'Service'},
+    {'question': 'Fees, levies and deposits?', 'answer': 'Line one\nline two', 'category': ''},
+]
+
+
+def test_detect_format():
+    assert bulk.detect_format('faqs.CSV') == 'csv'
+    assert bulk.detect_format('faqs.ndjson') == 'jsonl'
+    assert bulk.detect_format('upload.bin', 'json') == 'json'
+    with pytest.raises(bulk.BadImport):
+        bulk.detect_format('faqs.xlsx')
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'jsonl'])
+def test_export_import_round_trip(fmt):
+    writer = bulk.iter_csv if fmt == 'csv' else bulk.iter_jsonl
+    data = b''.join(writer(RECORDS * 300, chunk_size=1024))
+    records, report = bulk.validate(bulk.iter_rows(io.BytesIO(data), fmt), set(), 10000)
+    assert records == RECORDS
+    assert report == {'rows': 600, 'invalid': 0, 'duplicates': 598, 'errors': report['errors'], 'accepted': 2}
+    assert len(report['errors']) == bulk.MAX_ERRORS
+
+
+def test_exports_stream_in_chunks():
+    chunks = list(bulk.iter_jsonl(RECORDS * 1000, chunk_size=4096))
+    assert len(chunks) > 10
+    assert all(len(chunk) < 4096 + 200 for chunk in chunks)
+
+
+def test_validate_reports_bad_rows():
+    data = (b'{"question": "Ok?", "answer": "Yes"}\n'
+            b'not json\n'
+            b'\n'
+            b'{"question": "No answer?"}\n'
+            b'{"question": "existing question", "answer": "x"}\n'
+            b'["a list"]\n')
+    records, report = bulk.validate(bulk.iter_rows(io.BytesIO(data), 'jsonl'), {'existing question'}, 100)
+    assert records == [{'question': 'Ok?', 'answer': 'Yes', 'category': ''}]
+    assert report['invalid'] == 3 and report['duplicates'] == 1
+    assert [error['line'] for error in report['errors']] == [2, 4, 5, 6]
+
+
+def test_limits():
+    rows = [(i, {'question': f'q{i}', 'answer': 'a'}) for i in range(5)]
+    with pytest.raises(bulk.BadImport, match='Too many rows'):
+        bulk.validate(rows, set(), 4)
+    with pytest.raises(bulk.BadImport, match='header'):
+        list(bulk.iter_rows(io.BytesIO(b'q,a\nx,y\n'), 'csv'))
+    with pytest.raises(bulk.BadImport, match='JSON array'):
+        list(bulk.iter_rows(io.BytesIO(b'{"question": "x"}'), 'json'))
+
+
+def test_exported_knowledge_base_reimports_as_duplicates(client, admin, routes):
+    for fmt in ('csv', 'jsonl', 'json'):
+        exported = client.get('/admin/export', query_string=dict(admin, format=fmt)).data
+        response = client.post('/admin/import', query_string=dict(admin, format=fmt, dry_run='1'), data=exported)
+        report = response.get_json()
+        assert response.status_code == 200, report
+        assert report['accepted'] == 0 and report['added'] == 0
+        assert report['duplicates'] + report['invalid'] == report['rows'] == len(routes.FAQS_DATA)
+    csv_rows = list(csv.DictReader(io.StringIO(
+        client.get('/admin/export', query_string=dict(admin, format='csv')).data.decode())))
+    assert [row['question'] for row in csv_rows] == [faq['question'] for faq in routes.FAQS_DATA]
+
+
+def test_import_adds_new_faqs_in_one_pass(client, admin, routes):
+    upload = b'question,answer,category\nCan I bring a bicycle to the campus?,Yes; racks are at the gate.,Service\n'
+    count = len(routes.FAQS_DATA)
+    dry = client.post('/admin/import', query_string=dict(admin, dry_run='1'),
+                      data={'file': (io.BytesIO(upload), 'faqs.csv')}).get_json()
+    assert dry['accepted'] == 1 and dry['added'] == 0 and len(routes.FAQS_DATA) == count
+    added = client.post('/admin/import', query_string=admin,
+                        data={'file': (io.BytesIO(upload), 'faqs.csv')}).get_json()
+    try:
+        assert added['added'] == 1 and len(routes.FAQS_DATA) == count + 1
+        response = client.post('/ask', json={'question': 'Can I bring a bicycle to the campus?'})
+        assert response.get_json()['answer'] == 'Yes; racks are at the gate.'
+        with open(routes.FAQS_PATH) as f:
+            assert json.load(f)[-1]['question'] == 'Can I bring a bicycle to the campus?'
+    finally:
+        client.post('/admin/delete', query_string=admin, json={'index': count})
+
+
+def test_import_rejects_bad_uploads(client, admin):
+    assert client.post('/admin/import', query_string=dict(admin, format='xml'), data=b'<x/>').status_code == 400
+    assert client.post('/admin/import', query_string=dict(admin, format='json'), data=b'{').status_code == 400
+    assert client.post('/admin/import', data=b'[]').status_code == 401
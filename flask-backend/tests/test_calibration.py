@@ -0,0 +1,93 @@
+import json
+
+import numpy as np
+import pytest
+
+from app import calibration, retrieval
+from conftest import HashEncoder
+
+ENCODER = HashEncoder()
+
+
+def encode(texts):
+    encode.calls.append(list(texts))
+    return ENCODER.encode(texts, normalize_embeddings=True)
+
+
+@pytest.fixture(autouse=True)
+def reset_calls():
+    encode.calls = []
+
+
+def test_offsets_stay_within_their_strengths():
+    votes = ([('where is the library', 'Block A.', 1)] * 500 + [('where is the library', 'Block B.', -1)] * 500
+             + [('when are exams', 'In June.', 1)])
+    fitted = calibration.fit(votes, encode)
+    prior = dict(zip(fitted.answers, fitted.prior))
+    assert 0 < prior['Block A.'] <= calibration.PRIOR_STRENGTH
+    assert -calibration.PRIOR_STRENGTH <= prior['Block B.'] < 0
+    assert prior['In June.'] == pytest.approx(calibration.PRIOR_STRENGTH / (1 + calibration.SMOOTHING))
+    assert np.all(np.abs(fitted.offsets) <= calibration.CLUSTER_STRENGTH)
+    # A single vote is not enough for a cluster override
+    overridden = {fitted.answers[i] for i in fitted.answer_ids}
+    assert overridden == {'Block A.', 'Block B.'}
+
+
+def test_compile_maps_offsets_to_rows_by_answer():
+    faqs = [{'question': 'Where is the library?', 'answer': 'Block B.'},
+            {'question': 'Library location?', 'answer': 'Block B.'},
+            {'question': 'Which block is the library in?', 'answer': 'Block A.'}]
+    votes = [('where is the library', 'Block B.', -1)] * 3 + [('where is the library', 'Block A.', 1)] * 3
+    fitted = calibration.fit(votes, encode, model_id='hash')
+    prior, clusters = fitted.compile(faqs, 'hash')
+    assert prior[0] == prior[1] < 0 < prior[2]
+    centroids, threshold, indptr, rows, offsets = clusters
+    assert sorted(rows) == [0, 1, 2]
+    assert fitted.compile(faqs, 'other-model')[1] is None
+
+
+def test_calibrated_index_prefers_helpful_answers():
+    faqs = [{'question': 'Where is the library?', 'answer': 'Block B.'},
+            {'question': 'Where is the library building?', 'answer': 'Block A.'}]
+    vectors = ENCODER.encode([faq['question'] for faq in faqs], normalize_embeddings=True)
+    query = ENCODER.encode('where is the library', normalize_embeddings=True)
+    index = retrieval.DenseIndex(faqs, vectors)
+    assert index.search(query, 1)[0][0] == 0
+    votes = [('where is the library', 'Block B.', -1)] * 5 + [('where is the library', 'Block A.', 1)] * 5
+    index.calibrate(*calibration.fit(votes, encode).compile(faqs))
+    assert index.search(query, 1)[0][0] == 1
+    # Unrelated queries only get the small prior, not the cluster override
+    assert index.adjustment(ENCODER.encode('exam timetable', normalize_embeddings=True)) is None
+
+
+def test_save_and_load(tmp_path):
+    votes = [('where is the library', 'Block A.', 1)] * 3
+    fitted = calibration.fit(votes, encode, model_id='hash', feedback_stamp='abc')
+    fitted.save(str(tmp_path / 'calibration.npz'))
+    loaded = calibration.Calibration.load(str(tmp_path / 'calibration.npz'))
+    assert loaded.summary() == fitted.summary()
+    assert loaded.feedback_stamp == 'abc'
+    np.testing.assert_array_equal(loaded.prior, fitted.prior)
+
+
+def write_votes(path, *votes):
+    with open(path, 'a') as f:
+        for question, answer, feedback in votes:
+            f.write(json.dumps({'question': question, 'answer': answer, 'feedback': feedback}) + '\n')
+
+
+def test_refresh_refits_only_on_new_feedback_and_encodes_only_new_questions(tmp_path):
+    log = str(tmp_path / 'feedback.txt')
+    paths = dict(path=str(tmp_path / 'calibration.npz'), feedback_path=log,
+                 vectors_path=str(tmp_path / 'calibration.vectors.npz'))
+    assert not calibration.refresh(encode, 'hash', **paths)
+    write_votes(log, ('where is the library', 'Block A.', 'up'), ('exam dates', 'In June.', 'down'))
+    assert calibration.refresh(encode, 'hash', **paths)
+    assert not calibration.refresh(encode, 'hash', **paths)
+    write_votes(log, ('where is the library', 'Block A.', 'up'), ('bus times', 'Hourly.', 'up'))
+    assert calibration.refresh(encode, 'hash', **paths)
+    assert encode.calls == [['where is the library', 'exam dates'], ['bus times']]
+    assert calibration.Calibration.load(paths['path']).votes == 4
+    # A new model starts the vector cache over
+    assert calibration.refresh(encode, 'other-model', **paths)
+    assert len(encode.calls[-1]) == 3
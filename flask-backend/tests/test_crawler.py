@@ -0,0 +1,104 @@
+import time
+
+import pytest
+
+from app import crawler
+from fake_site import FakeSite, serve
+
+
+@pytest.fixture
+def site():
+    site = FakeSite(pages=12)
+    server, base = serve(site)
+    yield site, base
+    server.shutdown()
+    server.server_close()
+
+
+def make_crawler(base, state, **kwargs):
+    options = dict(path_prefixes=['/info/', '/private/'], max_pages=30, max_depth=10, concurrency=4,
+                   host_delay=0.0, state=state)
+    options.update(kwargs)
+    return crawler.Crawler([base + 'info/page0.html'], **options)
+
+
+def test_normalize_url():
+    assert crawler.normalize_url('HTTP://Example.ORG:80/a#top') == 'http://example.org/a'
+    assert crawler.normalize_url('https://example.org:8443') == 'https://example.org:8443/'
+    assert crawler.normalize_url('http://example.org/a?b=1#c') == 'http://example.org/a?b=1'
+
+
+def test_crawl_follows_politeness_rules(site):
+    site, base = site
+    passages = make_crawler(base, {}).crawl()
+    # Every page is reached once; robots.txt, off-site links and other paths are not followed
+    assert {p['url'] for p in passages} == {f'{base}info/page{i}.html' for i in range(site.pages)}
+    assert all(count == 1 for path, count in site.hits.items() if path.startswith('/info/'))
+    assert not [path for path in site.hits if path.startswith(('/private/', '/news/', '/files/'))]
+    # Navigation and footers are not passages
+    assert not any('private bag' in p['answer'] for p in passages)
+    assert passages[0]['question'].startswith('How do I sort out')
+
+
+def test_max_pages_limits_the_crawl(site):
+    site, base = site
+    c = make_crawler(base, {}, max_pages=3)
+    c.crawl()
+    assert c.stats['fetched'] == 3
+
+
+def test_recrawl_is_conditional(site):
+    site, base = site
+    state = {}
+    make_crawler(base, state).crawl()
+    second = make_crawler(base, state)
+    assert second.crawl() == []
+    assert second.stats['not_modified'] == second.stats['fetched'] == site.pages
+    site.version += 1
+    third = make_crawler(base, state)
+    assert len({p['url'] for p in third.crawl()}) == site.pages
+
+
+def test_host_throttle_spaces_requests():
+    throttle = crawler.HostThrottle(0.05)
+    start = time.monotonic()
+    for _ in range(3):
+        throttle.wait('example.org')
+    throttle.wait('other.org')
+    assert 0.1 <= time.monotonic() - start < 1.0
+
+
+def wait_for_scrape(routes):
+    deadline = time.monotonic() + 30
+    while routes.SCRAPE_STATUS['running'] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not routes.SCRAPE_STATUS['running']
+
+
+def test_unanswered_question_crawls_in_the_background(client, admin, routes, site, monkeypatch, tmp_path):
+    site, base = site
+    monkeypatch.setenv('CRAWL_START_URLS', base + 'info/page0.html')
+    monkeypatch.setenv('CRAWL_PATH_PREFIXES', '/info/')
+    monkeypatch.setenv('CRAWL_MAX_PAGES', '20')
+    monkeypatch.setenv('CRAWL_HOST_DELAY', '0')
+    monkeypatch.setattr(routes, 'CRAWL_STATE_PATH', str(tmp_path / 'crawl_state.json'))
+    monkeypatch.setattr(routes, 'SCRAPE_MIN_INTERVAL', 0)
+    wait_for_scrape(routes)
+    runs = routes.SCRAPE_STATUS['runs']
+    response = client.post('/ask', json={'question': 'Qwzx vbnm plokij?'})
+    assert response.status_code == 404
+    assert response.get_json()['scraping']
+    wait_for_scrape(routes)
+    try:
+        assert routes.SCRAPE_STATUS['runs'] == runs + 1
+        assert routes.SCRAPE_STATUS['last_added'] > 0
+        assert client.get('/scrape/status').get_json()['last_error'] is None
+        response = client.post('/ask', json={'question': 'How do I sort out library (section 3)?'})
+        assert response.status_code == 200
+        assert 'library office in block 3' in response.get_json()['answer']
+    finally:
+        while True:
+            crawled = [i for i, faq in enumerate(routes.FAQS_DATA) if faq.get('url', '').startswith(base)]
+            if not crawled:
+                break
+            client.post('/admin/delete', query_string=admin, json={'index': crawled[-1]})
@@ -0,0 +1,56 @@
+import threading
+
+import numpy as np
+import pytest
+
+from app import embedding_service
+from conftest import HashEncoder
+
+
+@pytest.fixture
+def embedding_socket(tmp_path):
+    path = str(tmp_path / 'embed.sock')
+    server = embedding_service._UnixServer(path, embedding_service._Handler)
+    server.embedding_server = embedding_service.EmbeddingServer(HashEncoder(), 'hash-test', max_batch=8)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield path
+    server.shutdown()
+    server.server_close()
+
+
+def test_remote_encoder_matches_local(embedding_socket):
+    remote = embedding_service.RemoteEncoder(embedding_socket, timeout=5)
+    texts = ['Where is the library?', 'How do I pay fees?', 'library hours']
+    np.testing.assert_allclose(remote.encode(texts), HashEncoder().encode(texts))
+    single = remote.encode('library hours', normalize_embeddings=True)
+    np.testing.assert_allclose(single, HashEncoder().encode('library hours', normalize_embeddings=True), rtol=1e-6)
+    assert remote.encode([]).shape == (0, HashEncoder.dim)
+
+
+def test_concurrent_requests_share_batches(embedding_socket):
+    remote = embedding_service.RemoteEncoder(embedding_socket, timeout=5)
+    results = {}
+
+    def worker(i):
+        results[i] = remote.encode([f'question {i}'])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for i, vectors in results.items():
+        np.testing.assert_allclose(vectors, HashEncoder().encode([f'question {i}']))
+    stats = remote.stats()
+    assert stats['model'] == 'hash-test'
+    assert stats['dim'] == HashEncoder.dim
+    assert stats['requests'] == 8
+    assert stats['texts'] == 8
+    assert stats['batches'] <= 8
+
+
+def test_server_errors_are_raised(embedding_socket, monkeypatch):
+    remote = embedding_service.RemoteEncoder(embedding_socket, timeout=5)
+    monkeypatch.setattr(HashEncoder, 'encode', lambda self, *args, **kwargs: 1 / 0)
+    with pytest.raises(RuntimeError, match='division by zero'):
+        remote.encode(['anything'])
@@ -0,0 +1,65 @@
+import threading
+import types
+
+import numpy as np
+
+from app import encoders
+
+
+def test_lazy_encoder_loads_once_on_first_use():
+    calls = []
+
+    def factory():
+        calls.append(1)
+        return types.SimpleNamespace(encode=lambda texts, **kwargs: [len(t) for t in texts], dim=3)
+
+    lazy = encoders.LazyEncoder(factory)
+    assert not lazy.loaded and not calls
+    threads = [threading.Thread(target=lazy.load) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert lazy.loaded and len(calls) == 1
+    assert lazy.encode(['ab', 'c']) == [2, 1]
+    assert lazy.dim == 3
+
+
+class _Tokenizer:
+    # One token per word, padded to the longest text in the batch
+    def encode_batch(self, texts):
+        width = max(len(t.split()) for t in texts)
+        return [types.SimpleNamespace(ids=[len(w) for w in t.split()] + [0] * (width - len(t.split())),
+                                      attention_mask=[1] * len(t.split()) + [0] * (width - len(t.split())))
+                for t in texts]
+
+
+class _Session:
+    # Hidden state of a token: (token id, 1)
+    def run(self, outputs, feeds):
+        ids = feeds['input_ids'].astype(np.float32)
+        return [np.stack([ids, np.ones_like(ids)], axis=-1)]
+
+
+def _onnx_encoder(pooling, normalize=False):
+    encoder = object.__new__(encoders.OnnxEncoder)
+    encoder.config = {'dim': 2, 'pooling': pooling, 'normalize': normalize}
+    encoder.session = _Session()
+    encoder.tokenizer = _Tokenizer()
+    encoder.input_names = ['input_ids', 'attention_mask']
+    return encoder
+
+
+def test_onnx_mean_pooling_ignores_padding_and_keeps_order():
+    encoder = _onnx_encoder('mean')
+    texts = ['a', 'abc de', 'x yy zzz', 'four']
+    vectors = encoder.encode(texts, batch_size=2)
+    np.testing.assert_allclose(vectors[:, 0], [1, 2.5, 2, 4])
+    np.testing.assert_allclose(vectors[:, 1], 1)
+    np.testing.assert_allclose(encoder.encode('abc de'), vectors[1])
+
+
+def test_onnx_cls_pooling_and_normalization():
+    vectors = _onnx_encoder('cls', normalize=True).encode(['abc de', 'a'])
+    np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1, rtol=1e-6)
+    np.testing.assert_allclose(vectors[0], np.array([3, 1]) / np.sqrt(10), rtol=1e-6)
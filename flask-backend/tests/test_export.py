@@ -0,0 +1,46 @@
+import gzip
+import json
+
+from app import snapshot
+
+
+def test_export_gzip_matches_plain(client, admin, routes):
+    plain = client.get('/admin/export', query_string=admin)
+    assert plain.status_code == 200
+    assert len(json.loads(plain.data)) == len(routes.FAQS_DATA)
+    compressed = client.get('/admin/export', query_string=admin, headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(compressed.data)) == json.loads(plain.data)
+
+
+def test_export_conditional_get(client, admin):
+    first = client.get('/admin/export', query_string=admin, headers={'Accept-Encoding': 'gzip'})
+    again = client.get('/admin/export', query_string=admin,
+                       headers={'Accept-Encoding': 'gzip', 'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert not again.data
+
+
+def test_export_etag_changes_with_knowledge_base(client, admin, routes):
+    before = client.get('/admin/export', query_string=admin).headers['ETag']
+    question = 'Where can I print my export test documents?'
+    assert client.post('/admin/add', query_string=admin,
+                       json={'question': question, 'answer': 'At the export test print room.'}).status_code == 200
+    try:
+        assert client.get('/admin/export', query_string=admin).headers['ETag'] != before
+    finally:
+        idx = next(i for i, faq in enumerate(routes.FAQS_DATA) if faq['question'] == question)
+        client.post('/admin/delete', query_string=admin, json={'index': idx})
+
+
+def test_export_requires_password(client):
+    assert client.get('/admin/export').status_code == 401
+
+
+def test_export_etag_follows_content(client, admin, routes):
+    before = client.get('/admin/export', query_string=admin).headers['ETag']
+    # A rebuild with the same records (another worker reloading them) keeps the ETag
+    with routes.kb_lock:
+        routes.rebuild_indexes(routes.question_embeddings_cache)
+    assert client.get('/admin/export', query_string=admin).headers['ETag'] == before
+    assert routes.kb_etag() == f'kb-{snapshot.records_digest(routes.FAQS_DATA)[:32]}'
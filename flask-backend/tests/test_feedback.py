@@ -0,0 +1,143 @@
+import json
+
+import pytest
+
+from app import calibration, feedback, ratelimit
+
+
+@pytest.fixture
+def signer():
+    return feedback.AnswerSigner(b'key', max_age=100)
+
+
+def test_tokens_bind_question_and_answer(signer):
+    token = signer.sign('Where is the library?', 'Block A.', now=1000)
+    assert signer.verify(token, 'Where is the library?', 'Block A.', now=1050)
+    assert not signer.verify(token, 'Where is the library?', 'Block B.', now=1050)
+    assert not signer.verify(token, 'Where is the gym?', 'Block A.', now=1050)
+    assert not feedback.AnswerSigner(b'other key').verify(token, 'Where is the library?', 'Block A.', now=1050)
+    # Each answer served gets its own token
+    assert signer.sign('q', 'a', now=1000) != signer.sign('q', 'a', now=1000)
+
+
+def test_tokens_expire_and_tolerate_some_clock_skew(signer):
+    token = signer.sign('q', 'a', now=1000)
+    assert signer.verify(token, 'q', 'a', now=1100)
+    assert not signer.verify(token, 'q', 'a', now=1101)
+    assert signer.verify(token, 'q', 'a', now=940)
+    assert not signer.verify(token, 'q', 'a', now=939)
+
+
+@pytest.mark.parametrize('token', [None, '', 'abc', 'zz.nonce.digest', 'a.b.c.d', 12])
+def test_malformed_tokens_are_rejected(signer, token):
+    assert not signer.verify(token, 'q', 'a')
+
+
+def test_load_key_creates_one_shared_key(tmp_path, monkeypatch):
+    monkeypatch.delenv('FEEDBACK_SECRET')
+    path = str(tmp_path / 'feedback.key')
+    key = feedback.load_key(path)
+    assert len(key) == 32 and feedback.load_key(path) == key
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['feedback.key']
+    monkeypatch.setenv('FEEDBACK_SECRET', 'shared')
+    assert feedback.load_key(path) == b'shared'
+
+
+def test_vote_guard_rejects_duplicates_and_caps_votes(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(feedback.time, 'monotonic', lambda: clock[0])
+    guard = feedback.VoteGuard(None, max_votes=2, window=60)
+    assert guard.check('a', 't1') is None
+    assert guard.check('a', 't1') == ('duplicate', 0.0)
+    assert guard.check('b', 't1') == ('duplicate', 0.0)
+    assert guard.check('a', 't2') is None
+    assert guard.check('a', 't3') == ('cap', 60.0)
+    assert guard.check('b', 't3') is None
+    clock[0] += 60
+    # The window has passed: the cap resets
+    assert guard.check('a', 't4') is None
+    stats = guard.stats()
+    assert stats['accepted'] == 4 and stats['duplicates'] == 2 and stats['over_cap'] == 1
+
+
+def test_used_tokens_are_kept_until_they_expire(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(feedback.time, 'monotonic', lambda: clock[0])
+    guard = feedback.VoteGuard(None, max_votes=0, window=60, token_ttl=300)
+    assert guard.check('a', 't1') is None
+    clock[0] += 299
+    assert guard.check('a', 't1') == ('duplicate', 0.0)
+    clock[0] += 1
+    assert guard.check('a', 't1') is None
+    # Unsigned votes have no token to remember
+    assert guard.check('a', None) is None and guard.check('a', None) is None
+
+
+def test_vote_guard_rate_limits_per_client():
+    guard = feedback.VoteGuard(ratelimit.RateLimiter(rate=0.001, burst=2), max_votes=0)
+    assert guard.check('a', 't1') is None and guard.check('a', 't2') is None
+    reason, retry_after = guard.check('a', 't3')
+    assert reason == 'rate' and retry_after > 0
+    assert guard.check('b', 't4') is None
+
+
+@pytest.fixture
+def votes(routes, monkeypatch):
+    monkeypatch.setattr(routes, 'vote_guard', feedback.VoteGuard(None, max_votes=2))
+
+
+def ask(client, routes, i=0):
+    question = routes.FAQS_DATA[i]['question']
+    body = client.post('/ask', json={'question': question}).get_json()
+    return {'question': question, 'answer': body['answer'], 'token': body['token'], 'feedback': 'up'}
+
+
+def logged_votes():
+    try:
+        with open(feedback.FEEDBACK_PATH) as f:
+            return [json.loads(line) for line in f]
+    except FileNotFoundError:
+        return []
+
+
+def test_feedback_accepts_one_vote_per_answer(client, routes, votes):
+    before = len(logged_votes())
+    vote = ask(client, routes)
+    assert client.post('/feedback', json=vote).status_code == 200
+    assert client.post('/feedback', json=vote).status_code == 409
+    assert len(logged_votes()) == before + 1
+    assert logged_votes()[-1]['answer'] == vote['answer']
+
+
+def test_feedback_rejects_forged_votes(client, routes, votes):
+    vote = ask(client, routes)
+    assert client.post('/feedback', json=dict(vote, answer='Something else')).status_code == 400
+    assert client.post('/feedback', json=dict(vote, token=None)).status_code == 400
+    assert client.post('/feedback', json={'question': 'q', 'answer': 'a'}).status_code == 400
+    assert client.post('/feedback', data='not json', content_type='application/json').status_code == 400
+
+
+def test_unsigned_votes_only_during_the_transition(client, routes, votes, monkeypatch):
+    vote = {'question': 'Where is the library?', 'answer': 'Block A.', 'feedback': 'up'}
+    assert client.post('/feedback', json=vote).status_code == 400
+    monkeypatch.setattr(routes, 'FEEDBACK_ALLOW_UNSIGNED', True)
+    assert client.post('/feedback', json=vote).status_code == 200
+    assert logged_votes()[-1]['signed'] is False
+    # A token that is there but wrong is still refused
+    assert client.post('/feedback', json=dict(vote, token='1.2.3')).status_code == 400
+    signed = ask(client, routes)
+    assert client.post('/feedback', json=signed).status_code == 200
+    assert logged_votes()[-1]['signed'] is True
+    assert client.post('/feedback', json=signed).status_code == 409
+    # The calibration only learns from signed votes
+    learned = calibration.read_feedback(feedback.FEEDBACK_PATH)
+    assert ('Where is the library?', 'Block A.', 1) not in learned
+    assert (signed['question'], signed['answer'], 1) in learned
+
+
+def test_feedback_cap_returns_retry_after(client, routes, votes):
+    for i in range(2):
+        assert client.post('/feedback', json=ask(client, routes, i)).status_code == 200
+    response = client.post('/feedback', json=ask(client, routes, 2))
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
@@ -0,0 +1,79 @@
+import json
+
+import numpy as np
+import pytest
+
+from app import hotset
+
+FAQS = [
+    {'question': 'Where is the library?', 'answer': 'Block A.', 'category': 'Service'},
+    {'question': 'Library location?', 'answer': 'Block A.', 'category': 'Service'},
+    {'question': 'How do I pay fees?', 'answer': 'At the bursary.', 'category': 'Fees'},
+    {'question': 'When are exams?', 'answer': 'In June.', 'category': 'Exams'},
+]
+VECTORS = np.eye(4, dtype=np.float32)
+
+
+def test_popularity_decays_by_half_life():
+    popularity = hotset.Popularity(half_life=10)
+    start = popularity.start
+    popularity.hit('old', start)
+    popularity.hit('old', start)
+    popularity.hit('new', start + 20)
+    top = dict(popularity.top(5, start + 20))
+    assert top['old'] == pytest.approx(0.5) and top['new'] == pytest.approx(1.0)
+    assert [key for key, _ in popularity.top(1, start + 20)] == ['new']
+
+
+def test_popularity_rescales_and_forgets_stale_keys():
+    popularity = hotset.Popularity(half_life=1)
+    start = popularity.start
+    popularity.hit('stale', start)
+    popularity.hit('fresh', start + 70)
+    assert popularity.top(5, start + 70) == [('fresh', pytest.approx(1.0))]
+    assert len(popularity) == 1 and popularity.start == start + 70
+
+
+def test_hot_tier_match():
+    tier = hotset.HotTier(FAQS, VECTORS, [0, 2], prior=[0.0, 0.0, -0.1, 0.0])
+    answer, score, body = tier.match(VECTORS[2], 0.5)
+    assert answer == 'At the bursary.' and score == pytest.approx(0.9)
+    assert json.loads(body) == {'answer': 'At the bursary.', 'source': 'semantic', 'tier': 'hot',
+                                'score': pytest.approx(0.9)}
+    assert tier.match(VECTORS[2], 0.95) is None
+    assert tier.match(VECTORS[2], 0.5, category='Service') is None
+    assert tier.match(VECTORS[3], 0.5) is None
+    assert tier.match(np.ones(3, dtype=np.float32), 0.5) is None
+
+
+def test_hot_set_holds_the_most_asked_answers():
+    hot = hotset.HotSet(size=2, threshold=0.9, interval=0)
+    hot.load(FAQS, VECTORS)
+    assert len(hot.tier) == 0
+    for _ in range(3):
+        hot.hit('Block A.')
+    hot.hit('In June.')
+    hot.rebuild()
+    # Both rows answering 'Block A.' share its count and fill the tier
+    assert sorted(hot.tier.rows) == [0, 1]
+    assert hot.lookup(VECTORS[1])[0] == 'Block A.'
+    assert hot.lookup(VECTORS[3]) is None
+    stats = hot.stats()
+    assert stats['hits'] == 1 and stats['misses'] == 1 and stats['top'][0]['answer'] == 'Block A.'
+
+
+def test_ask_answers_popular_questions_from_the_hot_tier(client, routes, monkeypatch):
+    hot = hotset.HotSet(size=4, threshold=0.5, interval=0)
+    monkeypatch.setattr(routes, 'hot_set', hot)
+    hot.load(list(routes.FAQS_DATA), routes.question_embeddings_cache, routes.dense_index.record_prior())
+    faq = routes.FAQS_DATA[0]
+    # Exact questions are answered lexically, and counted
+    for _ in range(3):
+        assert client.post('/ask', json={'question': faq['question']}).get_json()['source'] == 'lexical'
+    hot.rebuild()
+    assert faq['answer'] in hot.tier.answers
+    question = 'please tell me ' + faq['question'].lower()
+    body = client.post('/ask', json={'question': question}).get_json()
+    assert body['tier'] == 'hot' and body['answer'] == faq['answer']
+    assert routes.answer_signer.verify(body['token'], question, faq['answer'])
+    assert hot.stats()['hits'] == 1
@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+HEAVY = ('torch', 'sentence_transformers', 'transformers', 'onnxruntime', 'pdfplumber', 'bs4', 'requests')
+
+# Fails any import of a heavy module, then starts the app from the index
+# snapshot and serves /health
+STARTUP = f'''
+import sys
+
+class Block:
+    def find_spec(self, name, path=None, target=None):
+        if name.split('.')[0] in {HEAVY!r}:
+            raise ImportError('imported ' + name)
+
+sys.meta_path.insert(0, Block())
+from app import create_app
+response = create_app().test_client().get('/health')
+assert response.status_code == 200, response.status_code
+'''
+
+
+def test_app_starts_without_heavy_dependencies(routes):
+    # The session app has written the index snapshot the new process starts from
+    result = subprocess.run([sys.executable, '-c', STARTUP], cwd=os.getcwd(), capture_output=True, text=True,
+                            env=dict(os.environ, PYTHONPATH=os.getcwd()), timeout=120)
+    assert result.returncode == 0, result.stderr
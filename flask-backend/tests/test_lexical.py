@@ -0,0 +1,71 @@
+from app import lexical
+
+FAQS = [
+    {'question': 'What are your business hours?', 'answer': 'Monday to Friday, 8 AM to 4.30 PM.'},
+    {'question': 'Where is the library located?', 'answer': 'Next to the main hall.'},
+    {'question': 'How do I pay my tuition fees?', 'answer': 'At the bursary or by bank transfer.'},
+    {'question': 'How do I pay my hostel fees?', 'answer': 'At the accommodation office.'},
+]
+
+
+def test_edit_distance_counts_transpositions_once():
+    assert lexical.edit_distance('library', 'library', 2) == 0
+    assert lexical.edit_distance('libary', 'library', 2) == 1
+    assert lexical.edit_distance('lirbary', 'library', 2) == 1
+    assert lexical.edit_distance('lbrry', 'library', 1) == 2
+
+
+def test_speller_corrects_to_vocabulary_words():
+    speller = lexical.SpellingCorrector([faq['question'] for faq in FAQS])
+    assert speller.correct('where is the libary locatd') == 'where is the library located'
+    # Short tokens and numbers are left alone
+    assert speller.correct('hal 2024') == 'hal 2024'
+
+
+def test_exact_and_normalized_matches():
+    index = lexical.LexicalIndex(FAQS)
+    assert index.match('What are your business hours?') == (0, 1.0, 'what are your business hour')
+    assert index.match('  WHERE is the library located  ')[:2] == (1, 1.0)
+    assert index.match('') is None
+
+
+def test_misspelled_question_matches():
+    idx, score, corrected = lexical.LexicalIndex(FAQS).match('Wher is the libary located')
+    assert idx == 1
+    assert corrected == 'where is the library located'
+
+
+def test_ambiguous_or_unrelated_questions_go_to_the_encoder():
+    index = lexical.LexicalIndex(FAQS, threshold=0.6)
+    # Equally close to the tuition and hostel questions: no confident winner
+    assert index.match('How do I pay my fees?') is None
+    assert index.match('Can I bring a pet to campus?') is None
+
+
+def test_state_round_trip():
+    index = lexical.LexicalIndex(FAQS)
+    restored = lexical.LexicalIndex.from_state(*index.state())
+    for question in ('Wher is the libary located', 'How do I pay my hostel fee'):
+        assert restored.match(question) == index.match(question)
+    assert restored.search('tuition fees', top_k=2) == index.search('tuition fees', top_k=2)
+
+
+def test_fast_answer_serves_misspelled_known_question(routes):
+    faq = routes.FAQS_DATA[0]
+    misspelled = faq['question'].replace('business', 'bussiness')
+    result = routes.fast_answer(misspelled)
+    assert result['source'] == 'lexical'
+    assert result['answer'] == faq['answer']
+
+
+def test_lexical_answers_use_the_records_their_index_was_built_from(routes):
+    records = list(routes.FAQS_DATA)
+    faq = records[-1]
+    try:
+        # What a request sees between FAQS_DATA being replaced and the rebuild
+        routes.FAQS_DATA[:] = records[:1]
+        assert routes.fast_answer(faq['question'])['answer'] == faq['answer']
+        assert routes.degraded_answer(faq['question'])['answer'] == faq['answer']
+        assert routes.preliminary_answer(faq['question'])['answer'] == faq['answer']
+    finally:
+        routes.FAQS_DATA[:] = records
@@ -0,0 +1,161 @@
+import argparse
+import copy
+import http.server
+import multiprocessing
+import os
+import re
+import threading
+import time
+
+import pytest
+
+import fake_site
+import load_test
+from app import feedback
+
+
+def test_parse_mix():
+    assert load_test.parse_mix('known=6, paraphrase=3,unknown=1') == {'known': 6.0, 'paraphrase': 3.0, 'unknown': 1.0}
+    with pytest.raises(argparse.ArgumentTypeError):
+        load_test.parse_mix('known=1,typos=2')
+
+
+def test_make_pdf_has_a_valid_xref_table():
+    pdf = load_test.make_pdf(['Q: Where is (room) 4?', 'A: Block B.'])
+    assert pdf.startswith(b'%PDF-1.4') and pdf.endswith(b'%%EOF\n')
+    assert b'(Q: Where is \\(room\\) 4?) Tj' in pdf
+    xref = int(re.search(rb'startxref\n(\d+)', pdf).group(1))
+    assert pdf[xref:].startswith(b'xref')
+    offsets = [int(offset) for offset in re.findall(rb'(\d{10}) 00000 n', pdf)]
+    assert [pdf[offset:].split(b' ', 1)[0] for offset in offsets] == [b'1', b'2', b'3', b'4', b'5']
+
+
+def test_questions_follow_the_mix():
+    faqs = [{'question': 'Where is the library?', 'answer': 'Block A.'}, {'question': 'No answer'}]
+    traffic = load_test.Traffic(faqs, {'known': 1}, 2, 'pw', 'secret')
+    assert traffic.faqs == [(0, faqs[0])]
+    assert {traffic.question() for _ in range(5)} == {'Where is the library?'}
+    traffic.mix = {'paraphrase': 1}
+    assert traffic.question().startswith('please tell me ')
+    traffic.mix = {'unknown': 1}
+    assert traffic.question() in load_test.UNKNOWN
+    traffic.mix = {'site': 1}
+    assert any(topic in traffic.question() for topic in fake_site.TOPICS)
+    # The same seed gives the same traffic
+    mix = {'known': 1, 'unknown': 1}
+    assert ([load_test.Traffic(faqs, mix, 2, 'pw', 'secret', seed=3).question() for _ in range(5)]
+            == [load_test.Traffic(faqs, mix, 2, 'pw', 'secret', seed=3).question() for _ in range(5)])
+
+
+def test_requests_are_accepted_by_the_app(client, routes):
+    faqs = copy.deepcopy(routes.FAQS_DATA)
+    traffic = load_test.Traffic(faqs, {'known': 1}, 3, 'test-password', 'test-secret')
+
+    def send(kind):
+        method, path, kwargs = traffic.request(kind)
+        assert method == 'POST'
+        return client.post(path, json=kwargs['json'], query_string=kwargs.get('params'))
+
+    assert send('ask').status_code == 200
+    batch = send('batch')
+    assert batch.status_code == 200 and len(batch.get_json()['results']) == 3
+    # Votes carry a token signed with the app's secret
+    _, _, kwargs = traffic.request('feedback')
+    vote = kwargs['json']
+    assert feedback.AnswerSigner(b'test-secret').verify(vote['token'], vote['question'], vote['answer'])
+    assert client.post('/feedback', json=vote).status_code == 200
+    # Edits rewrite a FAQ with its own content
+    assert send('edit').status_code == 200
+    assert [(f['question'], f['answer']) for f in routes.FAQS_DATA] == [(f['question'], f['answer']) for f in faqs]
+
+
+def test_edits_name_the_faq_by_its_position_in_the_file():
+    faqs = [{'question': 'No answer'}, {'question': '', 'answer': 'No question'},
+            {'question': 'Where is the library?', 'answer': 'Block A.'}]
+    traffic = load_test.Traffic(faqs, {'known': 1}, 1, 'pw', 'secret')
+    for _ in range(3):
+        assert traffic.request('edit')[2]['json'] == dict(faqs[2], index=2)
+
+
+def test_pdf_uploads_are_numbered():
+    traffic = load_test.Traffic([{'question': 'q', 'answer': 'a'}], {'known': 1}, 1, 'pw', 'secret')
+    first = traffic.request('pdf')[2]
+    second = traffic.request('pdf')[2]
+    assert first['params'] == {'pw': 'pw'}
+    assert first['files']['pdf'][0] == 'load1.pdf' and second['files']['pdf'][0] == 'load2.pdf'
+    assert b'load test office 2-0' in second['files']['pdf'][1]
+
+
+def test_summarize():
+    records = [('ask', 200, float(ms), 0.0) for ms in range(1, 101)]
+    records += [('ask', 404, 50.0, 0.0), ('ask', 503, 5.0, 0.0), ('ask', 'ConnectTimeout', 1000.0, 200.0)]
+    records += [('edit', 404, 10.0, 0.0), ('edit', 429, 10.0, 0.0)]
+    report = load_test.summarize(records, duration=10)
+    assert set(report) == {'ask', 'edit'}
+    ask = report['ask']
+    # A 404 is an unanswered question for /ask, but an error anywhere else
+    assert (ask['requests'], ask['ok'], ask['shed'], ask['errors']) == (103, 101, 1, 1)
+    assert ask['error_rate'] == round(1 / 103, 4) and ask['throughput_rps'] == 10.1
+    assert ask['latency_ms']['max'] == 1000.0 and ask['latency_ms']['p50'] == 50.0
+    assert ask['late_sends'] == 1
+    assert ask['statuses'] == {'200': 100, '404': 1, '503': 1, 'ConnectTimeout': 1}
+    assert (report['edit']['ok'], report['edit']['shed'], report['edit']['errors']) == (0, 1, 1)
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.send_response(200 if self.path == '/ask' else 503)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def test_run_traffic_records_only_the_measured_window():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        base = f'http://127.0.0.1:{server.server_address[1]}'
+        traffic = load_test.Traffic([{'question': 'q', 'answer': 'a'}], {'known': 1}, 2, 'pw', 'secret')
+        run = load_test.run_traffic(base, traffic, {'ask': 40, 'batch': 20, 'edit': 0}, duration=0.5,
+                                    warmup=0.2, concurrency=4, timeout=5)
+        assert next(run) == 'measuring'
+        records = next(run)
+    finally:
+        server.shutdown()
+        server.server_close()
+    kinds = {record[0] for record in records}
+    assert kinds <= {'ask', 'batch'} and 'ask' in kinds
+    assert all(status == (200 if kind == 'ask' else 503) for kind, status, _, _ in records)
+    # Roughly 40/s over the half second measured, not counting the warmup
+    assert 5 <= sum(record[0] == 'ask' for record in records) <= 45
+
+
+def test_sampler_reports_worker_usage():
+    stop = multiprocessing.get_context('spawn').Event()
+    worker = multiprocessing.get_context('spawn').Process(target=stop.wait)
+    worker.start()
+    try:
+        sampler = load_test.ProcessSampler(os.getpid(), interval=0.05)
+        sampler.start()
+        time.sleep(0.2)
+        sampler.stop()
+    finally:
+        stop.set()
+        worker.join()
+    workers = {entry['pid']: entry for entry in sampler.report()}
+    assert worker.pid in workers
+    assert workers[worker.pid]['rss_peak_mb'] > 0 and workers[worker.pid]['cpu_avg_pct'] >= 0
+
+
+def test_fake_site_check(capsys):
+    site = fake_site.FakeSite(pages=6)
+    server, base = fake_site.serve(site)
+    try:
+        fake_site.check(site, base)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert capsys.readouterr().out.endswith('ok\n')
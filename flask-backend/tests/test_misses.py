@@ -0,0 +1,83 @@
+import numpy as np
+
+from app import misses
+
+
+def unit(*components, dim=8):
+    vector = np.zeros(dim, dtype=np.float32)
+    vector[:len(components)] = components
+    return vector / np.linalg.norm(vector)
+
+
+def record_misses(log):
+    for noise in (0.0, 0.05, 0.1):
+        log.record('Can I park on campus?', unit(1, noise), 0.4, 'Where is the main gate?')
+    log.record('Is there a gym?', unit(0, 0, 1), 0.2, 'What sports do you offer?')
+
+
+def test_misses_are_clustered_into_suggestions(tmp_path):
+    miner = misses.MissMiner(str(tmp_path))
+    record_misses(miner.log)
+    assert miner.refresh() == 4
+    latest = miner.latest()
+    assert latest['misses'] == 4
+    first, second = latest['suggestions']
+    assert first['count'] == 3 and first['label'] == 'Can I park on campus?'
+    assert first['avg_best_score'] == 0.4
+    assert first['nearest_faq'] == 'Where is the main gate?'
+    assert second['count'] == 1 and second['label'] == 'Is there a gym?'
+
+
+def test_refresh_only_reads_new_misses(tmp_path):
+    miner = misses.MissMiner(str(tmp_path))
+    record_misses(miner.log)
+    miner.refresh()
+    assert miner.refresh() == 0
+    miner.log.record('park on campus', unit(1, 0.02), 0.5)
+    # A new miner (another worker, or after a restart) continues from the saved offset
+    miner = misses.MissMiner(str(tmp_path))
+    assert miner.refresh() == 1
+    assert miner.latest()['suggestions'][0]['count'] == 4
+
+
+def test_clusters_covered_by_a_new_faq_are_dropped(tmp_path):
+    faq_matrix = [None]
+    miner = misses.MissMiner(str(tmp_path), lambda: faq_matrix[0])
+    record_misses(miner.log)
+    miner.refresh()
+    assert len(miner.latest()['suggestions']) == 2
+    faq_matrix[0] = np.stack([unit(1, 0.05)])
+    miner.refresh()
+    assert [s['label'] for s in miner.latest()['suggestions']] == ['Is there a gym?']
+
+
+def test_vectors_of_another_dimension_are_skipped(tmp_path):
+    miner = misses.MissMiner(str(tmp_path))
+    miner.log.record('old model', unit(1, dim=4))
+    miner.log.record('first', unit(1))
+    assert miner.refresh() == 1
+    assert miner.latest()['misses'] == 1
+
+
+def test_a_new_model_dimension_starts_new_clusters(tmp_path):
+    miner = misses.MissMiner(str(tmp_path))
+    record_misses(miner.log)
+    assert miner.refresh() == 4
+    # After re-embedding into a bigger model
+    for noise in (0.0, 0.05, 0.1, 0.15, 0.2):
+        miner.log.record('Where can I print?', unit(0, 1, noise, dim=16), 0.3)
+    miner = misses.MissMiner(str(tmp_path))
+    assert miner.refresh() == 5
+    latest = miner.latest()
+    assert latest['misses'] == 5
+    assert [(s['label'], s['count'], s['avg_best_score']) for s in latest['suggestions']] == [
+        ('Where can I print?', 5, 0.3)]
+    miner.log.record('Where can I print?', unit(0, 1, dim=16))
+    assert miner.refresh() == 1
+
+
+def test_admin_suggestions(client, admin):
+    response = client.post('/admin/suggestions', query_string=admin)
+    assert response.status_code == 200
+    assert 'suggestions' in response.get_json()
+    assert client.get('/admin/suggestions').status_code == 401
@@ -0,0 +1,76 @@
+import numpy as np
+
+from app import query_cache
+
+
+def test_normalize_query_folds_equivalent_wordings():
+    assert query_cache.normalize_query('  Entry   Types?! ') == 'entry type'
+    assert query_cache.normalize_query('entry type') == 'entry type'
+    assert query_cache.normalize_query('Campus bus status, Library hours') == 'campus bus status library hour'
+    assert query_cache.normalize_query('') == ''
+    assert query_cache.normalize_query(None) == ''
+
+
+def test_cache_evicts_least_recently_used_entries():
+    cache = query_cache.QueryEmbeddingCache('test', max_entries=2)
+    for key in 'abc':
+        cache.put(key, np.ones(4))
+        if key == 'b':
+            assert cache.get('a') is not None
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    stats = cache.stats()
+    assert stats['entries'] == 2 and stats['evictions'] == 1
+
+
+def test_cache_respects_byte_budget():
+    vector = np.ones(64, dtype=np.float32)
+    entry = vector.nbytes + 1 + query_cache.QueryEmbeddingCache.ENTRY_OVERHEAD
+    cache = query_cache.QueryEmbeddingCache('test', max_bytes=entry * 3)
+    for key in 'abcde':
+        cache.put(key, vector)
+    stats = cache.stats()
+    assert stats['entries'] == 3 and stats['bytes'] <= entry * 3
+    assert cache.get('a') is None and cache.get('e') is not None
+
+
+def test_cached_vectors_are_read_only():
+    cache = query_cache.QueryEmbeddingCache('test')
+    cache.put('a', np.ones(4))
+    assert not cache.get('a').flags.writeable
+
+
+def test_sqlite_store_survives_a_new_cache(tmp_path):
+    path = str(tmp_path / 'queries.db')
+    query_cache.QueryEmbeddingCache('model-a', store_path=path).put('a', np.arange(4))
+    cache = query_cache.QueryEmbeddingCache('model-a', store_path=path)
+    np.testing.assert_array_equal(cache.get('a'), np.arange(4))
+    assert cache.stats()['store_hits'] == 1
+    assert query_cache.QueryEmbeddingCache('model-b', store_path=path).get('a') is None
+
+
+def test_store_pruning_keeps_the_entries_read_most_recently(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(query_cache.time, 'time', lambda: clock[0])
+    path = str(tmp_path / 'queries.db')
+    writer = query_cache.QueryEmbeddingCache('model-a', store_path=path)
+    for key in ('old', 'new', 'newer'):
+        clock[0] += 1
+        writer.put(key, np.ones(4))
+    cache = query_cache.QueryEmbeddingCache('model-a', store_path=path, max_store_entries=2)
+    cache.TOUCH_BATCH = 2
+    clock[0] += 1
+    # Store hits, then a memory hit; two keys make a batch
+    assert cache.get('old') is not None and cache.get('old') is not None
+    store = cache._store()
+    assert store.execute("SELECT used FROM query_embeddings WHERE key = 'old'").fetchone()[0] == 1001
+    assert cache.get('newer') is not None
+    assert store.execute("SELECT used FROM query_embeddings WHERE key = 'old'").fetchone()[0] == clock[0]
+    cache._prune_store(store)
+    assert {row[0] for row in store.execute('SELECT key FROM query_embeddings')} == {'old', 'newer'}
+
+
+def test_encode_query_returns_unit_vectors_shared_by_equivalent_wordings(routes):
+    vector = routes.encode_query('Where is the LIBRARY??')
+    np.testing.assert_allclose(np.linalg.norm(vector), 1, rtol=1e-6)
+    assert routes.encode_query('where is the library') is vector
@@ -0,0 +1,109 @@
+import pytest
+
+from app import ratelimit
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, 'monotonic', clock)
+    return clock
+
+
+def test_token_bucket_allows_bursts_then_refills(clock):
+    limiter = ratelimit.RateLimiter(rate=1.0, burst=3)
+    assert [limiter.allow('a')[0] for _ in range(4)] == [True, True, True, False]
+    assert limiter.allow('a') == (False, pytest.approx(1.0))
+    # Other clients have their own buckets
+    assert limiter.allow('b')[0]
+    clock.now += 1.5
+    assert limiter.allow('a')[0]
+    assert not limiter.allow('a')[0]
+    assert limiter.stats()['rejected'] == 3
+
+
+def test_costly_request_leaves_the_bucket_in_debt(clock):
+    limiter = ratelimit.RateLimiter(rate=1.0, burst=3)
+    assert limiter.allow('a', cost=10)[0]
+    allowed, retry_after = limiter.allow('a')
+    assert not allowed and retry_after == pytest.approx(8.0)
+    clock.now += 8
+    assert limiter.allow('a')[0]
+
+
+def test_idle_clients_are_dropped(clock):
+    limiter = ratelimit.RateLimiter(rate=1.0, burst=1, max_clients=2)
+    for key in 'abc':
+        limiter.allow(key)
+    assert limiter.stats()['clients'] == 2
+    # 'a' was dropped, so it starts with a full bucket again
+    assert limiter.allow('a')[0]
+
+
+def test_load_shedder_backs_off_multiplicatively_and_recovers_additively():
+    shedder = ratelimit.LoadShedder(max_inflight=4, target_ms=100)
+    assert all(shedder.acquire() for _ in range(4))
+    assert not shedder.acquire() and shedder.saturated()
+    for _ in range(4):
+        shedder.release(500)
+    assert shedder.limit == pytest.approx(4 * 0.9 ** 4)
+    assert shedder.stats()['slow'] == 4 and shedder.stats()['shed'] == 1
+    for _ in range(50):
+        assert shedder.acquire()
+        shedder.release(10)
+    assert shedder.limit == 4
+    for _ in range(100):
+        shedder.acquire()
+        shedder.release(10_000)
+    assert shedder.limit == 1
+
+
+def test_shedder_run_raises_when_no_slot_is_free():
+    shedder = ratelimit.LoadShedder(max_inflight=1)
+    assert shedder.run(lambda x: x * 2, 21) == 42
+    assert shedder.acquire()
+    with pytest.raises(ratelimit.Overloaded):
+        shedder.run(lambda: None)
+    assert shedder.inflight == 1
+
+
+def test_client_key_trusts_only_the_configured_proxies():
+    forwarded = 'spoofed, 10.0.0.7, 172.16.0.2'
+    assert ratelimit.client_key('192.168.1.1', forwarded, 0) == '192.168.1.1'
+    assert ratelimit.client_key('192.168.1.1', forwarded, 1) == '172.16.0.2'
+    assert ratelimit.client_key('192.168.1.1', forwarded, 2) == '10.0.0.7'
+    assert ratelimit.client_key('192.168.1.1', '172.16.0.2', 2) == '192.168.1.1'
+    assert ratelimit.client_key(None, None, 1) == 'unknown'
+
+
+def test_ask_is_rate_limited_per_question(client, routes, monkeypatch):
+    monkeypatch.setattr(routes, 'rate_limiter', ratelimit.RateLimiter(rate=0.01, burst=2))
+    question = routes.FAQS_DATA[0]['question']
+    response = client.post('/ask/batch', json={'questions': [question] * 3})
+    assert response.status_code == 200
+    response = client.post('/ask', json={'question': question})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+    # A malformed batch is rejected before it is charged
+    assert client.post('/ask/batch', json={'questions': 'nope'}).status_code == 400
+
+
+def test_ask_sheds_load_when_the_encoder_is_saturated(client, routes, monkeypatch):
+    monkeypatch.setattr(routes, 'shedder', ratelimit.LoadShedder(max_inflight=0))
+    response = client.post('/ask', json={'question': 'Are zebras allowed in the quantum lab?'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert response.get_json()['degraded']
+    # A close lexical match is still answered without the encoder
+    faq = routes.FAQS_DATA[0]
+    response = client.post('/ask', json={'question': faq['question'] + ' please'})
+    assert response.status_code == 200
+    assert response.get_json()['answer'] == faq['answer']
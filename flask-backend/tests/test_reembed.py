@@ -0,0 +1,96 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from app import reembed, snapshot
+
+
+@pytest.fixture
+def green():
+    entry = reembed.entry_for('hash/green-model', 'torch')
+    yield entry
+    if os.path.exists(reembed.snapshot_path(entry)):
+        os.remove(reembed.snapshot_path(entry))
+
+
+def test_entry_names_are_file_safe():
+    entry = reembed.entry_for('sentence-transformers/all-mpnet-base-v2', 'onnx-int8')
+    assert entry['snapshot'] == 'faqs.sentence-transformers_all-mpnet-base-v2-onnx-int8.snapshot'
+    assert reembed.model_id(entry) == 'sentence-transformers/all-mpnet-base-v2:onnx-int8'
+
+
+def test_build_writes_a_snapshot_for_the_new_model(routes, green):
+    report = reembed.build(green, workers=1)
+    assert report['faqs'] == len(routes.FAQS_DATA)
+    snap = snapshot.Snapshot(reembed.snapshot_path(green))
+    assert snap.header['model'] == reembed.model_id(green)
+    np.testing.assert_allclose(np.linalg.norm(snap.vectors(), axis=1), 1, rtol=1e-5)
+
+
+def test_eval_set_uses_helpful_feedback(tmp_path):
+    records = [{'question': 'Where is the main library building?', 'answer': 'Block A.'},
+               {'question': 'How do I pay fees?', 'answer': 'At the bursary.'}]
+    log = tmp_path / 'feedback.txt'
+    log.write_text('\n'.join(json.dumps(item) for item in [
+        {'question': 'library?', 'answer': 'Block A.', 'feedback': 'up'},
+        {'question': 'bursary?', 'answer': 'At the bursary.', 'feedback': 'down'},
+        {'question': 'unknown?', 'answer': 'Not an FAQ.', 'feedback': 'up'},
+    ]) + '\nnot json\n')
+    pairs = dict(reembed.eval_set(records, str(log)))
+    assert pairs['library?'] == 0
+    assert 'bursary?' not in pairs and 'unknown?' not in pairs
+    # Plus one paraphrase per FAQ, the same on every run
+    assert len(pairs) == 3
+    assert reembed.eval_set(records, str(log)) == reembed.eval_set(records, str(log))
+
+
+def test_verdict():
+    blue = {'top1': 0.8, 'p95_ms': 10.0}
+    assert reembed.verdict({'blue': blue, 'green': {'top1': 0.85, 'p95_ms': 12.0}}) is None
+    assert 'accuracy' in reembed.verdict({'blue': blue, 'green': {'top1': 0.7, 'p95_ms': 5.0}})
+    assert 'latency' in reembed.verdict({'blue': blue, 'green': {'top1': 0.9, 'p95_ms': 20.0}})
+    assert reembed.verdict({'blue': blue, 'green': {'top1': 0.75, 'p95_ms': 10.0}}, max_accuracy_drop=0.1) is None
+
+
+def test_promote_and_rollback(routes, green, tmp_path):
+    state_path = str(tmp_path / 'index_state.json')
+    reembed.build(green, workers=1)
+    with pytest.raises(SystemExit, match='Nothing to roll back'):
+        reembed.rollback(state_path)
+    state = reembed.promote(green, path=state_path)
+    assert state['active'] == green and state['previous'] == reembed.default_entry()
+    state = reembed.rollback(state_path)
+    assert state['active'] == reembed.default_entry() and state['previous'] == green
+    assert [list(event)[0] for event in reembed.load_state(state_path)['history']] == ['promoted', 'rolled_back_to']
+
+
+def test_promote_refuses_a_stale_build(green, tmp_path):
+    faqs_path = tmp_path / 'faqs.json'
+    faqs_path.write_text(json.dumps([{'question': 'Old question?', 'answer': 'Old.'}]))
+    reembed.build(green, workers=1, faqs_path=str(faqs_path))
+    faqs_path.write_text(json.dumps([{'question': 'New question?', 'answer': 'New.'}]))
+    state_path = str(tmp_path / 'index_state.json')
+    with pytest.raises(SystemExit, match='changed since'):
+        reembed.promote(green, faqs_path=str(faqs_path), path=state_path)
+    assert reembed.promote(green, force=True, faqs_path=str(faqs_path), path=state_path)['active'] == green
+
+
+# Uses index_state.json in the scratch copy of the app, as the workers do
+def test_workers_switch_to_the_promoted_index_and_back(client, admin, routes, green):
+    blue_id = routes.MODEL_ID
+    reembed.build(green, workers=1)
+    reembed.promote(green)
+    faq = routes.FAQS_DATA[1]
+    try:
+        response = client.post('/admin/index', query_string=admin).get_json()
+        assert response['switched'] == 'snapshot'
+        assert response['serving'] == routes.MODEL_ID == reembed.model_id(green)
+        assert client.post('/ask', json={'question': faq['question']}).get_json()['answer'] == faq['answer']
+    finally:
+        reembed.rollback()
+        routes.check_index_state()
+        os.remove(reembed.STATE_PATH)
+    assert routes.MODEL_ID == blue_id
+    assert client.post('/ask', json={'question': faq['question']}).get_json()['answer'] == faq['answer']
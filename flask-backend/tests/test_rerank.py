@@ -0,0 +1,81 @@
+import threading
+import time
+
+from app import rerank
+
+
+# Scores a pair by how many words the two sides share
+class WordOverlapModel:
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, pairs):
+        self.calls.append(len(pairs))
+        return [len(set(a.lower().split()) & set(b.lower().split())) for a, b in pairs]
+
+
+def candidates(*questions):
+    return [({'question': q}, 1.0 - i / 10) for i, q in enumerate(questions)]
+
+
+def reranker(pair_ms=None, top_n=5, budget_ms=150.0):
+    ranker = rerank.Reranker('fake', top_n=top_n, budget_ms=budget_ms)
+    ranker._model = WordOverlapModel()
+    ranker.pair_ms = pair_ms
+    return ranker
+
+
+def test_rerank_reorders_candidates():
+    ranker = reranker()
+    ordered, scores, skipped = ranker.rerank('where is the main library',
+                                             candidates('opening hours', 'main library location', 'library'))
+    assert skipped is None
+    assert [faq['question'] for faq, _ in ordered] == ['main library location', 'library', 'opening hours']
+    assert scores == [2.0, 1.0, 0.0]
+    assert ranker.stats()['changed_top'] == 1
+
+
+def test_candidates_are_cut_to_the_budget():
+    ranker = reranker(pair_ms=50.0, budget_ms=150.0)
+    pool = candidates('a', 'b', 'c', 'library d', 'library e')
+    ordered, scores, _ = ranker.rerank('library', pool)
+    assert ranker._model.calls == [3]
+    assert len(scores) == 3
+    # Candidates beyond the budget keep their bi-encoder order at the end
+    assert ordered[3:] == pool[3:]
+
+
+def test_rerank_is_skipped_when_two_pairs_do_not_fit():
+    ranker = reranker(pair_ms=100.0, budget_ms=150.0)
+    pool = candidates('a', 'b', 'c')
+    assert ranker.rerank('q', pool) == (pool, None, 'budget')
+    assert ranker._model.calls == []
+    assert ranker.stats()['skipped_budget'] == 1
+
+
+def test_budget_is_probed_again_periodically():
+    ranker = reranker(pair_ms=100.0, budget_ms=150.0)
+    for _ in range(rerank.Reranker.PROBE_EVERY):
+        ranker.rerank('q', candidates('a', 'b', 'c'))
+    assert ranker._model.calls == [2]
+    # The fake model is fast, so the probe brings the cost estimate back down
+    assert ranker.pair_ms < 100.0
+
+
+def test_missing_model_falls_back_to_bi_encoder_order(monkeypatch):
+    ranker = rerank.Reranker('fake')
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        ranker._error = 'no model'
+        ranker._loading = False
+
+    monkeypatch.setattr(ranker, '_load', fail)
+    pool = candidates('a', 'b')
+    assert ranker.rerank('q', pool) == (pool, None, 'loading')
+    release.set()
+    deadline = time.monotonic() + 5
+    while ranker._loading and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert ranker.rerank('q', pool) == (pool, None, 'unavailable')
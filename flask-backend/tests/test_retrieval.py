@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from app import retrieval
+
+CATEGORIES = ['Service', 'Fees', None, 'fees ', 'Library', 'Service']
+
+
+@pytest.fixture
+def index_data():
+    rng = np.random.default_rng(7)
+    faqs = [{'question': f'q{i}', 'category': CATEGORIES[i % len(CATEGORIES)]} for i in range(60)]
+    embeddings = rng.normal(size=(60, 16)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return faqs, embeddings, retrieval.DenseIndex(faqs, embeddings)
+
+
+def brute_force(faqs, embeddings, query, top_k, categories=None):
+    scores = embeddings @ query
+    rows = [i for i in range(len(faqs))
+            if categories is None or retrieval.category_key(faqs[i]['category']) in
+            {retrieval.category_key(c) for c in categories}]
+    rows.sort(key=lambda i: scores[i], reverse=True)
+    return [(i, float(scores[i])) for i in rows[:top_k]]
+
+
+def assert_same(results, expected):
+    assert [idx for idx, _ in results] == [idx for idx, _ in expected]
+    np.testing.assert_allclose([s for _, s in results], [s for _, s in expected], rtol=1e-5)
+
+
+def test_category_filtered_search_equals_brute_force(index_data):
+    faqs, embeddings, index = index_data
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        query = rng.normal(size=16).astype(np.float32)
+        for categories in (None, ['Fees'], ['service', 'Library'], [retrieval.UNCATEGORIZED]):
+            assert_same(index.search(query, 5, categories), brute_force(faqs, embeddings, query, 5, categories))
+
+
+def test_unknown_category_finds_nothing(index_data):
+    _, _, index = index_data
+    assert index.search(np.ones(16, dtype=np.float32), 3, ['Sports']) == []
+    assert not index.has_category('Sports')
+    assert index.has_category(' FEES')
+
+
+def test_categories_are_merged_case_insensitively(index_data):
+    _, _, index = index_data
+    counts = {entry['category']: entry['count'] for entry in index.categories()}
+    assert counts == {'Fees': 20, 'Library': 10, 'Service': 20}
+
+
+def test_route_picks_the_nearest_category(index_data):
+    faqs, embeddings, index = index_data
+    library = [i for i, faq in enumerate(faqs) if faq['category'] == 'Library']
+    centroid = embeddings[library].mean(axis=0)
+    assert index.route(centroid / np.linalg.norm(centroid), max_categories=1) == ['library']
+
+
+def test_ask_rejects_unknown_category(client):
+    response = client.post('/ask', json={'question': 'Where is cut located?', 'category': 'No such thing'})
+    assert response.status_code == 400
+
+
+def test_ask_filters_by_category(client, routes):
+    faq = next(faq for faq in routes.FAQS_DATA if faq.get('category'))
+    response = client.post('/ask', json={'question': faq['question'], 'category': faq['category']})
+    assert response.status_code == 200
+    assert response.get_json()['answer'] == faq['answer']
+    other = next(c['category'] for c in routes.dense_index.categories()
+                 if retrieval.category_key(c['category']) != retrieval.category_key(faq['category']))
+    response = client.post('/ask', json={'question': faq['question'], 'category': other})
+    assert response.get_json().get('answer') != faq['answer']
+
+
+def test_search_reads_the_records_its_index_was_built_from(routes):
+    records = list(routes.FAQS_DATA)
+    faq = records[-1]
+    try:
+        # What a request sees between FAQS_DATA being replaced and the rebuild
+        routes.FAQS_DATA[:] = records[:1]
+        (found, score), = routes.search_answer(faq['question'])
+        assert found == faq and score >= routes.ANSWER_THRESHOLD
+    finally:
+        routes.FAQS_DATA[:] = records
@@ -0,0 +1,34 @@
+import json
+
+import numpy as np
+
+from app import serialization
+
+
+def test_dumps_is_compact_utf8_and_handles_numpy():
+    data = serialization.dumps({'answer': 'Café', 'score': np.float32(0.5), 'rows': np.arange(3)})
+    assert data == '{"answer":"Café","score":0.5,"rows":[0,1,2]}'.encode('utf-8')
+    assert serialization.loads(data)['rows'] == [0, 1, 2]
+
+
+def test_record_file_is_one_record_per_line(tmp_path):
+    records = [{'question': 'Q1?', 'answer': 'A1'}, {'question': 'Q2?', 'answer': 'Ä2', 'category': 'x'}]
+    path = tmp_path / 'faqs.json'
+    serialization.save_records(str(path), records)
+    lines = path.read_bytes().splitlines()
+    assert lines[0] == b'[' and lines[-1] == b']'
+    assert len(lines) == len(records) + 2
+    assert json.loads(path.read_text(encoding='utf-8')) == records
+    assert serialization.load_file(str(path)) == records
+
+
+def test_empty_record_file(tmp_path):
+    path = tmp_path / 'faqs.json'
+    serialization.save_records(str(path), [])
+    assert serialization.load_file(str(path)) == []
+
+
+def test_jsonify_uses_the_same_encoder(flask_app):
+    with flask_app.app_context():
+        response = flask_app.json.response({'score': np.float32(0.25)})
+    assert json.loads(response.data) == {'score': 0.25}
@@ -0,0 +1,82 @@
+import os
+import signal
+import time
+
+import numpy as np
+import pytest
+
+from app import retrieval, shards
+
+CATEGORIES = ['Fees', 'Library', None, 'Service']
+
+
+@pytest.fixture
+def searcher():
+    searcher = shards.ShardedSearch(2, max_wait_ms=1)
+    yield searcher
+    searcher.close()
+
+
+def make_index(rows=400, dim=16, seed=3):
+    rng = np.random.default_rng(seed)
+    faqs = [{'question': f'q{i}', 'category': CATEGORIES[i % len(CATEGORIES)]} for i in range(rows)]
+    embeddings = rng.normal(size=(rows, dim)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return faqs, embeddings
+
+
+def assert_same(results, expected):
+    assert [idx for idx, _ in results] == [idx for idx, _ in expected]
+    np.testing.assert_allclose([s for _, s in results], [s for _, s in expected], rtol=1e-5)
+
+
+def test_sharded_search_equals_local_search(searcher):
+    faqs, embeddings = make_index()
+    local = retrieval.DenseIndex(faqs, embeddings)
+    sharded = retrieval.DenseIndex(faqs, embeddings)
+    prior = np.linspace(-0.05, 0.05, len(faqs))
+    for index in (local, sharded):
+        index.calibrate(prior)
+    sharded.attach(searcher)
+    rng = np.random.default_rng(9)
+    for _ in range(10):
+        query = rng.normal(size=16).astype(np.float32)
+        for categories in (None, ['Fees'], ['library', 'Service']):
+            assert_same(sharded.search(query, 5, categories), local.search(query, 5, categories))
+    stats = searcher.stats()
+    assert stats['healthy'] and stats['rows'] == len(faqs) and stats['queries'] == 30
+
+
+def test_queries_for_a_replaced_index_are_stale(searcher):
+    faqs, embeddings = make_index()
+    old = searcher.load(embeddings)
+    searcher.load(embeddings[::-1].copy())
+    with pytest.raises(shards.StaleSegment):
+        searcher.search(embeddings[0], 1, None, old.name)
+
+
+def test_dead_shard_falls_back_to_local_search_and_restarts(searcher):
+    faqs, embeddings = make_index()
+    local = retrieval.DenseIndex(faqs, embeddings)
+    sharded = retrieval.DenseIndex(faqs, embeddings)
+    sharded.attach(searcher)
+    os.kill(searcher._pids[0], signal.SIGKILL)
+    deadline = time.monotonic() + 5
+    while shards._alive(searcher._pids[0]) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    query = embeddings[7]
+    assert_same(sharded.search(query, 3), local.search(query, 3))
+    assert searcher.stats()['failures'] == 1
+    deadline = time.monotonic() + 30
+    while searcher.broken and time.monotonic() < deadline:
+        time.sleep(0.05)
+    stats = searcher.stats()
+    assert stats['healthy'] and stats['restarts'] == 1
+    # The new shards were forked by the supervisor, not by this process
+    for pid in searcher._pids:
+        with open(f'/proc/{pid}/stat') as f:
+            assert int(f.read().rsplit(')', 1)[1].split()[1]) == searcher._supervisor.pid
+    # The restarted shards have the index loaded again
+    queries = stats['queries']
+    assert_same(sharded.search(query, 3, ['Fees']), local.search(query, 3, ['Fees']))
+    assert searcher.stats()['queries'] == queries + 1
@@ -0,0 +1,84 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from app import snapshot
+from conftest import HashEncoder
+
+FAQS = [
+    {'question': 'Where is the library?', 'answer': 'Next to the hall.', 'category': 'Service'},
+    {'question': 'How do I pay fees?', 'answer': 'At the bursary.'},
+]
+
+
+class CountingEncoder(HashEncoder):
+    calls = 0
+
+    def encode(self, sentences, **kwargs):
+        CountingEncoder.calls += 1
+        return super().encode(sentences, **kwargs)
+
+
+@pytest.fixture
+def files(tmp_path):
+    faqs_path = tmp_path / 'faqs.json'
+    faqs_path.write_text(json.dumps(FAQS))
+    CountingEncoder.calls = 0
+    return str(tmp_path / 'faqs.snapshot'), str(faqs_path)
+
+
+def test_snapshot_round_trip(files):
+    path, faqs_path = files
+    records, vectors, lexical_index, how = snapshot.load_or_build(path, faqs_path, 'hash', CountingEncoder().encode)
+    assert how == 'rebuilt' and records == FAQS
+    np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1, rtol=1e-6)
+    loaded = snapshot.Snapshot(path)
+    assert loaded.records() == FAQS
+    np.testing.assert_allclose(loaded.vectors(), vectors, rtol=1e-6)
+    assert not loaded.vectors().flags.writeable
+    assert loaded.lexical_index().match('where is the libary')[0] == 0
+
+
+def test_warm_restart_skips_the_encoder(files):
+    path, faqs_path = files
+    snapshot.load_or_build(path, faqs_path, 'hash', CountingEncoder().encode)
+    assert snapshot.load_or_build(path, faqs_path, 'hash', CountingEncoder().encode)[3] == 'snapshot'
+    # Touching faqs.json without changing it only restamps the snapshot
+    os.utime(faqs_path, ns=(1, 1))
+    assert snapshot.load_or_build(path, faqs_path, 'hash', CountingEncoder().encode)[3] == 'restamped'
+    assert CountingEncoder.calls == 1
+
+
+def test_changed_faqs_or_model_rebuild(files):
+    path, faqs_path = files
+    snapshot.load_or_build(path, faqs_path, 'hash', CountingEncoder().encode)
+    assert snapshot.load_or_build(path, faqs_path, 'other-model', CountingEncoder().encode)[3] == 'rebuilt'
+    assert snapshot.Snapshot(path).header['model'] == 'other-model'
+    with open(faqs_path, 'w') as f:
+        json.dump(FAQS[:1], f)
+    records, vectors, _, how = snapshot.load_or_build(path, faqs_path, 'other-model', CountingEncoder().encode)
+    assert how == 'rebuilt' and len(records) == len(vectors) == 1
+
+
+def test_corrupt_snapshot_is_rejected_and_rebuilt(files):
+    path, faqs_path = files
+    snapshot.load_or_build(path, faqs_path, 'hash', CountingEncoder().encode)
+    with open(path, 'r+b') as f:
+        f.seek(-3, os.SEEK_END)
+        f.write(b'\xff\xff\xff')
+    with pytest.raises(snapshot.SnapshotError, match='checksum'):
+        snapshot.Snapshot(path)
+    assert snapshot.load_or_build(path, faqs_path, 'hash', CountingEncoder().encode)[3] == 'rebuilt'
+    snapshot.Snapshot(path)
+
+
+def test_truncated_or_foreign_files_are_rejected(tmp_path):
+    path = tmp_path / 'bad.snapshot'
+    path.write_bytes(b'CUT')
+    with pytest.raises(snapshot.SnapshotError, match='truncated'):
+        snapshot.Snapshot(str(path))
+    path.write_bytes(b'[{"question": "not a snapshot"}]')
+    with pytest.raises(snapshot.SnapshotError, match='not an index snapshot'):
+        snapshot.Snapshot(str(path))
@@ -0,0 +1,137 @@
+import json
+import multiprocessing
+import os
+import stat
+import time
+
+import pytest
+
+from app import storage
+
+
+def test_atomic_write_replaces_the_file_and_keeps_its_mode(tmp_path):
+    path = tmp_path / 'faqs.json'
+    path.write_bytes(b'old')
+    os.chmod(path, 0o640)
+    storage.atomic_write(str(path), b'new')
+    assert path.read_bytes() == b'new'
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+    assert os.listdir(tmp_path) == ['faqs.json']
+
+
+def test_failed_atomic_write_leaves_the_old_file(tmp_path):
+    path = tmp_path / 'faqs.json'
+    path.write_bytes(b'old')
+    with pytest.raises(TypeError):
+        storage.atomic_write(str(path), 'not bytes')
+    assert path.read_bytes() == b'old'
+    assert os.listdir(tmp_path) == ['faqs.json']
+
+
+def test_corrupt_file_falls_back_to_the_newest_backup(tmp_path):
+    path = str(tmp_path / 'faqs.json')
+    storage.save_records(path, [{'question': 'a'}])
+    storage.save_records(path, [{'question': 'b'}])
+    with open(path, 'w') as f:
+        f.write('{"truncated": ')
+    # Each save backs up the version it replaces
+    assert storage.load_records(path) == [{'question': 'a'}]
+    assert len(storage.backups(path)) == 1
+
+
+def test_backups_are_rotated(tmp_path):
+    path = str(tmp_path / 'faqs.json')
+    for i in range(5):
+        storage.save_records(path, [{'question': str(i)}], keep_backups=2)
+    assert len(storage.backups(path)) == 2
+    assert storage.load_records(storage.backups(path)[0]) == [{'question': '3'}]
+
+
+def faq(question, answer='answer'):
+    return {'question': question, 'answer': answer}
+
+
+def test_apply_changes_replays_onto_newer_records():
+    pending = storage.PendingChanges()
+    pending.add([faq('new'), faq('A')])
+    pending.edit(faq('b'), faq('b', 'edited'))
+    pending.delete(faq('c'))
+    pending.edit(faq('gone'), faq('gone', 'restored'))
+    pending.delete(faq('never there'))
+    # Another worker added 'd' in the meantime
+    current = [faq('a'), faq('b'), faq('c'), faq('d')]
+    assert storage.apply_changes(current, pending.take()) == [
+        faq('a'), faq('b', 'edited'), faq('d'), faq('new'), faq('gone', 'restored')]
+    assert not pending.pending()
+
+
+def test_pending_changes_restore_ahead_of_newer_ones():
+    pending = storage.PendingChanges()
+    pending.add([faq('first')])
+    taken = pending.take()
+    pending.add([faq('second')])
+    pending.restore(taken)
+    assert [change[1][0]['question'] for change in pending.pending()] == ['first', 'second']
+
+
+def test_coalescer_merges_a_burst_into_one_write():
+    writes = []
+    writer = storage.WriteCoalescer(lambda: writes.append(1), delay=0.05, max_delay=1.0)
+    for _ in range(10):
+        writer.schedule()
+    assert writer.pending and not writes
+    deadline = time.monotonic() + 5
+    while writer.pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert writes == [1]
+    assert writer.stats()['requests'] == 10 and writer.stats()['writes'] == 1
+
+
+def test_coalescer_without_delay_writes_immediately():
+    writes = []
+    writer = storage.WriteCoalescer(lambda: writes.append(1), delay=0)
+    writer.schedule()
+    writer.schedule()
+    assert writes == [1, 1]
+
+
+def test_coalescer_retries_failed_writes(caplog):
+    attempts = []
+
+    def write():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OSError('disk full')
+
+    writer = storage.WriteCoalescer(write, delay=0.01, retry_delay=0.05)
+    writer.schedule()
+    deadline = time.monotonic() + 5
+    while len(attempts) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(attempts) == 2
+    stats = writer.stats()
+    assert stats['failures'] == 1 and stats['writes'] == 1
+    assert stats['last_error'] == 'OSError: disk full'
+    assert not writer.pending
+    assert 'write failed' in caplog.text
+
+
+def add_questions(path, prefix, count):
+    for i in range(count):
+        changes = [('add', [faq(f'{prefix} {i}')])]
+        storage.update_records(path, lambda current: storage.apply_changes(current, changes), keep_backups=1)
+
+
+def test_concurrent_processes_keep_each_others_changes(tmp_path):
+    path = str(tmp_path / 'faqs.json')
+    storage.save_records(path, [faq('existing')])
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=add_questions, args=(path, name, 25)) for name in ('one', 'two')]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+    with open(path) as f:
+        questions = {record['question'] for record in json.load(f)}
+    assert questions == {'existing'} | {f'{name} {i}' for name in ('one', 'two') for i in range(25)}
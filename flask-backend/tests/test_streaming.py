@@ -0,0 +1,62 @@
+import json
+
+from app import ratelimit, streaming
+
+
+def events(response):
+    parsed = []
+    for block in response.get_data().split(b'\n\n'):
+        if not block or block.startswith(b':'):
+            continue
+        name, data = block.split(b'\n')
+        assert name.startswith(b'event: ') and data.startswith(b'data: ')
+        parsed.append((name[len('event: '):].decode(), json.loads(data[len('data: '):])))
+    return parsed
+
+
+def test_sse_event_format():
+    assert streaming.sse_event('answer', {'a': 1}) == b'event: answer\ndata: {"a":1}\n\n'
+
+
+def test_known_question_streams_answer_then_done(client, routes):
+    faq = routes.FAQS_DATA[0]
+    response = client.post('/ask/stream', json={'question': faq['question']})
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    stream = events(response)
+    names = [name for name, _ in stream]
+    assert names[0] == 'answer' and names[-1] == 'done'
+    assert set(names) <= {'answer', 'related', 'done'}
+    answer = stream[0][1]
+    assert answer['status'] == 200 and answer['answer'] == faq['answer']
+    assert routes.answer_signer.verify(answer['token'], faq['question'], faq['answer'])
+    for name, data in stream:
+        if name == 'related':
+            assert all(item['question'] != faq['question'] for item in data['faqs'])
+
+
+def test_preliminary_guess_comes_before_the_answer(client, routes):
+    faq = routes.FAQS_DATA[0]
+    question = faq['question'].rstrip('?') + ' on public holidays?'
+    stream = events(client.get('/ask/stream', query_string={'question': question}))
+    names = [name for name, _ in stream]
+    assert names[:2] == ['preliminary', 'answer'] and names[-1] == 'done'
+    assert stream[0][1]['answer'] == faq['answer']
+
+
+def test_unanswered_question_in_a_category(client, routes):
+    category = routes.dense_index.categories()[0]['category']
+    stream = events(client.post('/ask/stream', json={'question': 'Qwzx vbnm plokij?', 'category': category}))
+    assert [name for name, _ in stream] == ['answer', 'done']
+    assert stream[0][1]['status'] == 404
+
+
+def test_overload_ends_the_stream(client, routes, monkeypatch):
+    monkeypatch.setattr(routes, 'shedder', ratelimit.LoadShedder(max_inflight=0))
+    stream = events(client.post('/ask/stream', json={'question': 'Are zebras allowed in the quantum lab?'}))
+    assert [name for name, _ in stream] == ['answer', 'done']
+    assert stream[0][1]['status'] == 503
+
+
+def test_stream_rejects_unknown_category(client):
+    assert client.post('/ask/stream', json={'question': 'hi', 'category': 'Nope'}).status_code == 400
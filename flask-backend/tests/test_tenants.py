@@ -0,0 +1,113 @@
+import io
+
+import pytest
+
+from app import tenants
+from conftest import HashEncoder
+
+ENCODER = HashEncoder()
+
+
+def records(name, count=20):
+    return [{'question': f'{name} question number {i}?', 'answer': f'{name} answer {i}.'} for i in range(count)]
+
+
+def encode(texts):
+    encode.calls += 1
+    return ENCODER.encode(texts, normalize_embeddings=True)
+
+
+@pytest.fixture
+def registry(tmp_path):
+    encode.calls = 0
+    registry = tenants.TenantRegistry(str(tmp_path), 'hash', encode, memory_budget=float('inf'))
+    for name in ('alpha', 'beta', 'gamma'):
+        faqs = records(name)
+        registry.add(name, faqs, encode([faq['question'] for faq in faqs]))
+    return registry
+
+
+def resident(registry):
+    return [t['tenant'] for t in registry.stats()['tenants'] if t['resident']]
+
+
+def test_least_recently_used_tenants_are_evicted(registry):
+    size = registry.get('alpha').nbytes
+    registry.memory_budget = size * 2.5
+    registry.switch_model('hash')
+    for name in ('alpha', 'beta', 'gamma'):
+        registry.get(name)
+    assert sorted(resident(registry)) == ['beta', 'gamma']
+    assert registry.resident_bytes() <= registry.memory_budget
+    registry.get('beta')
+    registry.get('alpha')
+    assert sorted(resident(registry)) == ['alpha', 'beta']
+    alpha = next(t for t in registry.stats()['tenants'] if t['tenant'] == 'alpha')
+    # Loaded when created, after the model switch and again after its eviction
+    assert alpha['evictions'] == 1 and alpha['loads'] == 3
+
+
+def test_the_requested_tenant_stays_even_over_budget(registry):
+    registry.memory_budget = 1
+    registry.switch_model('hash')
+    for name in ('alpha', 'beta'):
+        assert registry.get(name).name == name
+    assert resident(registry) == ['beta']
+
+
+def test_reloads_come_from_the_snapshot(registry):
+    calls = encode.calls
+    registry.switch_model('hash')
+    kb = registry.get('alpha')
+    assert kb.loaded_from == 'snapshot' and encode.calls == calls
+    assert kb.fast_answer('alpha question number 3?')['answer'] == 'alpha answer 3.'
+    faq, score = kb.search(ENCODER.encode('alpha question number 3', normalize_embeddings=True))[0]
+    assert faq['answer'] == 'alpha answer 3.'
+
+
+def test_changes_from_another_worker_are_picked_up(registry, tmp_path):
+    other = tenants.TenantRegistry(str(tmp_path), 'hash', encode, memory_budget=float('inf'))
+    extra = [{'question': 'Is there a late fee?', 'answer': 'Yes.'}]
+    other.add('alpha', extra, encode(['Is there a late fee?']))
+    assert len(registry.get('alpha')) == 21
+
+
+def test_workers_adding_to_one_tenant_keep_each_others_faqs(registry, tmp_path):
+    # Two workers that loaded the tenant before either of them added to it
+    first = tenants.KnowledgeBase('alpha', str(tmp_path / 'alpha'), 'hash', encode)
+    second = tenants.KnowledgeBase('alpha', str(tmp_path / 'alpha'), 'hash', encode)
+    first.add([{'question': 'Is there a late fee?', 'answer': 'Yes.'}], encode(['Is there a late fee?']))
+    second.add([{'question': 'Can I pay online?', 'answer': 'No.'}], encode(['Can I pay online?']))
+    assert len(second) == 22 and second.fast_answer('Is there a late fee?')['answer'] == 'Yes.'
+    faq, _ = second.search(ENCODER.encode('Is there a late fee?', normalize_embeddings=True))[0]
+    assert faq['answer'] == 'Yes.'
+    calls = encode.calls
+    reloaded = tenants.KnowledgeBase('alpha', str(tmp_path / 'alpha'), 'hash', encode)
+    assert reloaded.loaded_from == 'snapshot' and encode.calls == calls
+    assert [faq['question'] for faq in reloaded.faqs[-2:]] == ['Is there a late fee?', 'Can I pay online?']
+
+
+def test_unknown_tenants(registry):
+    with pytest.raises(tenants.UnknownTenant):
+        registry.get('delta')
+    with pytest.raises(tenants.UnknownTenant):
+        registry.get('../alpha', create=True)
+    assert registry.names() == ['alpha', 'beta', 'gamma']
+
+
+def test_tenant_endpoints(client, admin, routes):
+    upload = b'question,answer,category\nWhen does the tenant gym open?,At six in the morning.,Sport\n'
+    response = client.post('/admin/import', query_string=dict(admin, tenant='testco'),
+                           data={'file': (io.BytesIO(upload), 'faqs.csv')})
+    assert response.get_json()['added'] == 1
+    response = client.post('/t/testco/ask', json={'question': 'When does the tenant gym open?'})
+    assert response.status_code == 200
+    assert response.get_json()['answer'] == 'At six in the morning.'
+    assert client.get('/t/testco/categories').get_json() == [{'category': 'Sport', 'count': 1}]
+    assert client.post('/t/nobody/ask', json={'question': 'hi'}).status_code == 404
+    assert client.post('/admin/import', query_string=dict(admin, tenant='Bad Name'), data=b'').status_code == 400
+    stats = client.get('/admin/tenants', query_string=admin).get_json()
+    testco = next(t for t in stats['tenants'] if t['tenant'] == 'testco')
+    assert testco['resident'] and testco['answered'] == 1
+    # Tenants don't leak into the main knowledge base
+    assert not any(faq['question'] == 'When does the tenant gym open?' for faq in routes.FAQS_DATA)